@@ -0,0 +1 @@
+"""Offline benchmarks of pyrssw handlers, run with: python -m benchmarks.handlers_benchmark"""
@@ -0,0 +1,310 @@
+"""Offline benchmark of every handler of pyrssw_handlers.
+
+Each handler has a scenario in benchmarks/fixtures/<handler>/: scenario.json describes what is requested and
+the other files are an archive of the recorded upstream responses (see utils.http_replay), served by a
+ReplayAdapter: no network is used.
+Stages are timed separately:
+ - get_feed
+ - arrange: FeedArranger.arrange of the feed
+ - get_content
+ - process: ContentProcessor.process of the content
+ - get_readable_content
+The best duration of each stage is compared to the baselines (benchmarks/baselines.json), the benchmark fails
+when a stage is slower than its baseline by more than the threshold.
+
+Usage:
+    python -m benchmarks.handlers_benchmark [-n iterations] [-t threshold] [-u] [handler ...]
+    python -m benchmarks.handlers_benchmark -r handler     # record again the fixtures of a handler (uses network)
+"""
+
+import getopt
+import json
+import ntpath
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+import requests
+from cryptography.fernet import Fernet
+
+from handlers.content.content_processor import ContentProcessor
+from handlers.feed_type.atom_arranger import AtomArranger
+from handlers.feed_type.rss2_arranger import RSS2Arranger
+from handlers.launcher_handler import USER_AGENT
+from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
+from pyrssw_handlers.handlers_manager import HandlersManager
+from utils.http_client import HTTPSession, http_client
+from utils.http_replay import RecordingAdapter, ReplayAdapter, ReplayArchive
+from utils.scraper_sessions import ScraperSessions
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+BASELINES_FILE = os.path.join(BENCHMARKS_DIR, "baselines.json")
+SCENARIO_FILE = "scenario.json"
+
+SERVING_URL_PREFIX = "http://localhost:8001"
+STAGES = ["get_feed", "arrange", "get_content", "process", "get_readable_content"]
+
+DEFAULT_ITERATIONS = 5
+DEFAULT_THRESHOLD = 0.5  # a stage 50% slower than its baseline is a regression
+MIN_REGRESSION_MS = 5.0  # differences below 5ms are considered as noise
+
+
+class Scenario:
+    """What is requested to a handler during the benchmark"""
+
+    def __init__(self, handler_name: str, path: str) -> None:
+        self.handler_name: str = handler_name
+        self.path: str = path
+        with open(os.path.join(path, SCENARIO_FILE), "r", encoding="utf-8") as f:
+            scenario = json.load(f)
+        self.feed_parameters: Dict[str, str] = scenario.get("feed_parameters", {})
+        self.content_url: str = scenario["content_url"]
+        self.content_parameters: Dict[str, str] = scenario.get("content_parameters", {})
+        self.readable_url: str = scenario.get("readable_url", self.content_url)
+        self.favicon_url: Optional[str] = scenario.get("favicon_url")
+        # stages which can not be run offline, with the reason
+        self.unsupported: Dict[str, str] = scenario.get("unsupported", {})
+
+
+class ScenarioResult:
+    """Durations (in milliseconds) of every stage of a scenario"""
+
+    def __init__(self, handler_name: str) -> None:
+        self.handler_name: str = handler_name
+        self.durations: Dict[str, List[float]] = {}
+        self.errors: Dict[str, str] = {}
+        self.skipped: Dict[str, str] = {}
+
+    def get_best_durations(self) -> Dict[str, float]:
+        """the fastest run of each stage, less sensitive to the load of the machine than the mean or the median"""
+        return {stage: round(min(durations), 3) for stage, durations in self.durations.items()}
+
+
+def load_scenarios(handler_names: Optional[List[str]] = None) -> List[Scenario]:
+    scenarios: List[Scenario] = []
+    for handler_name in sorted(os.listdir(FIXTURES_DIR)):
+        path = os.path.join(FIXTURES_DIR, handler_name)
+        if os.path.isfile(os.path.join(path, SCENARIO_FILE)) and (handler_names is None or handler_name in handler_names):
+            scenarios.append(Scenario(handler_name, path))
+
+    return scenarios
+
+
+def create_session(adapter: requests.adapters.BaseAdapter) -> requests.Session:
+    """Create a session like the launcher does, using the given transport adapter"""
+    session = HTTPSession()
+    session.headers.update({"User-Agent": USER_AGENT})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@contextmanager
+def use_global_transport(adapter: requests.adapters.BaseAdapter) -> Iterator[None]:
+    """Use the adapter for the global client and the scraper sessions, which some handlers use for secondary
+    calls, then restore their transport"""
+    previous = {prefix: http_client.session.get_adapter(prefix) for prefix in ["https://", "http://"]}
+    for prefix in previous:
+        http_client.session.mount(prefix, adapter)
+    ScraperSessions.instance().set_transport_adapter(adapter)
+    try:
+        yield
+    finally:
+        for prefix, previous_adapter in previous.items():
+            http_client.session.mount(prefix, previous_adapter)
+        ScraperSessions.instance().set_transport_adapter(None)
+
+
+def run_scenario(scenario: Scenario, iterations: int = DEFAULT_ITERATIONS) -> ScenarioResult:
+    """Run the scenario against its archive and time every stage"""
+    result = ScenarioResult(scenario.handler_name)
+    archive = ReplayArchive.load(scenario.path)
+    adapter = ReplayAdapter(archive)
+    handler_class: Type[PyRSSWRequestHandler] = HandlersManager.instance().get_handlers()[scenario.handler_name]
+    handler_url_prefix = "%s/%s" % (SERVING_URL_PREFIX, scenario.handler_name)
+    fernet = Fernet(Fernet.generate_key())
+
+    for stage, reason in scenario.unsupported.items():
+        result.skipped[stage] = reason
+
+    with use_global_transport(adapter):
+        # the first iteration warms up imports and caches, it is not timed
+        for iteration in range(iterations + 1):
+            if iteration == 1:
+                result.durations.clear()
+            archive.reset()
+            handler = handler_class(fernet, handler_url_prefix)
+
+            feed = _run_stage(result, "get_feed",
+                              lambda: handler.get_feed(dict(scenario.feed_parameters), create_session(adapter)))
+            if feed is not None:
+                favicon_url = scenario.favicon_url if scenario.favicon_url is not None \
+                    else handler.get_favicon_url(scenario.feed_parameters)
+                _run_stage(result, "arrange", lambda: _arrange(scenario, handler, feed, favicon_url))
+
+            pyrssw_content = _run_stage(result, "get_content", lambda: handler.get_content(
+                scenario.content_url, dict(scenario.content_parameters), create_session(adapter)))
+            if pyrssw_content is not None:
+                _run_stage(result, "process", lambda: ContentProcessor(
+                    handler=handler,
+                    url="/%s?url=%s" % (scenario.handler_name, scenario.content_url),
+                    contents=pyrssw_content.content,
+                    additional_css=pyrssw_content.css,
+                    handler_url_prefix=handler_url_prefix,
+                    parameters=dict(scenario.content_parameters)).process())
+
+            _run_stage(result, "get_readable_content",
+                       lambda: handler.get_readable_content(create_session(adapter), scenario.readable_url))
+
+    return result
+
+
+def _arrange(scenario: Scenario, handler: PyRSSWRequestHandler, feed: str, favicon_url: str) -> Tuple[str, str]:
+    arranger = RSS2Arranger if feed.find("<rss ") > -1 else AtomArranger
+    return arranger(scenario.handler_name, SERVING_URL_PREFIX, "benchmark").arrange(
+        dict(scenario.feed_parameters), feed, "%s/%s/rss" % (SERVING_URL_PREFIX, scenario.handler_name),
+        favicon_url, handler)
+
+
+def _run_stage(result: ScenarioResult, stage: str, func: Callable):
+    value = None
+    if stage not in result.skipped and stage not in result.errors:
+        started = time.perf_counter()
+        try:
+            value = func()
+            result.durations.setdefault(stage, []).append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            result.errors[stage] = "%s: %s" % (type(e).__name__, str(e))
+
+    return value
+
+
+def record_scenario(scenario: Scenario):
+    """Run the scenario once against the real websites and write the archive of the upstream responses"""
+    archive = ReplayArchive()
+    adapter = RecordingAdapter(archive)
+    handler = HandlersManager.instance().get_handlers()[scenario.handler_name](
+        Fernet(Fernet.generate_key()), "%s/%s" % (SERVING_URL_PREFIX, scenario.handler_name))
+    with use_global_transport(adapter):
+        handler.get_feed(dict(scenario.feed_parameters), create_session(adapter))
+        if "get_content" not in scenario.unsupported:
+            handler.get_content(scenario.content_url, dict(scenario.content_parameters), create_session(adapter))
+        if scenario.readable_url != scenario.content_url:
+            handler.get_readable_content(create_session(adapter), scenario.readable_url)
+
+    for file_name in os.listdir(scenario.path):
+        if file_name != SCENARIO_FILE:
+            os.remove(os.path.join(scenario.path, file_name))
+    archive.save(scenario.path)
+
+
+def load_baselines() -> Dict[str, Dict[str, float]]:
+    baselines: Dict[str, Dict[str, float]] = {}
+    if os.path.isfile(BASELINES_FILE):
+        with open(BASELINES_FILE, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    return baselines
+
+
+def save_baselines(baselines: Dict[str, Dict[str, float]]):
+    with open(BASELINES_FILE, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def get_regressions(result: ScenarioResult, baselines: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Returns a message for each stage slower than its baseline by more than the threshold"""
+    regressions: List[str] = []
+    for stage, duration in result.get_best_durations().items():
+        baseline = baselines.get(result.handler_name, {}).get(stage)
+        if baseline is not None and duration > baseline * (1 + threshold) and duration - baseline > MIN_REGRESSION_MS:
+            regressions.append("%s.%s: %.2fms instead of %.2fms (+%d%%)" % (
+                result.handler_name, stage, duration, baseline, round((duration / baseline - 1) * 100)))
+
+    return regressions
+
+
+def print_result(result: ScenarioResult, baselines: Dict[str, Dict[str, float]]):
+    durations = result.get_best_durations()
+    cells: List[str] = []
+    for stage in STAGES:
+        if stage in durations:
+            baseline = baselines.get(result.handler_name, {}).get(stage)
+            cell = "%9.2f" % durations[stage]
+            cell += " (%+4d%%)" % round((durations[stage] / baseline - 1) * 100) if baseline else "        "
+        elif stage in result.errors:
+            cell = "%17s" % "ERROR"
+        else:
+            cell = "%17s" % "-"
+        cells.append(cell)
+    print("%-22s %s" % (result.handler_name, " ".join(cells)))
+
+
+def main(argv: List[str]) -> int:
+    iterations = DEFAULT_ITERATIONS
+    threshold = DEFAULT_THRESHOLD
+    update_baselines = False
+    record = False
+    try:
+        opts, args = getopt.getopt(argv[1:], "hn:t:ur", ["iterations=", "threshold=", "update-baselines", "record"])
+    except getopt.GetoptError:
+        _print_help(argv[0])
+        return 2
+
+    for opt, arg in opts:
+        if opt == "-h":
+            _print_help(argv[0])
+            return 0
+        elif opt in ("-n", "--iterations"):
+            iterations = int(arg)
+        elif opt in ("-t", "--threshold"):
+            threshold = float(arg)
+        elif opt in ("-u", "--update-baselines"):
+            update_baselines = True
+        elif opt in ("-r", "--record"):
+            record = True
+
+    # some handlers keep state in the temporary directory, use an empty one to get stable results
+    tempfile.tempdir = tempfile.mkdtemp(prefix="pyrssw-benchmark-")
+    scenarios = load_scenarios(args if len(args) > 0 else None)
+    if record:
+        for scenario in scenarios:
+            record_scenario(scenario)
+        return 0
+
+    baselines = load_baselines()
+    regressions: List[str] = []
+    errors: List[str] = []
+    print("%-22s %s" % ("handler (ms)", " ".join("%17s" % stage for stage in STAGES)))
+    for scenario in scenarios:
+        result = run_scenario(scenario, iterations)
+        print_result(result, baselines)
+        errors.extend("%s.%s: %s" % (result.handler_name, stage, error) for stage, error in result.errors.items())
+        if update_baselines:
+            baselines[result.handler_name] = result.get_best_durations()
+        else:
+            regressions.extend(get_regressions(result, baselines, threshold))
+
+    if update_baselines:
+        save_baselines(baselines)
+
+    for message in errors:
+        print("ERROR: %s" % message)
+    for message in regressions:
+        print("REGRESSION: %s" % message)
+
+    return 1 if len(errors) + len(regressions) > 0 else 0
+
+
+def _print_help(script_name: str):
+    print(ntpath.basename(script_name) +
+          " [-n <iterations>] [-t <threshold, eg: 0.5>] [-u (update baselines)] [-r (record fixtures)] [handler ...]")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
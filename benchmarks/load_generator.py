@@ -0,0 +1,478 @@
+"""In-process load generator for the pyrssw server, running against stubbed upstream websites.
+
+Upstream websites are replaced by the recorded fixtures of the benchmarks (see handlers_benchmark), replayed by
+the HTTPSession replay transport with an injected latency. A mix of routes is requested:
+ - rss: /<handler>/rss
+ - content: /<handler>?url=<article>
+ - thumbnail: /thumbnails?url=<image>&blur=true
+ - help: the root page
+Two serving modes can be driven:
+ - wsgi: server.pyrssw_wsgi.application is called directly by worker processes (like uWSGI processes),
+   each one running <threads> concurrent requests (uWSGI handles one request at a time without threads=)
+ - http: the python HTTP server (main.py) is started in a process and requested through sockets by <threads>
+   concurrent clients
+Throughput, p50/p95/p99 latencies (overall and per route) and the CPU and memory used by every worker are
+reported. Reports can be written as JSON (-o) and compared with a previous one (-b), configuration properties
+can be overridden (-s) to compare settings, ie: cache configurations.
+
+Usage:
+    python -m benchmarks.load_generator [-m wsgi|http] [-w workers] [-t threads] [-d seconds] [-l latency]
+        [-x mix] [-c config] [-s key=value ...] [-o report.json] [-b baseline.json] [handler ...]
+
+    python -m benchmarks.load_generator -w 8 -t 1 -l 200 -x rss=50,content=50 -o uwsgi-8.json
+    python -m benchmarks.load_generator -w 4 -t 2 -l 200 -x rss=50,content=50 -b uwsgi-8.json
+"""
+
+import getopt
+import http.client
+import json
+import math
+import multiprocessing
+import ntpath
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote_plus, urlencode
+
+from PIL import Image
+
+from benchmarks.handlers_benchmark import load_scenarios
+from config.config import DEFAULT_CONFIG_FILE, SERVER_LISTENING_HOSTNAME_KEY, SERVER_LISTENING_PORT_KEY, Config
+from utils.http_client import HTTPSession, http_client
+from utils.http_replay import (REPLAY_LATENCY_ENV, TRANSPORT_ARCHIVE_ENV, TRANSPORT_MODE_ENV, TRANSPORT_REPLAY,
+                               RecordedExchange, ReplayArchive)
+
+MODE_WSGI = "wsgi"
+MODE_HTTP = "http"
+
+ROUTES = ["rss", "content", "thumbnail", "help"]
+DEFAULT_MIX = "rss=45,content=45,thumbnail=5,help=5"
+DEFAULT_DURATION_S = 10.0
+DEFAULT_LATENCY = "50"  # milliseconds of every upstream call, see http.replay.latency_ms
+
+# routes which can not be served offline
+OFFLINE_UNSUPPORTED_ROUTES: Dict[str, List[str]] = {
+    "genericwrapper": ["rss"]  # favicons are looked up by the favicon library, outside of HTTPSession
+}
+
+THUMBNAIL_URL = "https://img.example.net/loadtest/photo.jpg"
+SERVING_HOST = "127.0.0.1"
+
+
+class WorkerReport:
+    """What a worker measured: latencies per route, errors, CPU and memory"""
+
+    def __init__(self, worker: int) -> None:
+        self.worker: int = worker
+        self.pid: int = os.getpid()
+        self.latencies: Dict[str, List[float]] = {route: [] for route in ROUTES}
+        self.errors: Dict[str, int] = {route: 0 for route in ROUTES}
+        self.elapsed_s: float = 0.0
+        self.cpu_s: float = 0.0
+        self.max_rss_mb: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "worker": self.worker,
+            "pid": self.pid,
+            "latencies": self.latencies,
+            "errors": self.errors,
+            "elapsed_s": self.elapsed_s,
+            "cpu_s": self.cpu_s,
+            "max_rss_mb": self.max_rss_mb
+        }
+
+
+class LoadTest:
+    """Settings of a load test run"""
+
+    def __init__(self, mode: str = MODE_WSGI, workers: int = 1, threads: int = 1,
+                 duration_s: float = DEFAULT_DURATION_S, latency: str = DEFAULT_LATENCY, mix: str = DEFAULT_MIX,
+                 config_file: str = DEFAULT_CONFIG_FILE, settings: Optional[Dict[str, str]] = None,
+                 handler_names: Optional[List[str]] = None) -> None:
+        self.mode: str = mode
+        self.workers: int = workers
+        self.threads: int = threads
+        self.duration_s: float = duration_s
+        self.latency: str = latency
+        self.mix: Dict[str, int] = parse_mix(mix)
+        self.config_file: str = config_file
+        self.settings: Dict[str, str] = settings or {}
+        self.handler_names: Optional[List[str]] = handler_names
+        self.paths: Dict[str, List[str]] = {}
+
+    def get_description(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "threads": self.threads,
+            "duration_s": self.duration_s,
+            "latency": self.latency,
+            "mix": self.mix,
+            "settings": self.settings
+        }
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Parse a routes mix, ie: rss=45,content=45,thumbnail=5,help=5
+
+    Raises:
+        ValueError: if a route is unknown or a weight is not a positive integer
+    """
+    mix: Dict[str, int] = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        if route.strip() not in ROUTES or not weight.strip().isdigit():
+            raise ValueError("Invalid route weight '%s', expected <%s>=<weight>" % (item, "|".join(ROUTES)))
+        mix[route.strip()] = int(weight)
+    if sum(mix.values()) == 0:
+        raise ValueError("The routes mix is empty")
+
+    return mix
+
+
+def prepare(load_test: LoadTest, work_dir: str):
+    """Write the stubbed upstream archive and the configuration used by the workers, and list requested paths"""
+    archive = ReplayArchive()
+    for path, route in [("/", "help"), ("/thumbnails?url=%s&blur=true" % quote_plus(THUMBNAIL_URL), "thumbnail")]:
+        load_test.paths[route] = [path]
+    load_test.paths["rss"] = []
+    load_test.paths["content"] = []
+    for scenario in load_scenarios(load_test.handler_names):
+        for exchange in ReplayArchive.load(scenario.path).get_exchanges():
+            archive.add(exchange)
+        unsupported = OFFLINE_UNSUPPORTED_ROUTES.get(scenario.handler_name, [])
+        if "rss" not in unsupported and "get_feed" not in scenario.unsupported:
+            load_test.paths["rss"].append(_get_path(scenario.handler_name + "/rss", scenario.feed_parameters))
+        if "content" not in unsupported and "get_content" not in scenario.unsupported:
+            load_test.paths["content"].append(_get_path(
+                scenario.handler_name, dict(scenario.content_parameters, url=scenario.content_url)))
+    archive.add(RecordedExchange("GET", THUMBNAIL_URL, 200, {"Content-Type": "image/jpeg"}, _create_image()))
+    archive_path = os.path.join(work_dir, "upstream.zip")
+    archive.save(archive_path)
+
+    os.environ[TRANSPORT_MODE_ENV] = TRANSPORT_REPLAY
+    os.environ[TRANSPORT_ARCHIVE_ENV] = archive_path
+    os.environ[REPLAY_LATENCY_ENV] = load_test.latency
+    # the global client has been created at import time, before the transport was configured
+    http_client.session = HTTPSession()
+
+    # the WSGI application reloads its configuration file for every request: overridden settings are written in it
+    config_file = os.path.join(work_dir, "config.ini")
+    with open(config_file, "w") as f:
+        if os.path.isfile(load_test.config_file):
+            with open(load_test.config_file, "r") as source:
+                f.write(source.read())
+        f.write("\n%s=%s\n%s=0\n" % (SERVER_LISTENING_HOSTNAME_KEY, SERVING_HOST, SERVER_LISTENING_PORT_KEY))
+        for key, value in load_test.settings.items():
+            f.write("%s=%s\n" % (key, value))
+    load_test.config_file = config_file
+    Config.instance().load_config_file(config_file)
+    Config.instance().get_crypto_key()  # generated once, before workers are forked
+
+
+def _get_path(path: str, parameters: Dict[str, str]) -> str:
+    return "/%s%s" % (path, "?" + urlencode(parameters) if len(parameters) > 0 else "")
+
+
+def _create_image() -> bytes:
+    image = Image.new("RGB", (1200, 800))
+    for x in range(0, 1200, 40):
+        image.paste((x % 255, (x * 3) % 255, 120), (x, 0, x + 20, 800))
+    content = BytesIO()
+    image.save(content, format="JPEG", quality=85)
+    return content.getvalue()
+
+
+def run(load_test: LoadTest) -> dict:
+    """Run the load test and returns its report"""
+    prepare(load_test, tempfile.mkdtemp(prefix="pyrssw-load-"))
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    if load_test.mode == MODE_WSGI:
+        processes = [context.Process(target=_run_wsgi_worker, args=(load_test, worker, results))
+                     for worker in range(load_test.workers)]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+    else:
+        port = _get_free_port()
+        ready = context.Event()
+        stop = context.Event()
+        process = context.Process(target=_run_http_server, args=(load_test, port, ready, stop, results))
+        processes = [process]
+        process.start()
+        ready.wait()
+        client_report = _run_clients(load_test, lambda path: _request_http_server(port, path), 0)
+        stop.set()
+        server_report = results.get()
+        client_report["cpu_s"] = server_report["cpu_s"]
+        client_report["max_rss_mb"] = server_report["max_rss_mb"]
+        client_report["pid"] = server_report["pid"]
+        reports = [client_report]
+    for process in processes:
+        process.join()
+
+    # warm up and workers start are not part of the measured period
+    return build_report(load_test, reports, max(report["elapsed_s"] for report in reports))
+
+
+def _run_wsgi_worker(load_test: LoadTest, worker: int, results):
+    from server.pyrssw_wsgi import application  # imported once the transport and configuration are set up
+
+    sys.argv = [sys.argv[0], "-c", load_test.config_file]
+
+    def request(path: str) -> int:
+        status: List[str] = []
+        environ = {"REQUEST_URI": path, "HTTP_HOST": "%s:8001" % SERVING_HOST, "REMOTE_ADDR": SERVING_HOST}
+        body = application(environ, lambda status_line, headers: status.append(status_line))
+        for _ in body:
+            pass
+        return int(status[0].split(" ")[0])
+
+    results.put(_run_clients(load_test, request, worker))
+
+
+def _run_http_server(load_test: LoadTest, port: int, ready, stop, results):
+    from server.pyrssw_server import PyRSSWHTTPServer  # imported once the transport and configuration are set up
+
+    Config.instance().configuration[SERVER_LISTENING_PORT_KEY] = str(port)  # type: ignore
+    server = PyRSSWHTTPServer()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    ready.set()
+    stop.wait()
+    server.shutdown()
+    server.server_close()
+    report = WorkerReport(0)
+    _set_resources_usage(report, usage)
+    results.put(report.to_dict())
+
+
+def _request_http_server(port: int, path: str) -> int:
+    connection = http.client.HTTPConnection(SERVING_HOST, port, timeout=120)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _run_clients(load_test: LoadTest, request, worker: int) -> dict:
+    """Send requests from <threads> threads during the test duration, after a warm up (every path once)"""
+    report = WorkerReport(worker)
+    lock = threading.Lock()
+    for route, paths in load_test.paths.items():
+        if load_test.mix.get(route, 0) > 0:
+            for path in paths:
+                _send(request, path)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.time()
+    deadline = started + load_test.duration_s
+    routes = [route for route in load_test.mix if len(load_test.paths.get(route, [])) > 0]
+    weights = [load_test.mix[route] for route in routes]
+
+    def run_client(seed: int):
+        randomizer = random.Random(seed)
+        while time.time() < deadline:
+            route = randomizer.choices(routes, weights)[0]
+            started = time.perf_counter()
+            ok = _send(request, randomizer.choice(load_test.paths[route]))
+            duration_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                report.latencies[route].append(duration_ms)
+                if not ok:
+                    report.errors[route] += 1
+
+    threads = [threading.Thread(target=run_client, args=(worker * 1000 + idx,)) for idx in range(load_test.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.elapsed_s = time.time() - started
+    _set_resources_usage(report, usage)
+
+    return report.to_dict()
+
+
+def _send(request, path: str) -> bool:
+    try:
+        return request(path) < 400
+    except Exception:
+        return False
+
+
+def _set_resources_usage(report: WorkerReport, initial_usage):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    report.cpu_s = round(usage.ru_utime + usage.ru_stime - initial_usage.ru_utime - initial_usage.ru_stime, 3)
+    report.max_rss_mb = round(usage.ru_maxrss / 1024, 1)  # kilobytes on linux
+
+
+def build_report(load_test: LoadTest, worker_reports: List[dict], elapsed_s: float) -> dict:
+    routes: Dict[str, dict] = {}
+    all_latencies: List[float] = []
+    errors = 0
+    for route in ROUTES:
+        latencies = [latency for report in worker_reports for latency in report["latencies"][route]]
+        route_errors = sum(report["errors"][route] for report in worker_reports)
+        if len(latencies) > 0:
+            routes[route] = dict(get_latency_statistics(latencies), requests=len(latencies), errors=route_errors)
+        all_latencies.extend(latencies)
+        errors += route_errors
+
+    return {
+        "load_test": load_test.get_description(),
+        "elapsed_s": round(elapsed_s, 2),
+        "requests": len(all_latencies),
+        "errors": errors,
+        "throughput_rps": round(len(all_latencies) / elapsed_s, 2) if elapsed_s > 0 else 0,
+        "latency_ms": get_latency_statistics(all_latencies),
+        "routes": routes,
+        "workers": [{
+            "worker": report["worker"],
+            "pid": report["pid"],
+            "requests": sum(len(latencies) for latencies in report["latencies"].values()),
+            "cpu_s": report["cpu_s"],
+            "cpu_percent": round(report["cpu_s"] / elapsed_s * 100, 1) if elapsed_s > 0 else 0,
+            "max_rss_mb": report["max_rss_mb"]
+        } for report in worker_reports]
+    }
+
+
+def get_latency_statistics(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "p50": round(percentile(ordered, 50), 2),
+        "p95": round(percentile(ordered, 95), 2),
+        "p99": round(percentile(ordered, 99), 2),
+        "max": round(ordered[-1], 2) if len(ordered) > 0 else 0.0
+    }
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    value = 0.0
+    if len(ordered) > 0:
+        rank = math.ceil(round(len(ordered) * percent / 100, 6))  # rounded: 7.000000000000001 is rank 7
+        value = ordered[max(0, min(len(ordered) - 1, rank - 1))]
+
+    return value
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    def compare(value: float, path: Tuple[str, ...]) -> str:
+        reference = baseline
+        for key in path:
+            reference = reference.get(key, {}) if isinstance(reference, dict) else None
+        if isinstance(reference, (int, float)) and reference > 0:
+            return "%10.2f (%+4d%%)" % (value, round((value / reference - 1) * 100))
+        return "%10.2f        " % value
+
+    description = report["load_test"]
+    print("mode=%s workers=%d threads=%d duration=%ss upstream latency=%sms mix=%s settings=%s" % (
+        description["mode"], description["workers"], description["threads"], description["duration_s"],
+        description["latency"], ",".join("%s=%d" % item for item in description["mix"].items()),
+        description["settings"]))
+    print("requests: %d, errors: %d, throughput: %s rps" % (
+        report["requests"], report["errors"], compare(report["throughput_rps"], ("throughput_rps",)).strip()))
+    print("%-12s %8s %8s %18s %18s %18s %18s" % ("route", "requests", "errors", "p50 (ms)", "p95 (ms)",
+                                                 "p99 (ms)", "max (ms)"))
+    lines: List[Tuple[str, dict, Tuple[str, ...]]] = [("all", dict(report["latency_ms"], requests=report["requests"],
+                                                                    errors=report["errors"]), ("latency_ms",))]
+    lines.extend((route, statistics, ("routes", route)) for route, statistics in report["routes"].items())
+    for name, statistics, path in lines:
+        print("%-12s %8d %8d %s" % (name, statistics["requests"], statistics["errors"], " ".join(
+            compare(statistics[key], path + (key,)) for key in ["p50", "p95", "p99", "max"])))
+    print("%-12s %8s %8s %10s %10s" % ("worker", "pid", "requests", "cpu (%)", "max rss (MB)"))
+    for worker in report["workers"]:
+        print("%-12d %8d %8d %10.1f %10.1f" % (worker["worker"], worker["pid"], worker["requests"],
+                                               worker["cpu_percent"], worker["max_rss_mb"]))
+
+
+def main(argv: List[str]) -> int:
+    load_test = LoadTest()
+    output_file = ""
+    baseline_file = ""
+    try:
+        opts, args = getopt.getopt(argv[1:], "hm:w:t:d:l:x:c:s:o:b:", [
+            "mode=", "workers=", "threads=", "duration=", "latency=", "mix=", "config=", "set=", "output=",
+            "baseline="])
+        for opt, arg in opts:
+            if opt == "-h":
+                _print_help(argv[0])
+                return 0
+            elif opt in ("-m", "--mode"):
+                if arg not in [MODE_WSGI, MODE_HTTP]:
+                    raise ValueError("Unknown mode '%s'" % arg)
+                load_test.mode = arg
+            elif opt in ("-w", "--workers"):
+                load_test.workers = int(arg)
+            elif opt in ("-t", "--threads"):
+                load_test.threads = int(arg)
+            elif opt in ("-d", "--duration"):
+                load_test.duration_s = float(arg)
+            elif opt in ("-l", "--latency"):
+                load_test.latency = arg
+            elif opt in ("-x", "--mix"):
+                load_test.mix = parse_mix(arg)
+            elif opt in ("-c", "--config"):
+                load_test.config_file = arg
+            elif opt in ("-s", "--set"):
+                key, _, value = arg.partition("=")
+                load_test.settings[key.strip()] = value.strip()
+            elif opt in ("-o", "--output"):
+                output_file = arg
+            elif opt in ("-b", "--baseline"):
+                baseline_file = arg
+    except (getopt.GetoptError, ValueError) as e:
+        print(str(e))
+        _print_help(argv[0])
+        return 2
+
+    if load_test.mode == MODE_HTTP and load_test.workers != 1:
+        print("The python HTTP server runs in a single process, -w is ignored in http mode")
+        load_test.workers = 1
+    load_test.handler_names = args if len(args) > 0 else None
+
+    baseline: Optional[dict] = None
+    if baseline_file != "":
+        with open(baseline_file, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = run(load_test)
+    print_report(report, baseline)
+    if output_file != "":
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    return 0
+
+
+def _get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((SERVING_HOST, 0))
+        return s.getsockname()[1]
+
+
+def _print_help(script_name: str):
+    print(ntpath.basename(script_name) +
+          " [-m wsgi|http] [-w <workers>] [-t <threads per worker>] [-d <duration in seconds>]"
+          " [-l <upstream latency in ms, eg: 50, recorded, www.lemonde.fr=200,*=50>] [-x <mix, eg: %s>]"
+          " [-c <config file>] [-s <key=value>] [-o <report.json>] [-b <baseline report.json>] [handler ...]"
+          % DEFAULT_MIX)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,266 @@
+"""Micro benchmarks of the parsing utilities, run on the pages recorded in benchmarks/fixtures.
+
+Each case times several variants of the same work over every recorded page: the first variant is the
+implementation which has been replaced (or the straightforward one), the following ones are compared to it.
+
+Usage:
+    python -m benchmarks.micro_benchmarks [-n iterations] [case ...]
+"""
+
+import getopt
+import json
+import ntpath
+import os
+import re
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import requests
+from ftfy import fix_text
+from lxml import etree
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from benchmarks.handlers_benchmark import FIXTURES_DIR, SCENARIO_FILE
+from utils.dom_utils import XPathRegistry, compiled_xpath, parse_response
+from utils.embedded_data import EmbeddedData
+from utils.http_replay import ReplayArchive
+from utils.json_utils import JSONIndex, find_nodes_by_name, get_nodes_by_name
+from utils.text_repair import FULL, SELECTIVE, repair_dom
+
+DEFAULT_ITERATIONS = 5
+
+Variant = Tuple[str, Callable[[], object]]
+
+
+def load_pages(content_type: str = "html") -> List[str]:
+    """Bodies of the recorded responses of the given content type"""
+    pages: List[str] = []
+    for handler_name in sorted(os.listdir(FIXTURES_DIR)):
+        path = os.path.join(FIXTURES_DIR, handler_name)
+        if os.path.isfile(os.path.join(path, SCENARIO_FILE)):
+            for exchange in ReplayArchive.load(path).get_exchanges():
+                if content_type in exchange.headers.get("Content-Type", ""):
+                    pages.append(exchange.body.decode("utf-8", "replace"))
+
+    return pages
+
+
+def embedded_data_case(pages: List[str]) -> List[Variant]:
+    """Next.js flight rows and JSON-LD objects of every page"""
+    markers = ["netsportId", "ARTICLE|", "NewsArticle", "VideoObject"]
+
+    def legacy():
+        # each lookup scans and parses the page again, as the handlers did before utils.embedded_data
+        for page in pages:
+            for marker in markers:
+                search_start = 0
+                while page.find("self.__next_f.push", search_start) > -1:
+                    idx = page.find("self.__next_f.push", search_start)
+                    end = page.find("</script>", idx)
+                    block = page[idx:end]
+                    for element in json.loads(block[block.find("["):block.rfind("]") + 1]):
+                        if isinstance(element, str) and marker in element:
+                            json.loads(element.split(":", 1)[1])
+                    search_start = end
+                for script in re.findall(r'<script type="application/ld\+json">(.*?)</script>', page, re.DOTALL):
+                    if marker in script:
+                        json.loads(script, strict=False)
+
+    def extractor():
+        for page in pages:
+            embedded_data = EmbeddedData(page)
+            for marker in markers:
+                embedded_data.get_flight_rows(marker)
+                embedded_data.get_json_ld(marker)
+
+    return [("legacy", legacy), ("extractor", extractor)]
+
+
+def json_index_case(pages: List[str]) -> List[Variant]:
+    """Lookups of several key names in the JSON documents of the pages (Next.js flight rows) and in the recorded
+    JSON responses"""
+    names = ["articles", "children", "data", "url", "title"]
+    texts = load_pages("json")
+    for page in pages:
+        texts.extend(json.dumps(row) for row in EmbeddedData(page).get_flight_rows().values()
+                     if isinstance(row, (dict, list)))
+    documents = [json.loads(text) for text in texts]
+
+    def recursive():
+        for document in documents:
+            for name in names:
+                get_nodes_by_name(document, name)
+
+    def index():
+        for document in documents:
+            json_index = JSONIndex(document)
+            for name in names:
+                json_index.get_nodes_by_name(name)
+
+    def recursive_first():
+        for document in documents:
+            for name in names:
+                get_nodes_by_name(document, name)[:1]
+
+    def streaming_first():
+        # from the text: neither the document nor the values following the first match are parsed
+        for text in texts:
+            for name in names:
+                find_nodes_by_name(text, name, 1)
+
+    return [("recursive", recursive), ("index", index), ("recursive first match", recursive_first),
+            ("streaming first match", streaming_first)]
+
+
+def xpath_case(pages: List[str]) -> List[Variant]:
+    """Cleaning expressions (like the deletion lists of the handlers) evaluated on every page"""
+    expressions = ['//*[@class="comments"]', '//script', '//*[contains(@class, "share")]', '//iframe',
+                   '//*[@id="footer"]', '//aside', '//*[contains(@class, "newsletter")]']
+    doms = [etree.HTML(page) for page in pages if page.strip() != ""]
+
+    def strings():
+        for dom in doms:
+            for expression in expressions:
+                dom.xpath(expression)
+
+    def compiled():
+        for dom in doms:
+            for expression in expressions:
+                compiled_xpath(expression)(dom)
+
+    def union():
+        for dom in doms:
+            XPathRegistry.instance().get_union(expressions)(dom)
+
+    return [("strings", strings), ("compiled", compiled), ("compiled union", union)]
+
+
+def parse_case(pages: List[str]) -> List[Variant]:
+    """Parsing of every recorded feed and page from its response"""
+    responses: List[Tuple[bool, requests.Response]] = []
+    for handler_name in sorted(os.listdir(FIXTURES_DIR)):
+        path = os.path.join(FIXTURES_DIR, handler_name)
+        if os.path.isfile(os.path.join(path, SCENARIO_FILE)):
+            for exchange in ReplayArchive.load(path).get_exchanges():
+                content_type = exchange.headers.get("Content-Type", "")
+                if "xml" in content_type or "html" in content_type:
+                    response = requests.Response()
+                    response.headers = CaseInsensitiveDict(exchange.headers)
+                    response.encoding = get_encoding_from_headers(response.headers)
+                    response._content = exchange.body
+                    responses.append(("html" in content_type, response))
+
+    # bare ampersands of feeds are escaped before parsing, as lequipe does
+    ampersand = re.compile(r"&(?!amp;|lt;|gt;)")
+    ampersand_bytes = re.compile(rb"&(?!amp;|lt;|gt;)")
+
+    def text():
+        # as the handlers did: decode the body (response.text), then encode it again for lxml
+        for html, response in responses:
+            if html:
+                etree.HTML(response.text, parser=None)
+            else:
+                etree.fromstring(ampersand.sub("&amp;", response.text).encode("utf-8"))
+
+    def bytes_first():
+        for html, response in responses:
+            if html:
+                parse_response(response, html=True)
+            else:
+                parse_response(response, content=ampersand_bytes.sub(b"&amp;", response.content))
+
+    return [("text", text), ("bytes", bytes_first)]
+
+
+def text_repair_case(pages: List[str]) -> List[Variant]:
+    """Repair of every page before parsing it, as get_readable_content does (pages without mojibake)"""
+    def full():
+        for page in pages:
+            etree.HTML(fix_text(page), parser=None)
+
+    def selective():
+        for page in pages:
+            repair_dom(etree.HTML(page, parser=None), SELECTIVE)
+
+    def full_dom():
+        for page in pages:
+            repair_dom(etree.HTML(page, parser=None), FULL)
+
+    return [("fix_text", full), ("selective", selective), ("full on texts", full_dom)]
+
+
+def text_repair_mojibake_case(pages: List[str]) -> List[Variant]:
+    """Same as text_repair, on the pages decoded as latin-1 instead of UTF-8"""
+    return text_repair_case([page.encode("utf-8").decode("latin-1") for page in pages])
+
+
+CASES: Dict[str, Callable[[List[str]], List[Variant]]] = {
+    "embedded_data": embedded_data_case,
+    "json_index": json_index_case,
+    "xpath": xpath_case,
+    "parse": parse_case,
+    "text_repair": text_repair_case,
+    "text_repair_mojibake": text_repair_mojibake_case,
+}
+
+
+def time_variant(func: Callable[[], object], iterations: int) -> float:
+    """best duration (in milliseconds) of the iterations, after an untimed warm up"""
+    func()
+    durations: List[float] = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+
+    return min(durations)
+
+
+def measure_peak(func: Callable[[], object]) -> float:
+    """peak of the python allocations (in KiB) during a run, the memory allocated by C libraries (ie: libxml2
+    documents) is not traced"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv: List[str]) -> int:
+    iterations = DEFAULT_ITERATIONS
+    try:
+        opts, args = getopt.getopt(argv[1:], "hn:", ["iterations="])
+    except getopt.GetoptError:
+        _print_help(argv[0])
+        return 2
+
+    for opt, arg in opts:
+        if opt == "-h":
+            _print_help(argv[0])
+            return 0
+        elif opt in ("-n", "--iterations"):
+            iterations = int(arg)
+
+    pages = load_pages()
+    print("%-20s %-24s %12s %10s %12s" % ("case", "variant", "best (ms)", "speedup", "peak (KiB)"))
+    for case_name in args if len(args) > 0 else list(CASES.keys()):
+        reference = 0.0
+        for variant_name, func in CASES[case_name](pages):
+            duration = time_variant(func, iterations)
+            reference = reference or duration
+            print("%-20s %-24s %12.2f %9.1fx %12.1f" % (
+                case_name, variant_name, duration, reference / duration, measure_peak(func)))
+
+    return 0
+
+
+def _print_help(script_name: str):
+    print(ntpath.basename(script_name) + " [-n <iterations>] [case ...]   cases: " + ", ".join(CASES.keys()))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -9,10 +9,17 @@ from utils.singleton import Singleton
 DEFAULT_HOST_NAME = socket.gethostbyaddr(socket.gethostname())[0]
 DEFAULT_PORT_NUMBER = 8111
 
+# duration of a request, lower than the uWSGI harakiri (90 seconds in uwsg.ini)
+DEFAULT_REQUEST_DEADLINE_S = 60
+
 # HTTP Client timeouts
 DEFAULT_HTTP_TIMEOUT = 30  # 30 seconds total timeout
 DEFAULT_HTTP_CONNECT_TIMEOUT = 10  # 10 seconds connection timeout
 
+# Persistent connections of the built-in HTTP server
+DEFAULT_KEEPALIVE_TIMEOUT_S = 15  # idle connections are closed after 15 seconds
+DEFAULT_KEEPALIVE_MAX_REQUESTS = 100
+
 SERVER_LISTENING_HOSTNAME_KEY = "server.listening_hostname"
 SERVER_LISTENING_PORT_KEY = "server.listening_port"
 SERVER_KEYFILE_KEY = "server.keyfile"
@@ -23,6 +30,61 @@ SERVER_SERVING_URL_PREFIX = "server.serving_url_prefix"
 SERVER_CRYPTO_KEY = "server.crypto_key"
 HTTP_TIMEOUT_KEY = "http.timeout"
 HTTP_CONNECT_TIMEOUT_KEY = "http.connect_timeout"
+HTTP_TRACE_ENABLED_KEY = "http.trace.enabled"
+HTTP_TRACE_SLOW_THRESHOLD_KEY = "http.trace.slow_threshold_ms"
+HTTP_TRACE_SLOW_CALLS_KEY = "http.trace.slow_calls"
+HTTP_TRANSPORT_MODE_KEY = "http.transport.mode"
+HTTP_TRANSPORT_ARCHIVE_KEY = "http.transport.archive"
+HTTP_REPLAY_LATENCY_KEY = "http.replay.latency_ms"
+HTTP_SINGLE_FLIGHT_ENABLED_KEY = "http.singleflight.enabled"
+HTTP_CIRCUIT_BREAKER_ENABLED_KEY = "http.circuit_breaker.enabled"
+HTTP_ASYNC_ENABLED_KEY = "http.async.enabled"
+HTTP_HTTP2_HOSTS_KEY = "http.http2.hosts"
+HTTP_HEDGE_HOSTS_KEY = "http.hedge.hosts"
+HTTP_HEDGE_PERCENTILE_KEY = "http.hedge.percentile"
+HTTP_HEDGE_BUDGET_KEY = "http.hedge.budget"
+HTTP_CIRCUIT_BREAKER_FAILURES_KEY = "http.circuit_breaker.failures"
+HTTP_CIRCUIT_BREAKER_OPEN_KEY = "http.circuit_breaker.open_s"
+HTTP_NEGATIVE_CACHE_KEY = "http.negative_cache_s"
+DNS_CACHE_ENABLED_KEY = "dns.cache.enabled"
+DNS_CACHE_TTL_KEY = "dns.cache.ttl_s"
+DNS_CACHE_NEGATIVE_TTL_KEY = "dns.cache.negative_ttl_s"
+DNS_HOSTS_KEY = "dns.hosts"
+SERVER_STALE_CACHE_SIZE_KEY = "server.stale_cache_size"
+SERVER_WORKERS_KEY = "server.workers"
+SERVER_GRACEFUL_TIMEOUT_KEY = "server.graceful_timeout_s"
+SERVER_KEEPALIVE_TIMEOUT_KEY = "server.keepalive_timeout_s"
+SERVER_KEEPALIVE_MAX_REQUESTS_KEY = "server.keepalive_max_requests"
+REQUEST_DEADLINE_KEY = "request.deadline_s"
+SCHEDULING_SLOTS_KEY = "scheduling.slots"
+SCHEDULING_BULK_CLIENTS_KEY = "scheduling.bulk_clients"
+SCHEDULING_RESERVED_KEY = "scheduling.reserved"
+SCHEDULING_QUEUE_KEY = "scheduling.queue"
+SCHEDULING_MAX_WAIT_KEY = "scheduling.max_wait_s"
+SCHEDULING_QUEUE_PER_CLIENT_KEY = "scheduling.queue_per_client"
+RATELIMIT_CLIENT_KEY = "ratelimit.client"
+RATELIMIT_RATE_KEY = "ratelimit.rate_per_min"
+RATELIMIT_BURST_KEY = "ratelimit.burst"
+RATELIMIT_SHARED_DIR_KEY = "ratelimit.shared_dir"
+RATELIMIT_SESSION_IP_FACTOR_KEY = "ratelimit.session_ip_factor"
+CPU_POOL_SIZE_KEY = "cpu_pool.size"
+CPU_POOL_TIMEOUT_KEY = "cpu_pool.timeout_s"
+CPU_POOL_MAX_PENDING_KEY = "cpu_pool.max_pending"
+CPU_POOL_MIN_INPUT_KEY = "cpu_pool.min_input_kb"
+CPU_POOL_MAX_TASKS_KEY = "cpu_pool.max_tasks_per_worker"
+SINGLE_FLIGHT_ENABLED_KEY = "singleflight.enabled"
+SINGLE_FLIGHT_CROSS_PROCESS_DIR_KEY = "singleflight.cross_process_dir"
+SINGLE_FLIGHT_MAX_WAIT_KEY = "singleflight.max_wait_s"
+SCRAPER_POOL_SIZE_KEY = "scraper.pool_size"
+SCRAPER_COOKIES_DIR_KEY = "scraper.cookies_dir"
+TEXT_REPAIR_MODE_KEY = "text_repair.mode"
+AUTH_POOL_SIZE_KEY = "auth.pool_size"
+AUTH_SESSION_MAX_AGE_KEY = "auth.session_max_age_s"
+SERVER_DEBUG_ENDPOINTS_KEY = "server.debug_endpoints"
+PROFILING_SAMPLE_RATE_KEY = "profiling.sample_rate"
+PROFILING_MAX_PROFILES_KEY = "profiling.max_profiles"
+PROFILING_INTERVAL_KEY = "profiling.interval_ms"
+PROFILING_OUTPUT_DIR_KEY = "profiling.output_dir"
 
 
 DEFAULT_CONFIG_FILE = "resources/config.ini"
@@ -48,6 +110,8 @@ class Config:
     def _get_configuration(self) -> Dict[str, str]:
         if self.configuration is None:
             self.load_config_file(DEFAULT_CONFIG_FILE)
+            if self.configuration is None:
+                self.configuration = {}
 
         return cast(Dict[str, str], self.configuration)
 
@@ -56,6 +120,20 @@ class Config:
         config = self._get_configuration()
         return config.get(key, default_value)
 
+    def get_int_property(self, key: str, default_value: int) -> int:
+        value = self.get_property(key, "").strip()
+        return int(value) if value.lstrip("-").isdigit() else default_value
+
+    def get_float_property(self, key: str, default_value: float) -> float:
+        try:
+            return float(self.get_property(key, str(default_value)))
+        except ValueError:
+            return default_value
+
+    def get_bool_property(self, key: str, default_value: bool = False) -> bool:
+        value = self.get_property(key, "").strip().lower()
+        return value in ("true", "1", "yes", "on") if value != "" else default_value
+
     def load_properties(self, sep: str = '=', comment_char: str = '#'):
         # credits: https://stackoverflow.com/questions/3595363/properties-file-in-python-similar-to-java-properties
         self.configuration = {}
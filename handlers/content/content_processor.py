@@ -3,13 +3,23 @@ from lxml import etree
 import urllib.parse as urlparse
 from urllib.parse import unquote
 from handlers.constants import GENERIC_PARAMETERS
+from cryptography.fernet import Fernet
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
+from pyrssw_handlers.handlers_manager import HandlersManager
 from utils.dom_utils import to_string, xpath
 
 TWEETS_REGEX = re.compile(r"(?:(?:https:)?//(twitter|x).com/)(?:.*)/status/([^\?]*)")
 PERCENTAGE_REGEX = re.compile(r"\d+(?:\.\d+)?%")
 
 
+def process_content(module_name: str, crypto_key: bytes, handler_url_prefix: str, url: str, contents: str,
+                    additional_css: str, parameters: dict) -> str:
+    """ContentProcessor.process with picklable arguments, run by the workers of the CPU pool (see utils.cpu_pool)"""
+    handler = HandlersManager.instance().get_handlers()[module_name](Fernet(crypto_key), handler_url_prefix)
+    return ContentProcessor(handler=handler, url=url, contents=contents, additional_css=additional_css,
+                            parameters=parameters, handler_url_prefix=handler_url_prefix).process()
+
+
 class ContentProcessor:
     """Generic processing of article content provided by handlers:
     - add CSS: font, pictures & video dimensions, ...
@@ -85,7 +95,7 @@ class ContentProcessor:
                 imgs.append(img.attrib.get("src"))
 
     def _process_iframes(self, dom: etree._Element):
-        for iframe in dom.xpath("//iframe"):
+        for iframe in xpath(dom, "//iframe"):
             if (
                 "data-tweet-id" not in iframe.attrib
                 and "instagram-media" not in iframe.attrib.get("class", "")
@@ -496,7 +506,7 @@ class ContentProcessor:
             urlp = urlparse.urlparse(
                 self.parameters.get("rssurl", self.parameters.get("url", ""))
             )
-            for o in dom.xpath("//a[@href]"):
+            for o in xpath(dom, "//a[@href]"):
                 if o.attrib.get("href", "").startswith(
                     "%s://%s" % (urlp.scheme, urlp.hostname)
                 ):
@@ -521,7 +531,7 @@ class ContentProcessor:
                 prefix_url = "%s://%s/" % (urlp.scheme, urlp.hostname)
                 break
 
-        for o in dom.xpath("//*[@%s]" % attribute):
+        for o in xpath(dom, "//*[@%s]" % attribute):
             if o.attrib[attribute].startswith("//"):
                 protocol: str = "http:"
                 if prefix_url.find("https") > -1:
@@ -0,0 +1,94 @@
+import json
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from config.config import SERVER_DEBUG_ENDPOINTS_KEY, Config
+from handlers.request_handler import RequestHandler
+from utils.circuit_breaker import CircuitBreakers
+from utils.dns_cache import DNSCache
+from utils.dom_utils import XPathRegistry
+from utils.http_tracing import SLOW_CALLS_EVENT
+from utils.metrics import Metrics
+from utils.profiling import Profiler
+
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+class DebugHandler(RequestHandler):
+    """Debug endpoints, only available when server.debug_endpoints=true in the configuration.
+
+    Handler name: debug
+    Pages:
+     - /debug/metrics: every metric of the worker process
+     - /debug/upstream: upstream calls statistics, circuit breaker state and cached addresses per host and the last
+       slow upstream calls
+     - /debug/xpath: statistics of the compiled XPath expressions cache
+     - /debug/profiles: list of the last profiled requests
+     - /debug/profiles/<id>.pstats: cProfile statistics of a profiled request (to open with pstats, snakeviz, ...)
+     - /debug/profiles/<id>.folded: folded stacks of a profiled request (to open with flamegraph.pl, speedscope, ...)
+    """
+
+    def __init__(self, path: str, source_ip: Optional[str]):
+        super().__init__(source_ip)
+        self.content_type = JSON_CONTENT_TYPE
+
+        page = urlparse(path).path.strip("/")
+        if not Config.instance().get_bool_property(SERVER_DEBUG_ENDPOINTS_KEY):
+            self._not_found()
+        elif page == "metrics":
+            self.contents = json.dumps(Metrics.instance().snapshot(), indent=2)
+        elif page == "upstream":
+            self.contents = json.dumps(self._get_upstream_report(), indent=2)
+        elif page == "xpath":
+            self.contents = json.dumps(XPathRegistry.instance().to_dict(), indent=2)
+        elif page == "profiles":
+            self.contents = json.dumps(
+                [profile.to_dict() for profile in reversed(Profiler.instance().get_profiles())], indent=2)
+        elif page.startswith("profiles/"):
+            self._process_profile(page[len("profiles/"):])
+        else:
+            self._not_found()
+
+    def _not_found(self):
+        self.content_type = "text/plain"
+        self.contents = "Not found"
+        self.set_status(404)
+
+    def _process_profile(self, file_name: str):
+        profile_id, _, extension = file_name.rpartition(".")
+        profile = Profiler.instance().get_profile(profile_id)
+        if profile is None or extension not in ["pstats", "folded"]:
+            self._not_found()
+        elif extension == "pstats":
+            self.content_type = "application/octet-stream"
+            self.contents = profile.pstats  # type: ignore
+        else:
+            self.content_type = "text/plain; charset=utf-8"
+            self.contents = profile.folded
+
+    def _get_upstream_report(self) -> dict:
+        """Group upstream metrics by host"""
+        snapshot = Metrics.instance().snapshot("upstream.")
+        hosts: Dict[str, dict] = {}
+        for name, values in snapshot["histograms"].items():
+            for value in values:
+                host_report = hosts.setdefault(value["labels"].get("host", ""), {})
+                host_report[name[len("upstream."):]] = value["value"]
+
+        for name, values in snapshot["counters"].items():
+            for value in values:
+                host_report = hosts.setdefault(value["labels"].get("host", ""), {})
+                counter = host_report.setdefault(name[len("upstream."):], {})
+                key = "/".join([v for k, v in sorted(value["labels"].items()) if k != "host"])
+                counter[key] = counter.get(key, 0) + value["value"]
+
+        for host, breaker in CircuitBreakers.instance().to_dict().items():
+            hosts.setdefault(host, {})["circuit_breaker"] = breaker
+
+        for host, resolution in DNSCache.instance().to_dict().items():
+            hosts.setdefault(host, {})["dns"] = resolution
+
+        return {
+            "hosts": hosts,
+            "slow_calls": list(reversed(snapshot["events"].get(SLOW_CALLS_EVENT, [])))
+        }
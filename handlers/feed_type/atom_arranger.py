@@ -18,10 +18,10 @@ NAMESPACES = {
 class AtomArranger(FeedArranger):
 
     def get_items(self, dom: etree) -> list:
-        return dom.xpath(".//atom:entry", namespaces=NAMESPACES)
+        return xpath(dom, ".//atom:entry", namespaces=NAMESPACES)
 
     def get_links(self, item) -> list:
-        return item.xpath(".//atom:link", namespaces=NAMESPACES)
+        return xpath(item, ".//atom:link", namespaces=NAMESPACES)
 
     def get_url_from_link(self, link: etree) -> str:
         return link.attrib["href"]
@@ -31,7 +31,7 @@ class AtomArranger(FeedArranger):
         link.text = url
 
     def get_descriptions(self, item) -> list:
-        return item.xpath(".//atom:content", namespaces=NAMESPACES)
+        return xpath(item, ".//atom:content", namespaces=NAMESPACES)
 
     def get_title(self, item: etree._Element) -> Optional[etree._Element]:
         title: Optional[etree._Elements] = None
@@ -52,8 +52,7 @@ class AtomArranger(FeedArranger):
         """
         img_url = ""
         # media:thumbnail tag
-        medias = node.xpath(
-            ".//*[local-name()='thumbnail'][@url]", namespaces=NAMESPACES)
+        medias = xpath(node, ".//*[local-name()='thumbnail'][@url]", namespaces=NAMESPACES)
         if len(medias) > 0:
             img_url = medias[0].get('url')
         return img_url
@@ -65,8 +64,7 @@ class AtomArranger(FeedArranger):
                 cast(str, media.attrib["url"]))
 
     def set_thumbnail_item(self, item: etree._Element, img_url: str):
-        medias = item.xpath(
-            ".//*[local-name()='thumbnail'][@url]", namespaces=NAMESPACES)
+        medias = xpath(item, ".//*[local-name()='thumbnail'][@url]", namespaces=NAMESPACES)
         media: etree._Element
         if len(medias) > 0:
             media = medias[0]
@@ -12,10 +12,10 @@ class RSS2Arranger(FeedArranger):
     """arrange feed by adding some pictures in description, ..."""
 
     def get_items(self, dom: etree) -> list:
-        return dom.xpath("//item")
+        return xpath(dom, "//item")
 
     def get_links(self, item: etree) -> list:
-        return item.xpath(".//link")
+        return xpath(item, ".//link")
 
     def get_url_from_link(self, link: etree) -> str:
         return "" if link.text is None else link.text.strip()
@@ -24,11 +24,11 @@ class RSS2Arranger(FeedArranger):
         link.text = url
 
     def get_descriptions(self, item: etree) -> list:
-        return item.xpath(".//description")
+        return xpath(item, ".//description")
 
     def get_title(self, item: etree._Element) -> Optional[etree._Element]:
         title: Optional[etree._Elements] = None
-        for t in cast(List[etree._Element], item.xpath(".//title")):
+        for t in cast(List[etree._Element], xpath(item, ".//title")):
             title = t
             break
 
@@ -44,9 +44,9 @@ class RSS2Arranger(FeedArranger):
             str -- the url of the image found in enclosure or media:content tag
         """
         img_url = ""
-        enclosures = node.xpath(".//enclosure")
+        enclosures = xpath(node, ".//enclosure")
         # media:content tag
-        medias = node.xpath(".//*[local-name()='content'][@url]")
+        medias = xpath(node, ".//*[local-name()='content'][@url]")
         if len(enclosures) > 0:
             img_url = enclosures[0].get('url')
         elif len(medias) > 0:
@@ -54,16 +54,16 @@ class RSS2Arranger(FeedArranger):
         return img_url
 
     def replace_img_links(self, item: etree._Element, replace_with: str):
-        for enclosure in cast(List[etree._Element], item.xpath(".//enclosure")):
+        for enclosure in cast(List[etree._Element], xpath(item, ".//enclosure")):
             # media:content tag
             enclosure.attrib["url"] = replace_with % enclosure.attrib["url"]
 
-        for media in cast(List[etree._Element], item.xpath(".//*[local-name()='content'][@url]")):
+        for media in cast(List[etree._Element], xpath(item, ".//*[local-name()='content'][@url]")):
             media.attrib["url"] = replace_with % quote_plus(
                 cast(str, media.attrib["url"]))
 
     def set_thumbnail_item(self, item: etree._Element, img_url: str):
-        enclosures = item.xpath(".//enclosure")
+        enclosures = xpath(item, ".//enclosure")
         enclosure: etree._Element
         if len(enclosures) > 0:
             enclosure = enclosures[0]
@@ -1,18 +1,33 @@
-from typing import Dict, Optional, Tuple, Type, cast
+from contextvars import Token
+from typing import Callable, Dict, Optional, Tuple, Type, TypeVar
+import hashlib
+import html
 import traceback
 import urllib.parse as urlparse
 from urllib.parse import parse_qs, unquote_plus
 import requests
 from cryptography.fernet import Fernet, InvalidToken
+from config.config import (DEFAULT_REQUEST_DEADLINE_S, REQUEST_DEADLINE_KEY, SINGLE_FLIGHT_CROSS_PROCESS_DIR_KEY,
+                           SINGLE_FLIGHT_ENABLED_KEY, SINGLE_FLIGHT_MAX_WAIT_KEY, Config)
 from handlers.feed_type.atom_arranger import AtomArranger
+from handlers.feed_type.feed_arranger import FEED_XML_CONTENT_TYPE
 from handlers.feed_type.rss2_arranger import RSS2Arranger
 from handlers.request_handler import RequestHandler
-from handlers.content.content_processor import ContentProcessor
+from handlers.content.content_processor import ContentProcessor, process_content
 from pyrssw_handlers.abstract_pyrssw_request_handler import (
     ENCRYPTED_PREFIX,
     PyRSSWRequestHandler,
 )
-from utils.http_client import HTTPSession
+from utils.async_http_client import is_async_enabled, run_async
+from utils.circuit_breaker import CircuitOpenError, StaleCache
+from utils.cpu_pool import CPUPool
+from utils.http_client import DeadlineExceededError, HTTPSession
+from utils.metrics import Metrics
+from utils.profiling import Profiler
+from utils.request_context import (get_client, get_remaining_time, is_deadline_exceeded, reset_deadline,
+                                   reset_handler_name, set_deadline, set_handler_name)
+from utils.scheduler import OverloadedError, PriorityScheduler
+from utils.single_flight import DEFAULT_MAX_WAIT_S, get_single_flight
 
 HTML_CONTENT_TYPE = "text/html; charset=utf-8"
 USER_AGENT = (
@@ -22,6 +37,21 @@ USER_AGENT = (
 # duration in minutes of a session
 SESSION_DURATION = 30 * 60
 
+T = TypeVar("T")
+
+# returned when the deadline of a request is exceeded and no previous rendering is available
+DEGRADED_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>%s</title><link>%s</link><description>Feed temporarily unavailable</description></channel></rss>"""
+DEGRADED_CONTENT = """<html><body><p>This content could not be loaded in time, please retry later or read the
+<a href="%s">original article</a>.</p><p>%s</p></body></html>"""
+# returned when the worker is too busy to process the request
+OVERLOADED_CONTENT = """<html><body><p>The server is busy, please retry later.</p></body></html>"""
+
+
+def get_render_key(handler_url_prefix: str, url: str, session_id: str) -> str:
+    """Key of the renderings of a handler url in the single flight groups and in the StaleCache"""
+    return hashlib.sha1(("%s %s %s" % (handler_url_prefix, url, session_id)).encode("utf-8")).hexdigest()
+
 
 class LauncherHandler(RequestHandler):
     """Handler which launches custom PyRSSWRequestHandler"""
@@ -42,6 +72,7 @@ class LauncherHandler(RequestHandler):
         self.handler_url_prefix: str = "%s/%s" % (serving_url_prefix, module_name)
         self.url: str = url
         self.module_name: str = module_name
+        self.crypto_key: bytes = crypto_key
         self.fernet: Fernet = Fernet(crypto_key)
         self.session_id: str = session_id
         if module_name in handlers:
@@ -51,37 +82,137 @@ class LauncherHandler(RequestHandler):
             raise Exception("No handler found for name '%s'" % module_name)
 
     def process(self):
-        """process the url"""
+        """process the url, profiling it when sampled or when requested by a crypted profile=true parameter"""
+        reason: str = ""
+        if self._is_profile_requested():
+            reason = "requested"
+        elif Profiler.instance().is_sampled(self.module_name):
+            reason = "sampled"
+
+        if reason != "":
+            Profiler.instance().profile(self.module_name, self.url, reason, self._process)
+        else:
+            self._process()
+
+    def _is_profile_requested(self) -> bool:
+        """profiling is only triggered when the profile parameter is crypted, ie: signed with the server crypto key"""
+        parameters: dict = {}
+        if self.url.find("profile=") > -1:
+            try:
+                _, parameters = self._extract_path_and_parameters(self.url)
+            except Exception:
+                parameters = {}
+
+        return parameters.get("profile", "") == "true" and "profile_crypted" in parameters
+
+    def _process(self):
+        handler_name_token = set_handler_name(self.module_name)
+        deadline_token: Optional[Token] = None
+        parameters: dict = {}
+        is_rss: bool = False
         try:
             path, parameters = self._extract_path_and_parameters(self.url)
-            if path.find("/rss") == 0:
+            is_rss = path.find("/rss") == 0
+            deadline_token = self._set_deadline("rss" if is_rss else "content")
+            self._process_scheduled(is_rss, parameters)
+
+            self.set_status(200)
+
+        except Exception as e:
+            if isinstance(e, OverloadedError):
+                self._set_overloaded_contents(e)
+            # the error may be shared by a coalesced request whose deadline is exceeded
+            elif is_deadline_exceeded() or isinstance(e, DeadlineExceededError):
+                self._set_degraded_contents(is_rss, parameters, e)
+            else:
+                self.contents = """<html>
+                                        <body>
+                                            %s
+                                            <br/>
+                                            %s
+                                            <br/>
+                                            <pre>%s</pre>
+                                        </body>
+                                    </html>""" % (
+                    self.url,
+                    str(e),
+                    traceback.format_exc(),
+                )
+                self.content_type = "text/html; utf-8"
+                self.status = 500
+        finally:
+            if deadline_token is not None:
+                reset_deadline(deadline_token)
+            reset_handler_name(handler_name_token)
+
+    def _set_deadline(self, route: str) -> Optional[Token]:
+        """Set the deadline of the request, configured by request.deadline_s, overridden by
+        request.deadline_s.<route>, request.deadline_s.<handler> and request.deadline_s.<handler>.<route>
+        (route: rss or content, 0: no deadline)"""
+        config = Config.instance()
+        deadline_s = config.get_float_property(REQUEST_DEADLINE_KEY, DEFAULT_REQUEST_DEADLINE_S)
+        for suffix in [route, self.module_name, "%s.%s" % (self.module_name, route)]:
+            deadline_s = config.get_float_property("%s.%s" % (REQUEST_DEADLINE_KEY, suffix), deadline_s)
+
+        return set_deadline(deadline_s) if deadline_s > 0 else None
+
+    def _process_scheduled(self, is_rss: bool, parameters: dict):
+        """Process the request once it gets a slot of the worker (see utils.scheduler), feeds with a previous
+        rendering are served stale when no slot is available right now"""
+        scheduler = PriorityScheduler.instance()
+        priority_class = scheduler.classify(is_rss, self.source_ip)
+        stale = StaleCache.instance().get(self._get_render_key(parameters)) if is_rss else None
+        if stale is None:
+            scheduler.acquire(priority_class, get_remaining_time(), get_client())
+        elif not scheduler.try_acquire(priority_class):
+            self._log("worker busy, stale feed served")
+            scheduler.record_stale(priority_class)
+            self.contents, self.content_type = stale
+            return
+
+        try:
+            if is_rss:
                 self._process_rss(parameters)
             else:
                 self._process_content(self.url, parameters)
+        finally:
+            scheduler.release()
 
-            self.set_status(200)
+    def _set_overloaded_contents(self, error: OverloadedError):
+        self._log("worker busy, request rejected: %s" % str(error))
+        self.contents = OVERLOADED_CONTENT
+        self.content_type = HTML_CONTENT_TYPE
+        self.status = 503
 
-        except Exception as e:
-            self.contents = """<html>
-                                    <body>
-                                        %s
-                                        <br/>
-                                        %s
-                                        <br/>
-                                        <pre>%s</pre>
-                                    </body>
-                                </html>""" % (
-                self.url,
-                str(e),
-                traceback.format_exc(),
-            )
-            self.content_type = "text/html; utf-8"
-            self.status = 500
+    def _set_degraded_contents(self, is_rss: bool, parameters: dict, error: Exception):
+        """The deadline of the request is exceeded: the last rendering or an empty but valid result is returned
+        instead of an error (or of a worker killed by the uWSGI harakiri)"""
+        self._log("deadline exceeded, degraded response returned: %s" % str(error))
+        Metrics.instance().increment("render.degraded", handler=self.module_name)
+        stale = StaleCache.instance().get(self._get_render_key(parameters))
+        if stale is not None:
+            if is_rss:
+                self.contents, self.content_type = stale
+            else:
+                self.contents = stale
+                self.content_type = HTML_CONTENT_TYPE
+        elif is_rss:
+            self.contents = DEGRADED_FEED % (html.escape(self.module_name), html.escape(
+                self.handler.get_original_website()))
+            self.content_type = FEED_XML_CONTENT_TYPE
+        else:
+            url = parameters.get("url", self.handler.get_original_website())
+            self.contents = DEGRADED_CONTENT % (html.escape(url, quote=True), html.escape(url))
+            self.content_type = HTML_CONTENT_TYPE
+        self.status = 200
 
     def _process_content(self, url, parameters: dict):
         self._log("content page requested: %s" % unquote_plus(url))
-        requested_url = url
         self.content_type = HTML_CONTENT_TYPE
+        self.contents = self._render(parameters, lambda: self._get_content(url, parameters))
+
+    def _get_content(self, url, parameters: dict) -> str:
+        requested_url = url
         session: requests.Session = HTTPSession()
         session.headers.update({"User-Agent": USER_AGENT})
 
@@ -94,48 +225,92 @@ class LauncherHandler(RequestHandler):
 
         if "plain" in parameters and parameters["plain"] == "true":
             # return the requested page without any modification
-            self.contents = session.get(requested_url).text
+            contents = session.get(requested_url).text
         else:
-            pyrssw_content = self.handler.get_content(
-                requested_url, parameters, session
-            )
+            if self.handler.has_async_content() and is_async_enabled():
+                pyrssw_content = run_async(lambda async_session: self.handler.get_content_async(
+                    requested_url, parameters, async_session), USER_AGENT)
+            else:
+                pyrssw_content = self.handler.get_content(
+                    requested_url, parameters, session
+                )
+
+            # the handler is only rebuilt from picklable arguments when the task is sent to the pool
+            contents = CPUPool.instance().run(
+                "process_content", process_content, self.module_name, self.crypto_key,
+                self.handler_url_prefix, url, pyrssw_content.content, pyrssw_content.css, parameters,
+                input_size=len(pyrssw_content.content),
+                local=lambda: ContentProcessor(
+                    handler=self.handler, url=url, contents=pyrssw_content.content,
+                    additional_css=pyrssw_content.css, parameters=parameters,
+                    handler_url_prefix=self.handler_url_prefix).process())
 
-            self.contents = ContentProcessor(
-                handler=cast(PyRSSWRequestHandler, self.handler),
-                url=url,
-                contents=pyrssw_content.content,
-                additional_css=pyrssw_content.css,
-                handler_url_prefix=self.handler_url_prefix,
-                parameters=parameters,
-            ).process()
+        return contents
 
     def _process_rss(self, parameters: Dict[str, str]):
         self._log("/rss requested for module '%s' (%s)" % (self.module_name, self.url))
-        session: requests.Session = HTTPSession()
-        session.headers.update({"User-Agent": USER_AGENT})
+        self.contents, self.content_type = self._render(parameters, lambda: self._get_feed(parameters))
 
-        self.contents = self.handler.get_feed(parameters, session)
-        if self.contents.find("<rss ") > -1:
-            self.contents, self.content_type = RSS2Arranger(
+    def _get_feed(self, parameters: Dict[str, str]) -> Tuple[str, str]:
+        if self.handler.has_async_feed() and is_async_enabled():
+            contents = run_async(lambda async_session: self.handler.get_feed_async(parameters, async_session),
+                                 USER_AGENT)
+        else:
+            session: requests.Session = HTTPSession()
+            session.headers.update({"User-Agent": USER_AGENT})
+            contents = self.handler.get_feed(parameters, session)
+        content_type = self.content_type
+        if contents.find("<rss ") > -1:
+            contents, content_type = RSS2Arranger(
                 self.module_name, self.serving_url_prefix, self.session_id
             ).arrange(
                 parameters,
-                self.contents,
+                contents,
                 self.handler_url_prefix + "/rss",
                 self.handler.get_favicon_url(parameters),
                 self.handler,
             )
-        elif self.contents.find("<feed ") > -1:
-            self.contents, self.content_type = AtomArranger(
+        elif contents.find("<feed ") > -1:
+            contents, content_type = AtomArranger(
                 self.module_name, self.serving_url_prefix, self.session_id
             ).arrange(
                 parameters,
-                self.contents,
+                contents,
                 self.handler_url_prefix + "/rss",
                 self.handler.get_favicon_url(parameters),
                 self.handler,
             )
 
+        return contents, content_type
+
+    def _render(self, parameters: dict, func: Callable[[], T]) -> T:
+        """Identical concurrent requests share the same computation (see utils.single_flight).
+        The last rendering is served again when an upstream circuit breaker is open (see utils.circuit_breaker)."""
+        config = Config.instance()
+        key = self._get_render_key(parameters)
+        try:
+            if config.get_bool_property(SINGLE_FLIGHT_ENABLED_KEY, True):
+                result = get_single_flight(
+                    "render", config.get_property(SINGLE_FLIGHT_CROSS_PROCESS_DIR_KEY, ""),
+                    config.get_float_property(SINGLE_FLIGHT_MAX_WAIT_KEY, DEFAULT_MAX_WAIT_S)).do(key, func)
+            else:
+                result = func()
+        except CircuitOpenError as e:
+            stale = StaleCache.instance().get(key)
+            if stale is None:
+                raise
+            self._log("stale content served: %s" % str(e))
+            Metrics.instance().increment("render.stale", handler=self.module_name)
+            return stale
+
+        StaleCache.instance().put(key, result)
+        return result
+
+    def _get_render_key(self, parameters: dict) -> str:
+        # the session id is only rendered in debug mode
+        return get_render_key(self.handler_url_prefix, self.url,
+                              self.session_id if parameters.get("debug", "") == "true" else "")
+
     def _extract_path_and_parameters(self, url: str) -> Tuple[str, dict]:
         """Extract url path and parameters (and decrypt them if they were crypted)
 
@@ -0,0 +1,28 @@
+import math
+from typing import Optional
+
+from handlers.launcher_handler import HTML_CONTENT_TYPE
+from handlers.request_handler import RequestHandler
+
+
+class RateLimitedHandler(RequestHandler):
+    """Answers a request over the rate limit of its client without invoking the handlers: the last rendering of the
+    requested feed or content when available, a 429 response otherwise."""
+
+    def __init__(self, is_rss: bool, stale, retry_after_s: float, session_id: str, source_ip: Optional[str]):
+        super().__init__(source_ip)
+        self.session_id = session_id
+        if stale is not None:
+            self._log("rate limit exceeded, last rendering served")
+            if is_rss:
+                self.contents, self.content_type = stale
+            else:
+                self.contents = stale
+                self.content_type = HTML_CONTENT_TYPE
+        else:
+            retry_after = max(math.ceil(retry_after_s), 1)
+            self._log("rate limit exceeded, retry in %d seconds" % retry_after)
+            self.contents = "Too many requests, retry in %d seconds" % retry_after
+            self.content_type = "text/plain"
+            self.headers["Retry-After"] = str(retry_after)
+            self.set_status(429)
@@ -1,7 +1,7 @@
 import datetime
 import logging
 import re
-from typing import Optional
+from typing import Dict, Optional
 from pyrssw_handlers.abstract_pyrssw_request_handler import ENCRYPTED_PREFIX
 
 
@@ -15,6 +15,7 @@ class RequestHandler():
         self.logger = logging.getLogger()
         self.status: int = 200  # by default
         self.source_ip: Optional[str] = source_ip
+        self.headers: Dict[str, str] = {}  # additional response headers
 
     def _log(self, msg):
         self.logger.info(
@@ -32,3 +33,6 @@ class RequestHandler():
 
     def get_content_type(self) -> str:
         return self.content_type
+
+    def get_headers(self) -> Dict[str, str]:
+        return self.headers
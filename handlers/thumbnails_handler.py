@@ -4,6 +4,7 @@ from typing import Optional
 from urllib.parse import unquote_plus, urlparse, parse_qs
 from PIL import ImageFilter
 from PIL import Image
+from utils.cpu_pool import CPUPool
 from utils.http_client import http_client
 from handlers.request_handler import RequestHandler
 
@@ -47,14 +48,7 @@ class ThumbnailHandler(RequestHandler):
             and parse_qs(parsed.query)["blur"][0] == "true"
         ):
             try:
-                img = Image.open(BytesIO(content))
-                if img.mode != "RGBA":
-                    img = img.convert("RGBA")
-                img = img.resize((128, 128))
-                blurred_image = img.filter(ImageFilter.BoxBlur(10))
-                img_byte_arr = io.BytesIO()
-                blurred_image.save(img_byte_arr, format="PNG")
-                content = img_byte_arr.getvalue()
+                content = CPUPool.instance().run("blur_image", blur_image, content, input_size=len(content))
             except Exception as e:
                 if "url" in parse_qs((parsed.query)) and not try_to_replace_amp:
                     content = self._get_content(path, True)
@@ -65,3 +59,15 @@ class ThumbnailHandler(RequestHandler):
                     )
 
         return content
+
+
+def blur_image(content: bytes) -> bytes:
+    """128x128 blurred PNG of the image, run in the CPU pool (see utils.cpu_pool)"""
+    img = Image.open(BytesIO(content))
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    img = img.resize((128, 128))
+    blurred_image = img.filter(ImageFilter.BoxBlur(10))
+    img_byte_arr = io.BytesIO()
+    blurred_image.save(img_byte_arr, format="PNG")
+    return img_byte_arr.getvalue()
@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
+from server.prefork_server import PreforkServer, get_workers_count, is_prefork_supported
 from server.pyrssw_server import PyRSSWHTTPServer
 import logging
 import os
 import sys
 from utils.arguments import parse_command_line
 from config.config import Config
+from utils.cpu_pool import CPUPool
 
 
 def main(argv):
 
     logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
     Config.instance().load_config_file(parse_command_line(argv))
+    workers = get_workers_count()
+    if workers > 1 and is_prefork_supported():
+        sys.exit(PreforkServer(workers).run())
+    elif workers > 1:
+        logging.getLogger().warning("Multi-process mode is not supported on this platform, a single process is used")
+
     httpd = PyRSSWHTTPServer()
+    CPUPool.instance().start()
 
     logging.getLogger().info("Server Starts - %s serving %s urls",
                              httpd.get_listening_url_prefix(),
@@ -21,6 +30,7 @@ def main(argv):
     except KeyboardInterrupt:
         pass
     httpd.server_close()
+    CPUPool.instance().shutdown()
     logging.getLogger().info("Server Stops")
 
 
@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+import asyncio
 from typing import Dict, List, Optional, cast
 import datetime
 import logging
@@ -8,7 +9,10 @@ import requests
 from lxml import etree
 from cryptography.fernet import Fernet
 from ftfy import fix_text
-from utils.dom_utils import get_first_node, text, to_string, xpath
+from utils.cpu_pool import CPUPool
+from utils.dom_utils import get_declared_charset, get_first_node, get_parser, text, to_string, xpath
+from utils.http_client import HTTPSession
+from utils.text_repair import FULL, get_mode, repair_dom
 from utils.url_utils import is_url_valid
 from utils.readability import Document
 from request.pyrssw_content import PyRSSWContent
@@ -95,6 +99,31 @@ class PyRSSWRequestHandler(metaclass=ABCMeta):
             PyRSSWContent -- the content reworked
         """
 
+    async def get_feed_async(self, parameters: dict, session) -> str:
+        """Async variant of get_feed, with an AsyncHTTPSession (see utils.async_http_client), preferred by the
+        launcher when implemented. By default get_feed is run in a thread executor, with a sync session.
+
+        Arguments:
+            parameters {dict} -- list of parameters
+            session {AsyncHTTPSession} -- the async session provided to process HTTP queries
+
+        Returns:
+            str -- the xml feed
+        """
+        return await asyncio.to_thread(self.get_feed, parameters, _get_sync_session(session))
+
+    async def get_content_async(self, url: str, parameters: dict, session) -> PyRSSWContent:
+        """Async variant of get_content, see get_feed_async"""
+        return await asyncio.to_thread(self.get_content, url, parameters, _get_sync_session(session))
+
+    def has_async_feed(self) -> bool:
+        """True when the handler implements get_feed_async"""
+        return type(self).get_feed_async is not PyRSSWRequestHandler.get_feed_async
+
+    def has_async_content(self) -> bool:
+        """True when the handler implements get_content_async"""
+        return type(self).get_content_async is not PyRSSWRequestHandler.get_content_async
+
     @abstractmethod
     def get_original_website(self) -> str:
         """Returns the original url website
@@ -149,50 +178,77 @@ class PyRSSWRequestHandler(metaclass=ABCMeta):
             try:
                 r = session.get(cast(str, url), headers=headers, verify=False)
 
-                html = fix_text(r.text)
-                if html is not None and html.strip() != "":
-                    dom = etree.HTML(html, parser=None)
-                    url_prefix = url[:len("https://") +
-                                     len(url[len("https://"):].split("/")[0])+1]
-                    noticeable_imgs = _get_noticeable_imgs(dom, url_prefix)
-                    new_html = to_string(dom)
-
-                    doc = Document(new_html.replace("width", "_width_").replace(
-                        "height", "_height_"))
-
-                    if add_source_link:
-                        readable_content += "<hr/><p><u><a href=\"%s\">Source</a></u> : %s</p><hr/>" % (
-                            url, url_prefix)
-
-                    summary = doc.summary(html_partial=True).replace(
-                        "_width_", "width").replace("_height_", "height")
-
-                    if add_title:
-                        readable_content = _complete_with_h1(dom, summary)
-
-                    readable_content += _get_first_noticeable_image(
-                        noticeable_imgs, summary)
-                    readable_content += summary
-                    readable_content += _get_second_and_following_noticeable_images(
-                        noticeable_imgs, summary)
-
-                    # replace relative links
-                    readable_content = readable_content.replace(
-                        'href="/', 'href="' + url_prefix)
-                    readable_content = readable_content.replace(
-                        'src="/', 'src="' + url_prefix)
-                    readable_content = readable_content.replace(
-                        'href=\'/', 'href=\'' + url_prefix)
-                    readable_content = readable_content.replace(
-                        'src=\'/', 'src=\'' + url_prefix)
-                    readable_content = readable_content.replace(
-                        "<noscript>", "").replace("</noscript>", "")
+                mode = get_mode(self.get_handler_name_for_url())
+                readable_content = CPUPool.instance().run(
+                    "readable_content", _build_readable_content, url, r.text if mode == FULL else None, r.content,
+                    get_declared_charset(r), mode, add_source_link, add_title, input_size=len(r.content))
             except Exception as e:
                 readable_content = f"Error getting <i><a href='{url}'>{url}</a></i><br/> <pre>{e}</pre>"
 
         return readable_content
 
 
+def _build_readable_content(url: str, page_text: Optional[str], content: bytes, charset: Optional[str], mode: str,
+                            add_source_link: bool, add_title: bool) -> str:
+    """CPU part of get_readable_content, run in the CPU pool (see utils.cpu_pool): the page is given as text in
+    full text repair mode, as bytes otherwise"""
+    readable_content: str = ""
+    dom = None
+    if mode == FULL:  # the whole page, markup included
+        html = fix_text(page_text)
+        if html is not None and html.strip() != "":
+            dom = etree.HTML(html, parser=None)
+    elif content.strip() != b"":
+        dom = etree.HTML(content, get_parser(True, charset))
+        repair_dom(dom, mode)
+
+    if dom is not None:
+        url_prefix = url[:len("https://") +
+                         len(url[len("https://"):].split("/")[0])+1]
+        noticeable_imgs = _get_noticeable_imgs(dom, url_prefix)
+        new_html = to_string(dom)
+
+        doc = Document(new_html.replace("width", "_width_").replace(
+            "height", "_height_"))
+
+        if add_source_link:
+            readable_content += "<hr/><p><u><a href=\"%s\">Source</a></u> : %s</p><hr/>" % (
+                url, url_prefix)
+
+        summary = doc.summary(html_partial=True).replace(
+            "_width_", "width").replace("_height_", "height")
+
+        if add_title:
+            readable_content = _complete_with_h1(dom, summary)
+
+        readable_content += _get_first_noticeable_image(
+            noticeable_imgs, summary)
+        readable_content += summary
+        readable_content += _get_second_and_following_noticeable_images(
+            noticeable_imgs, summary)
+
+        # replace relative links
+        readable_content = readable_content.replace(
+            'href="/', 'href="' + url_prefix)
+        readable_content = readable_content.replace(
+            'src="/', 'src="' + url_prefix)
+        readable_content = readable_content.replace(
+            'href=\'/', 'href=\'' + url_prefix)
+        readable_content = readable_content.replace(
+            'src=\'/', 'src=\'' + url_prefix)
+        readable_content = readable_content.replace(
+            "<noscript>", "").replace("</noscript>", "")
+
+    return readable_content
+
+
+def _get_sync_session(session) -> requests.Session:
+    """Sync session with the headers of the given async session"""
+    sync_session = HTTPSession()
+    sync_session.headers.update(session.headers)
+    return sync_session
+
+
 def _get_first_noticeable_image(noticeable_imgs: List[str], summary: str) -> str:
     first_noticeable = ""
     if len(noticeable_imgs) > 0 and noticeable_imgs[0] not in summary:
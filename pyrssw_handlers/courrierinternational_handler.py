@@ -4,13 +4,12 @@ import urllib.parse
 import requests
 from lxml import etree
 from request.pyrssw_content import PyRSSWContent
-from pyrssw_handlers.le_monde_handler import URL_CONNECTION, URL_DECONNECTION
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
 import utils.dom_utils
 from utils.dom_utils import to_string
+from utils.authenticated_sessions import AuthenticatedSessions, LoginError
 
 URL_CONNECTION = "https://www.courrierinternational.com/login?destination=%3Cfront%3E"
-URL_DECONNECTION = "https://www.courrierinternational.com/user/logout"
 
 
 class CourrierInternationalHandler(PyRSSWRequestHandler):
@@ -55,44 +54,43 @@ class CourrierInternationalHandler(PyRSSWRequestHandler):
     def get_content(
         self, url: str, parameters: dict, session: requests.Session
     ) -> PyRSSWContent:
-        self._authent(parameters, session)
-        try:
-            page = session.get(url=url)
-            content = page.text.replace(">", ">\n")
-
-            content = re.sub(r'src="data:image[^"]*', "", content)
-            content = content.replace("data-src", "style='height:100%;width:100%' src")
-            dom = etree.HTML(content, parser=None)
-
-            utils.dom_utils.delete_xpaths(
-                dom,
-                [
-                    '//div[contains(@class, "article-metas")]',
-                    '//div[contains(@class,"article-secondary")]',
-                    '//aside[contains(@class,"article-tools")]',
-                    '//aside[contains(@class,"item")]',
-                    '//*[contains(@class,"asset-encadre")]',
-                    '//*[contains(@class,"stories-paywall")]',
-                    '//*[contains(@class,"asset-read-more")]'
-                ],
-            )
+        authenticated_sessions = AuthenticatedSessions.instance()
+        page = authenticated_sessions.get(
+            "courrierinternational", url, parameters, session, self._authent, self._is_logged_out)
+        content = page.text.replace(">", ">\n")
+
+        content = re.sub(r'src="data:image[^"]*', "", content)
+        content = content.replace("data-src", "style='height:100%;width:100%' src")
+        dom = etree.HTML(content, parser=None)
+
+        utils.dom_utils.delete_xpaths(
+            dom,
+            [
+                '//div[contains(@class, "article-metas")]',
+                '//div[contains(@class,"article-secondary")]',
+                '//aside[contains(@class,"article-tools")]',
+                '//aside[contains(@class,"item")]',
+                '//*[contains(@class,"asset-encadre")]',
+                '//*[contains(@class,"stories-paywall")]',
+                '//*[contains(@class,"asset-read-more")]'
+            ],
+        )
 
-            header = utils.dom_utils.get_content(
-                dom, ['//header[@class="article-header"]']
-            )
+        header = utils.dom_utils.get_content(
+            dom, ['//header[@class="article-header"]']
+        )
 
-            body = utils.dom_utils.get_content(dom, [
-                '//div[@class="article-content"]',
-                '//article[contains(@class,"card")]'
-                ])
+        body = utils.dom_utils.get_content(dom, [
+            '//div[@class="article-content"]',
+            '//article[contains(@class,"card")]'
+            ])
 
-            content = header + body
+        content = header + body
 
-            if len(content.replace("\n", "").strip()) < 150:
-                # less than 150 chars, we did not manage to get the content, use readability facility
-                content = super().get_readable_content(session, url)
-        finally:
-            self._unauthent(session)
+        if len(content.replace("\n", "").strip()) < 150:
+            # less than 150 chars, we did not manage to get the content, use readability facility
+            content = super().get_readable_content(
+                authenticated_sessions.get_session("courrierinternational", parameters, session, self._authent), url)
 
         return PyRSSWContent(
             content,
@@ -107,22 +105,31 @@ class CourrierInternationalHandler(PyRSSWRequestHandler):
         )
 
     def _authent(self, parameters: dict, session: requests.Session):
+        """log the session in, drupal sets its session cookie (SESS... or SSESS...) once logged in and renders the
+        login form again when the credentials are refused
+
+        Raises:
+            LoginError: if the login form can not be found or the credentials are refused
+        """
         page = session.get(url=URL_CONNECTION)
-        if "login" in parameters and "password" in parameters:
-            idx = page.text.find('name="form_build_id" value="')
-            if idx > -1:
-                start = page.text[idx + len('name="form_build_id" value="') :]
-                token = start[0 : start.find('"')]
-
-                data = {
-                    "name": parameters["login"],
-                    "pass": parameters["password"],
-                    "form_build_id": token,
-                    "form_id": "user_login_block",
-                    "ci_promo_code_code": "",
-                    "op": "Se connecter",
-                }
-                session.post(url=URL_CONNECTION, data=data, headers={})
+        idx = page.text.find('name="form_build_id" value="')
+        if idx == -1:
+            raise LoginError("courrierinternational login form not found (status %d)" % page.status_code)
+        start = page.text[idx + len('name="form_build_id" value="') :]
+        token = start[0 : start.find('"')]
+
+        data = {
+            "name": parameters["login"],
+            "pass": parameters["password"],
+            "form_build_id": token,
+            "form_id": "user_login_block",
+            "ci_promo_code_code": "",
+            "op": "Se connecter",
+        }
+        response = session.post(url=URL_CONNECTION, data=data, headers={})
+        if response.status_code >= 400 or response.url.startswith(URL_CONNECTION.split("?")[0]) \
+                or not any(cookie.name.startswith(("SESS", "SSESS")) for cookie in session.cookies):
+            raise LoginError("courrierinternational login refused (status %d)" % response.status_code)
 
     def _get_authentification_suffix(self, parameters: dict):
         suffix = ""
@@ -134,5 +141,6 @@ class CourrierInternationalHandler(PyRSSWRequestHandler):
 
         return suffix
 
-    def _unauthent(self, session: requests.Session):
-        session.get(url=URL_DECONNECTION, headers={})
+    def _is_logged_out(self, page: requests.Response) -> bool:
+        """the login page is returned instead of the article when the session is not logged in anymore"""
+        return page.status_code in [401, 403] or page.url.startswith(URL_CONNECTION.split("?")[0])
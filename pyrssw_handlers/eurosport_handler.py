@@ -13,6 +13,7 @@ from lxml import etree
 import utils.dom_utils
 from utils.dom_utils import to_string, xpath
 from utils import json_utils
+from utils.embedded_data import get_embedded_data
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
 
 
@@ -73,48 +74,22 @@ class EurosportHandler(PyRSSWRequestHandler):
 """
         page = session.get(url=self.get_rss_url(), headers={}).text
 
-        # --- Extraction et agrégation des articles depuis tous les blocs self.__next_f.push ---
+        # --- Extraction et agrégation des articles depuis les données Next.js (self.__next_f.push) ---
         articles_data = []
-        search_start = 0
-        while True:
-            idx = page.find("self.__next_f.push", search_start)
-            if idx == -1:
-                break
-            end = page.find("</script>", idx)
-            if end == -1:
-                break
-            next_data = page[idx:end]
-            try:
-                start_json = next_data.find('[')
-                end_json = next_data.rfind(']')
-                if start_json != -1 and end_json != -1:
-                    json_str = next_data[start_json:end_json+1]
-                    arr = json.loads(json_str)
-                    # On cherche la chaîne contenant un JSON imbriqué (avec "netsportId")
-                    nested_json_str = None
-                    for el in arr:
-                        if isinstance(el, str) and "netsportId" in el:
-                            nested_json_str = el
-                            break
-                    if nested_json_str:
-                        # Nettoyage du préfixe éventuel (ex: '6:')
-                        if ':' in nested_json_str and nested_json_str.index(':') < 5:
-                            nested_json_str = nested_json_str.split(':', 1)[1]
-                        nested_json = json.loads(nested_json_str)
-                        # Recherche des articles
-                        entities = json_utils.get_nodes_by_name(nested_json, "articles")
-                        if entities:
-                            for article in entities[0].get("entityState", {}).get("entities", {}).values():
-                                if article.get("_type") == "Article":
-                                    articles_data.append((article, nested_json))
-                else:
-                    logging.getLogger().info("No JSON array found in self.__next_f.push block.")
-            except Exception as e:
-                logging.getLogger().info(f"Unable to parse self.__next_f.push JSON for articles: {e}")
-            search_start = end + 9  # len("</script>")
+        for nested_json in get_embedded_data(page).get_flight_rows("netsportId").values():
+            # Recherche des articles
+            index = json_utils.JSONIndex(nested_json)
+            entities = index.get_nodes_by_name("articles")
+            if entities:
+                pictures = index.query_first("3.children.3.state.pictures.entityState.entities") or {}
+                for article in entities[0].get("entityState", {}).get("entities", {}).values():
+                    if article.get("_type") == "Article":
+                        articles_data.append((article, pictures))
+        if len(articles_data) == 0:
+            logging.getLogger().info("No article found in the self.__next_f.push blocks.")
 
         # --- Génération du flux RSS à partir des articles JSON ---
-        for article, json_data in articles_data:
+        for article, pictures in articles_data:
             title = article.get("title", "")
             url = article.get("url", "")
             pub_date = article.get("publicationTime", "")
@@ -124,7 +99,7 @@ class EurosportHandler(PyRSSWRequestHandler):
             best_url = ""
             best_width = 0
             for pic_id in picture_ids:
-                pic =  json_utils.get_node(json_data, 3, "children", 3, "state", "pictures", "entityState", "entities", pic_id)
+                pic = pictures.get(pic_id)
                 if pic and "formats" in pic:
                     for fmt in pic["formats"].values():
                         if "width" in fmt and fmt["width"] > best_width and "url" in fmt:
@@ -276,34 +251,13 @@ class EurosportHandler(PyRSSWRequestHandler):
 
     def _get_content(self, url: str, session: requests.Session) -> str:
         content = session.get(url, headers=self._get_headers()).text
-        content = content.replace(">", ">\n")
 
         source_article_id = url[url.find("_sto") + len("_sto") : url.rfind("/")]
         eurosport_article_json = {}
-        cpt = 0
-        while True:
-            cpt += 1
-            idx = content.find("self.__next_f.push")
-            if idx > -1:
-                end = content[idx:].find("</script>")
-
-                next_data = content[idx + 1 : idx + end]
-
-                if (
-                    next_data.find(f"ARTICLE|{source_article_id}") > -1
-                ):  # next_f containing the article
-                    next_data = next_data[
-                        next_data.find(":") + 1 : next_data.rfind('"') - 2
-                    ]  # -2 to remove last \n
-                    next_data = next_data.replace('\\\\\\"', '___"')
-                    next_data = next_data.replace('\\"', '"')
-                    next_data = next_data.replace('___"', '\\"')
-                    eurosport_article_json = json.loads(next_data.strip())
-                    break
-
-                content = content[idx + end :]
-            else:
-                break
+        # next_f row containing the article
+        for row in get_embedded_data(content).get_flight_rows(f"ARTICLE|{source_article_id}").values():
+            eurosport_article_json = row
+            break
 
         content = JSONArticleBuilder(
             source_article_id, eurosport_article_json
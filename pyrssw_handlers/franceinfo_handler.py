@@ -1,4 +1,3 @@
-import json
 from typing import Dict
 import re
 
@@ -9,6 +8,7 @@ from request.pyrssw_content import PyRSSWContent
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
 import utils.dom_utils
 from utils.dom_utils import text, to_string, xpath
+from utils.embedded_data import get_embedded_data
 
 
 class FranceInfoHandler(PyRSSWRequestHandler):
@@ -135,7 +135,7 @@ class FranceInfoHandler(PyRSSWRequestHandler):
             ],
         )
 
-        _process_videos(dom)
+        _process_videos(dom, page.text)
         _process_pictures(dom)
 
         content = utils.dom_utils.get_content(
@@ -193,15 +193,12 @@ class FranceInfoHandler(PyRSSWRequestHandler):
         )
 
 
-def _process_videos(dom: etree._Element):
-    json_contents = []
-    for json_content in xpath(dom, '//script[@type="application/ld+json"]'):
-        json_contents.append(json_content.text)
-    if len(json_contents) > 0:
+def _process_videos(dom: etree._Element, page: str):
+    video_objects = get_embedded_data(page).get_json_ld("VideoObject")
+    if len(video_objects) > 0:
         for video in xpath(dom, '//figure[contains(@class,"francetv-player-wrapper")]'):
-            for json_content in json_contents:
-                if json_content.find("VideoObject") > -1:
-                    js = json.loads(json_content, strict=False)
+            for js in video_objects:
+                if isinstance(js, dict):
                     url = js.get("video", {}).get("embedUrl", "")
                     if url.strip() != "":
                         video.tag = "iframe"
@@ -7,8 +7,8 @@ from lxml import etree
 from pyrssw_handlers.abstract_pyrssw_request_handler import \
     PyRSSWRequestHandler
 import favicon
-from ftfy import fix_text
-from utils.dom_utils import to_string, xpath
+from utils.dom_utils import fetch_dom, to_string, xpath
+from utils.text_repair import get_mode, repair_dom
 from utils.http_client import http_client
 
 
@@ -81,16 +81,12 @@ class GenericWrapperHandler(PyRSSWRequestHandler):
     def get_feed(self, parameters: dict, session: requests.Session) -> str:
         feed = ""
         if "rssurl" in parameters:
-            feed = fix_text(session.get(url=parameters["rssurl"], headers={}).text)
-            feed = feed.replace(
-                '<guid isPermaLink="false">', '<link>')  # NOSONAR
-            feed = feed.replace('<guid isPermaLink="true">', '<link>')
-            feed = feed.replace('<guid>',' <link>')
-            feed = feed.replace('</guid>', '</link>')
-
-            #f eed = feed.replace('<?xml version="1.0" encoding="utf-8"?>', '')
-            dom = etree.fromstring(feed.encode("utf-8"))
-            
+            dom = fetch_dom(session, parameters["rssurl"], headers={})
+            repair_dom(dom, get_mode(self.get_handler_name_for_url()))
+            for guid in xpath(dom, "//guid"):
+                guid.tag = "link"
+                guid.attrib.pop("isPermaLink", None)
+
             urlp = urlparse(parameters["rssurl"])
             domain = f"{urlp.scheme}://{urlp.netloc}"
             for item in xpath(dom, "//item"):
@@ -1,15 +1,17 @@
+import contextvars
 import re
 import urllib.parse as urlparse
+from concurrent.futures import Future, ThreadPoolExecutor
 from urllib.parse import parse_qs
 import utils.dom_utils
 from typing import Dict, List, Tuple, cast
 import requests
-import cloudscraper
 from lxml import etree
 import datetime
-import time
 from request.pyrssw_content import PyRSSWContent
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
+from utils.request_context import has_time_left
+from utils.scraper_sessions import ScraperSessions
 
 
 HEADERS = {
@@ -22,7 +24,11 @@ HEADERS = {
     "Pragma": "no-cache",
 }
 
+SCRAPER_BROWSER = {"browser": "firefox", "platform": "windows", "mobile": False}
+
 MAX_NB_PAGES = 11  # maximum number of pages to visit when crawling izismile website
+MIN_TIME_FOR_PAGE_S = 5  # optional pages are only fetched when the request has this time left
+MAX_PARALLEL_PAGES = 4  # number of pages downloaded at the same time when their urls can be predicted
 
 IZISMILE_RSS_URL = "https://feeds2.feedburner.com/izismile"
 IZISPICY_RSS_URL = "https://izispicy.com/rss.xml"
@@ -38,7 +44,8 @@ class IzismileHandler(PyRSSWRequestHandler):
 
 
     Content:
-        Get readable content of the target article content. Gather all pages into one.
+        Get readable content of the target article content. Gather all pages into one, downloaded in parallel
+        when their urls can be predicted from the pager of the first page.
     """
 
     def get_original_website(self) -> str:
@@ -70,10 +77,12 @@ class IzismileHandler(PyRSSWRequestHandler):
             "<link>([^<]*izispicy[^<]*highlights[^<]*)</link>", str(feed)
         )
         for spicy_link in spicy_links:
+            if not has_time_left(MIN_TIME_FOR_PAGE_S):
+                break  # partial feed rather than no feed
             page = session.get(url=spicy_link, headers=HEADERS).text
             dom = etree.HTML(page)
-            for link in dom.xpath("//p/a[contains(@href, 'https://izispicy.com')]"):
-                spans = link.xpath(".//span")
+            for link in utils.dom_utils.xpath(dom, "//p/a[contains(@href, 'https://izispicy.com')]"):
+                spans = utils.dom_utils.xpath(link, ".//span")
                 title = "Izispicy"
                 if len(spans) > 0:
                     title = spans[0].text
@@ -102,22 +111,30 @@ class IzismileHandler(PyRSSWRequestHandler):
             url,
             "%s/page,1,%s" % ("/".join(url.split("/")[:-1]), url.split("/")[-1]),
         ]
-        nb_pages = 1
-        content, url_next_page, comments, cpt_comments = self._get_content(
-            url, session, with_title=True, cpt_comments=1
+        text = self._get_page_from_url(url, session)
+        content, url_next_page, comments, cpt_comments = self._parse_page(
+            text, with_title=True, cpt_comments=1
         )
 
+        predicted_urls = self._get_predicted_urls(url, text, url_next_page)
+        if len(predicted_urls) > 0:
+            next_content, url_next_page, cpt_comments = self._get_pages_in_parallel(
+                predicted_urls, urls, session, cpt_comments
+            )
+            content += next_content
+
+        # serial crawling when urls can not be predicted, or when they did not match the actual next pages
         while (
             url_next_page != ""
-            and nb_pages <= MAX_NB_PAGES
+            and len(urls) - 1 <= MAX_NB_PAGES
             and url_next_page not in urls
+            and has_time_left(MIN_TIME_FOR_PAGE_S)
         ):
             urls.append(url_next_page)
             next_content, url_next_page, _, cpt_comments = self._get_content(
                 url_next_page, session, with_title=False, cpt_comments=cpt_comments
             )
             content += next_content
-            nb_pages += 1
 
         content += comments  # so far comments are the same on every page
 
@@ -143,20 +160,76 @@ class IzismileHandler(PyRSSWRequestHandler):
         """,
         )
 
+    def _get_predicted_urls(self, url: str, text: str, url_next_page: str) -> List[str]:
+        """Urls of the next pages of the article when they follow the <folder>/page,<n>,<name> pattern:
+        the pager of the first page gives the number of pages"""
+        folder, name = "/".join(url.split("/")[:-1]), url.split("/")[-1]
+        page_numbers = [int(number) for number in re.findall(r"/page,(\d+),%s" % re.escape(name), text)]
+        predicted_urls: List[str] = []
+        if url_next_page == "%s/page,2,%s" % (folder, name) and len(page_numbers) > 0:
+            predicted_urls = [
+                "%s/page,%d,%s" % (folder, number, name)
+                for number in range(2, min(max(page_numbers), MAX_NB_PAGES + 1) + 1)
+            ]
+
+        return predicted_urls
+
+    def _get_pages_in_parallel(
+        self,
+        predicted_urls: List[str],
+        urls: List[str],
+        session: requests.Session,
+        cpt_comments: int,
+    ) -> Tuple[str, str, int]:
+        """Download the predicted pages in parallel, each page is cleaned while the next ones are downloaded.
+        Pages are assembled in order, the crawling stops at the first page which is not the expected next page.
+
+        Returns:
+            Tuple[str, str, int]: content of the pages, url of the next page to crawl serially, comments counter
+        """
+        content = ""
+        url_next_page = predicted_urls[0]
+        executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_PAGES)
+        try:
+            # the context is copied so that downloads share the deadline of the request
+            futures: List[Future] = [
+                executor.submit(contextvars.copy_context().run, self._get_page_from_url, predicted_url, session)
+                for predicted_url in predicted_urls
+            ]
+            for predicted_url, future in zip(predicted_urls, futures):
+                if url_next_page != predicted_url or not has_time_left(MIN_TIME_FOR_PAGE_S):
+                    break
+                urls.append(predicted_url)
+                next_content, url_next_page, _, cpt_comments = self._parse_page(
+                    future.result(), with_title=False, cpt_comments=cpt_comments
+                )
+                content += next_content
+        finally:
+            # speculative downloads which are not needed anymore are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return content, url_next_page, cpt_comments
+
     def _get_content(
         self,
         url: str,
         session: requests.Session,
         with_title: bool = False,
         cpt_comments: int = 0,
+    ) -> Tuple[str, str, str, int]:
+        return self._parse_page(
+            self._get_page_from_url(url, session), with_title, cpt_comments
+        )
+
+    def _parse_page(
+        self, text: str, with_title: bool = False, cpt_comments: int = 0
     ) -> Tuple[str, str, str, int]:
         url_next_page = ""
-        text = self._get_page_from_url(url, session)
         dom = etree.HTML(text)
         title = "" if not with_title else utils.dom_utils.get_content(dom, ["//h1"])
         comments = ""
 
-        for a in dom.xpath('//a[contains(@href, "https://izismile.com/outgoing.php")]'):
+        for a in utils.dom_utils.xpath(dom, '//a[contains(@href, "https://izismile.com/outgoing.php")]'):
             parsed = urlparse.urlparse(a.attrib["href"])
             if "url" in parse_qs(parsed.query):
                 return "", parse_qs(parsed.query)["url"][0], "", cpt_comments
@@ -185,22 +258,22 @@ class IzismileHandler(PyRSSWRequestHandler):
             ],
         )
 
-        for script in dom.xpath("//script"):
+        for script in utils.dom_utils.xpath(dom, "//script"):
             script.getparent().remove(script)
 
-        pagers = dom.xpath('//*[@class="postpages"]')
-        if len(pagers) > 1 and len(dom.xpath('//*[@class="postpages"]//a')) > 0:
+        pagers = utils.dom_utils.xpath(dom, '//*[@class="postpages"]')
+        if len(pagers) > 1 and len(utils.dom_utils.xpath(dom, '//*[@class="postpages"]//a')) > 0:
             url_next_page = cast(
-                str, dom.xpath('//*[@class="postpages"]//a')[-1].values()[0]
+                str, utils.dom_utils.xpath(dom, '//*[@class="postpages"]//a')[-1].values()[0]
             )
         for pager in list(pagers):
             pager.getparent().remove(pager)
 
-        pagers = dom.xpath('//*[@id="pagination-nums"]')
+        pagers = utils.dom_utils.xpath(dom, '//*[@id="pagination-nums"]')
         for pager in pagers:
             pager.getparent().remove(pager)
 
-        imgboxs = dom.xpath('//div[@class="imgbox"]')
+        imgboxs = utils.dom_utils.xpath(dom, '//div[@class="imgbox"]')
         # replace <div class="imgbox"> by <p> tags
         cpt = cpt_comments
         for imgbox in imgboxs:
@@ -209,7 +282,7 @@ class IzismileHandler(PyRSSWRequestHandler):
             cpt += 1
             del imgbox.attrib["class"]
 
-        comments_nodes = dom.xpath('//*[@id="dlemasscomments"]')
+        comments_nodes = utils.dom_utils.xpath(dom, '//*[@id="dlemasscomments"]')
         if len(comments_nodes) > 0:
             # isolate comments and then remove them from content
             comments = cast(str, etree.tostring(comments_nodes[0], encoding="unicode"))
@@ -219,7 +292,7 @@ class IzismileHandler(PyRSSWRequestHandler):
             comments = re.sub(r"(#\d+)", '<a href="\\1">\\1</a>', comments)
             utils.dom_utils.delete_xpaths(dom, ['//*[@id="dlemasscomments"]'])
 
-        post_lists = dom.xpath('//*[@id="post-list"]')
+        post_lists = utils.dom_utils.xpath(dom, '//*[@id="post-list"]')
         if len(post_lists) > 0:
             content = etree.tostring(post_lists[0], encoding="unicode")
         else:
@@ -230,14 +303,10 @@ class IzismileHandler(PyRSSWRequestHandler):
         return content, url_next_page, comments, cpt
 
     def _get_page_from_url(self, url, session: requests.Session) -> str:
-        scraper = cloudscraper.create_scraper(
-            delay=10,
-            browser={"browser": "firefox", "platform": "windows", "mobile": False},
-        )
-        text = scraper.get(url, verify=True).text
+        with ScraperSessions.instance().session(url, delay=10, browser=SCRAPER_BROWSER) as scraper:
+            text = scraper.get(url, verify=True).text
 
         if text.find("You do not have access to the site.") > -1:
-            time.sleep(0.1)
             text = session.get(url=url, headers=HEADERS).text
         return text
 
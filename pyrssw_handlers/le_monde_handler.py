@@ -3,6 +3,7 @@ from request.pyrssw_content import PyRSSWContent
 import re
 import urllib.parse
 from utils.url_utils import is_url_valid
+from utils.authenticated_sessions import AuthenticatedSessions, LoginError
 
 import requests
 from lxml import etree
@@ -12,7 +13,6 @@ from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
 from utils.dom_utils import to_string, xpath
 
 URL_CONNECTION = "https://secure.lemonde.fr/sfuser/connexion"
-URL_DECONNECTION = "https://secure.lemonde.fr/sfuser/deconnexion"
 
 STREAMS = {
     "a_la_une": "https://www.lemonde.fr/rss/une.xml",
@@ -49,6 +49,7 @@ class LeMondeHandler(PyRSSWRequestHandler):
          - /lemonde/rss?filter=politique            #only feeds about politique
          - /lemonde/rss?filter=politique,societe    #only feeds about politique and societe
      - login : if you have an account you can use it to fetch full articles available only for subscribers
+       (the logged in session is reused by the following articles, see utils.authenticated_sessions)
      - password : password of your account
 
     Content:
@@ -122,48 +123,45 @@ class LeMondeHandler(PyRSSWRequestHandler):
     def get_content(
         self, url: str, parameters: dict, session: requests.Session
     ) -> PyRSSWContent:
-        self._authent(parameters, session)
-        try:
-            page = session.get(url=url)
-            content = page.text
-
-            dom = etree.HTML(content, parser=None)
-
-            utils.dom_utils.delete_xpaths(
-                dom,
-                [
-                    '//*[contains(@class, "meta__social")]',
-                    '//*[contains(@class, "breadcrumb")]',
-                    '//*[contains(@class, "article__reactions")]',
-                    '//*[contains(@class, "services")]',
-                    '//*[contains(@class, "article__footer-single")]',
-                    '//*[contains(@class, "wp-socializer")]',
-                    '//*[contains(@class, "insert")]',
-                    '//*[@id="comments"]',  # blog
-                    '//*[contains(@class, "post-navigation")]',  # blog
-                    '//*[contains(@class, "entry-footer")]',  # blog
-                    '//*[contains(@class, "catcher")]',  # tribune
-                    "//aside",
-                    '//*[@id="d_overlay"]',
-                ],
-            )
-
-            self.process_pictures(dom)
-            self.process_inread(dom)
-
-            # le monde rss provides many sub websites with different html architecture
-            content = utils.dom_utils.get_content(
-                dom,
-                [
-                    '//*[contains(@class, "zone--article")]',
-                    '//*[contains(@class, "article--content")]',  # tribune
-                    '//*[@id="post-container"]',
-                    '//*[@id="main"]',  # blog
-                ],
-            )
+        page = AuthenticatedSessions.instance().get(
+            "lemonde", url, parameters, session, self._authent, self._is_logged_out)
+        content = page.text
+
+        dom = etree.HTML(content, parser=None)
+
+        utils.dom_utils.delete_xpaths(
+            dom,
+            [
+                '//*[contains(@class, "meta__social")]',
+                '//*[contains(@class, "breadcrumb")]',
+                '//*[contains(@class, "article__reactions")]',
+                '//*[contains(@class, "services")]',
+                '//*[contains(@class, "article__footer-single")]',
+                '//*[contains(@class, "wp-socializer")]',
+                '//*[contains(@class, "insert")]',
+                '//*[@id="comments"]',  # blog
+                '//*[contains(@class, "post-navigation")]',  # blog
+                '//*[contains(@class, "entry-footer")]',  # blog
+                '//*[contains(@class, "catcher")]',  # tribune
+                "//aside",
+                '//*[@id="d_overlay"]',
+            ],
+        )
+
+        self.process_pictures(dom)
+        self.process_inread(dom)
+
+        # le monde rss provides many sub websites with different html architecture
+        content = utils.dom_utils.get_content(
+            dom,
+            [
+                '//*[contains(@class, "zone--article")]',
+                '//*[contains(@class, "article--content")]',  # tribune
+                '//*[@id="post-container"]',
+                '//*[@id="main"]',  # blog
+            ],
+        )
 
-        finally:
-            self._unauthent(session)
         return PyRSSWContent(content)
 
     def process_inread(self, dom):
@@ -181,30 +179,38 @@ class LeMondeHandler(PyRSSWRequestHandler):
                     break
 
     def _authent(self, parameters: dict, session: requests.Session):
+        """log the session in, the login page is returned again when the credentials are refused
+
+        Raises:
+            LoginError: if the login form can not be found or the credentials are refused
+        """
         page = session.get(url=URL_CONNECTION)
-        if "login" in parameters and "password" in parameters:
-            dom = etree.HTML(page.text, parser=None)
-            input_node_key = None
-            for input in xpath(dom, '//input[@type="hidden"]'):
-                if (
-                    input.attrib.get("id", "") not in ["newsletters", "article"]
-                    and len(input.attrib.get("id", "")) > 10
-                ):
-                    input_node_key = input
-                    break
-            if input_node_key is not None:
-                data = {
-                    "email": parameters["login"],
-                    "password": parameters["password"],
-                    "newsletters": "[]",
-                    "article": "",
-                    input_node_key.attrib["id"]: input_node_key.attrib.get("value", ""),
-                }
-                session.post(
-                    url=URL_CONNECTION,
-                    data=data,
-                    headers=self._get_headers(URL_CONNECTION),
-                )
+        dom = etree.HTML(page.text, parser=None)
+        input_node_key = None
+        for input in xpath(dom, '//input[@type="hidden"]'):
+            if (
+                input.attrib.get("id", "") not in ["newsletters", "article"]
+                and len(input.attrib.get("id", "")) > 10
+            ):
+                input_node_key = input
+                break
+        if input_node_key is None:
+            raise LoginError("lemonde login form not found (status %d)" % page.status_code)
+
+        data = {
+            "email": parameters["login"],
+            "password": parameters["password"],
+            "newsletters": "[]",
+            "article": "",
+            input_node_key.attrib["id"]: input_node_key.attrib.get("value", ""),
+        }
+        response = session.post(
+            url=URL_CONNECTION,
+            data=data,
+            headers=self._get_headers(URL_CONNECTION),
+        )
+        if response.status_code >= 400 or response.url.startswith(URL_CONNECTION):
+            raise LoginError("lemonde login refused (status %d)" % response.status_code)
 
     def _get_headers(self, referer):
         return {
@@ -222,6 +228,6 @@ class LeMondeHandler(PyRSSWRequestHandler):
             "Referer": referer,
         }
 
-    def _unauthent(self, session: requests.Session):
-        session.get(url=URL_DECONNECTION, headers=self._get_headers("/"))
-        # session.close()
+    def _is_logged_out(self, page: requests.Response) -> bool:
+        """the login page is returned instead of the article when the session is not logged in anymore"""
+        return page.status_code in [401, 403] or page.url.startswith(URL_CONNECTION)
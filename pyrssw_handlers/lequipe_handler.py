@@ -9,12 +9,16 @@ from lxml import etree
 import json
 import pickle
 import tempfile
-from ftfy import fix_text
 from request.pyrssw_content import PyRSSWContent
 from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
-from utils.dom_utils import delete_xpaths, get_content, get_first_node, text, to_string, xpath
+from utils.dom_utils import (delete_xpaths, fetch_dom, get_content, get_first_node, parse_response, text, to_string,
+                             xpath)
+from utils.embedded_data import get_embedded_data
+from utils.request_context import has_time_left
+from utils.text_repair import get_mode, repair_text
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/103.0.0.0 Safari/537.36"
+MIN_TIME_FOR_ENRICHMENT_S = 5  # homepage articles are only fetched when the request has this time left
 
 
 class LequipeHandler(PyRSSWRequestHandler):
@@ -54,28 +58,26 @@ class LequipeHandler(PyRSSWRequestHandler):
         if parameters.get("filter") in ["Tennis", "Football", "Rugby", "Cyclisme", "Golf", "Basket", "Voile", "Handball", "F1", "Transfert"]:
             # filter only on passed category, eg /lequipe/rss/tennis
             feed = session.get(url=self.get_rss_url() %
-                               ("_"+parameters["filter"]), headers={}).text
+                               ("_"+parameters["filter"]), headers={})
 
-            html = session.get(self.get_original_website(
-            ) + parameters["filter"], headers={}).text
+            html_dom = fetch_dom(session, self.get_original_website() + parameters["filter"], html=True, headers={})
 
         else:
             feed = session.get(url=self.get_rss_url() %
-                               "", headers={}).text
-            html = session.get(self.get_original_website(), headers={}).text
+                               "", headers={})
+            html_dom = fetch_dom(session, self.get_original_website(), html=True, headers={})
 
         blacklisted_keywords = []
         if "blacklist" in parameters:
             blacklisted_keywords = parameters["blacklist"].split(",")
 
-        regex = re.compile(r"&(?!amp;|lt;|gt;)")
-        myxml = regex.sub("&amp;", feed)
-        dom = etree.fromstring(myxml.encode("utf-8"), parser=None)
+        regex = re.compile(rb"&(?!amp;|lt;|gt;)")
+        dom = parse_response(feed, content=regex.sub(b"&amp;", feed.content))
         description_img: str = ""
 
         links = self._process_feed_items(dom, blacklisted_keywords, parameters)
         self._enrich_feed_with_url_homepage(
-            session, html, dom, blacklisted_keywords, links, parameters)
+            session, html_dom, dom, blacklisted_keywords, links, parameters)
 
         feed = to_string(dom)
 
@@ -133,7 +135,7 @@ class LequipeHandler(PyRSSWRequestHandler):
 
 </style>
         """
-        content = fix_text(content)
+        content = repair_text(content, get_mode(self.get_handler_name_for_url()))
         return PyRSSWContent(content, """
             .Image__content {
   padding-top: 0 !important;
@@ -622,10 +624,9 @@ span.Article__publishDate::after {
         with open(self.PREVIOUS_ITEMS_FILE, "wb") as f:
             pickle.dump(previous_items, f)
 
-    def _enrich_feed_with_url_homepage(self, session: requests.Session, html: str, dom: etree._Element, blacklisted_keywords: List[str], links: List[str], parameters: Dict[str, str]):
+    def _enrich_feed_with_url_homepage(self, session: requests.Session, html_dom: etree._Element, dom: etree._Element, blacklisted_keywords: List[str], links: List[str], parameters: Dict[str, str]):
         previous_items = self._get_previous_items()
 
-        html_dom = etree.HTML(html, parser=None)
         channel = xpath(dom, "//channel")[0]
         for article in xpath(html_dom, "//main//article/a"):
             href = cast(str, article.attrib["href"])
@@ -640,6 +641,8 @@ span.Article__publishDate::after {
 
                 if href in previous_items:
                     feed_item = previous_items[href]
+                elif not has_time_left(MIN_TIME_FOR_ENRICHMENT_S):
+                    continue  # homepage articles are optional, the feed is returned without them
                 else:
                     feed_item = self._get_feed_information_from_page(
                         session, href)
@@ -683,15 +686,16 @@ span.Article__publishDate::after {
         img_url = ""
         title_str = ""
 
-        content = session.get(url).text
+        page = session.get(url)
+        content = page.content
 
-        date_published_idx = content.find('datePublished": "')
+        date_published_idx = content.find(b'datePublished": "')
         if date_published_idx > -1:
             start_idx = date_published_idx + len('datePublished": "')
             pub_date_str = content[start_idx:start_idx +
-                                   len("YYYY-mm-ddTHH:MM:SS+zz:zz")]
+                                   len("YYYY-mm-ddTHH:MM:SS+zz:zz")].decode("ascii", "replace")
 
-        dom = etree.HTML(content, parser=None)
+        dom = parse_response(page, html=True)
 
         description_node = get_first_node(
             dom, ['//h2[contains(@class,"Article__chapo")]'])
@@ -758,8 +762,9 @@ def _move_header_img(dom: etree._Element):
 
 def _parse_article_object(dom: etree._Element, content: str) -> str:
     json_content = ""
-    if content.find("articleObject:") > -1 and content.find('class="Article__paywall"') > -1:
-        json_str = content.split("articleObject:")[1].split(
+    scripts = get_embedded_data(content).get_scripts("articleObject:")
+    if len(scripts) > 0 and content.find('class="Article__paywall"') > -1:
+        json_str = scripts[0].text.split("articleObject:")[1].split(
             ',articleType')[0].replace("\\u002F", "/")
         # u rl_nuxt = content.split('comment_count_url:"')[1].split('",')[0].replace("\\u002F", "/")
         json_str = re.sub(
@@ -1,4 +1,3 @@
-import json
 from typing import Dict, List, cast
 from handlers.feed_type.atom_arranger import NAMESPACES
 from handlers.launcher_handler import USER_AGENT
@@ -14,6 +13,7 @@ import utils.dom_utils
 from pyrssw_handlers.abstract_pyrssw_request_handler import \
     PyRSSWRequestHandler
 from utils.dom_utils import get_content, to_string, xpath
+from utils.embedded_data import get_embedded_data
 
 FILTERS = {
     "A la Une": "alaune",
@@ -176,13 +176,9 @@ figcaption {
 
 def _process_paywall_json(content: str, dom: etree._Element) -> str:
     found_content: str = ""
-    FUSION_MARKER = "Fusion.globalContent="
-    start_idx = content.find(FUSION_MARKER)
-    if start_idx > -1:
-        end_idx = content[start_idx+len(FUSION_MARKER):].find("};Fusion")
-        json_str = content[start_idx +
-                           len(FUSION_MARKER):start_idx+len(FUSION_MARKER)+end_idx+1]
-        json_content = json.loads(json_str)
+    embedded_data = get_embedded_data(content)
+    json_content = embedded_data.get_assigned_json("Fusion.globalContent")
+    if isinstance(json_content, dict):
 
         found_content = "<h1>%s</h1>" % json_content.get(
             "headlines", {}).get("basic", "")
@@ -207,12 +203,11 @@ def _process_paywall_json(content: str, dom: etree._Element) -> str:
 
     else:
         # this is working, but we miss pictures + paragraph formatting.
-        for script in xpath(dom, "//script"):
-            if script.attrib.get("type", "") == "application/ld+json" and script.text[0:1] == "{":
-                json_content = json.loads(script.text)
-                if json_content.get("@type", "") == "NewsArticle" and "articlebody" in json_content:
-                    found_content = json_content.get("articlebody")
-                    break
+        for json_content in embedded_data.get_json_ld("NewsArticle"):
+            if isinstance(json_content, dict) and json_content.get("@type", "") == "NewsArticle" \
+                    and "articlebody" in json_content:
+                found_content = json_content.get("articlebody")
+                break
 
     return found_content
 
@@ -10,8 +10,8 @@ from requests import cookies, Session
 from lxml import etree
 from pyrssw_handlers.abstract_pyrssw_request_handler import \
     PyRSSWRequestHandler
-from utils.dom_utils import get_content, to_string, xpath, get_first_node
-from utils.json_utils import get_node, get_node_value_if_exists
+from utils.dom_utils import fetch_dom, get_content, to_string, xpath, get_first_node
+from utils.json_utils import get_node, get_node_value_if_exists, query_nodes
 
 NAMESPACES = {
     "atom": "http://www.w3.org/2005/Atom",
@@ -61,9 +61,7 @@ class RedditHandler(PyRSSWRequestHandler):
         if "sub" in parameters:
             rss_url = "https://www.reddit.com/r/%s/.rss" % parameters["sub"]
 
-        feed = session.get(url=rss_url, headers={}).text
-
-        dom = etree.fromstring(feed.encode("utf-8"))
+        dom = fetch_dom(session, rss_url, headers={})
 
         logo_node = get_first_node(dom, ["//atom:logo"], namespaces=NAMESPACES)
         logo = ""
@@ -207,19 +205,11 @@ class RedditHandler(PyRSSWRequestHandler):
     def _get_datatypes_json(self, data: dict, ttype: str) -> List[dict]:
         datatype_json: List[dict] = []
 
-        def _append_datatype(nodes):
-            if nodes is not None:
-                for node in nodes:
-                    if "kind" in node and node["kind"] == ttype and "data" in node:
-                        datatype_json.append(node["data"])
-
-        if isinstance(data, dict) and "data" in data:
-            nodes = get_node(data["data"], "children")
-            _append_datatype(nodes)
-        elif len(data) > 0:
-            for d in data:
-                nodes = get_node(d, "data", "children")
-                _append_datatype(nodes)
+        # a listing, or a list of listings (post and its comments)
+        path = "data.children.*" if isinstance(data, dict) else "*.data.children.*"
+        for node in query_nodes(data, path):
+            if isinstance(node, dict) and node.get("kind") == ttype and "data" in node:
+                datatype_json.append(node["data"])
 
         return datatype_json
 
@@ -7,7 +7,8 @@ from urllib.parse import unquote_plus
 
 from cryptography.fernet import Fernet
 
-from config.config import Config
+from config.config import (DEFAULT_KEEPALIVE_MAX_REQUESTS, DEFAULT_KEEPALIVE_TIMEOUT_S,
+                           SERVER_KEEPALIVE_MAX_REQUESTS_KEY, SERVER_KEEPALIVE_TIMEOUT_KEY, Config)
 from handlers.launcher_handler import ENCRYPTED_PREFIX, SESSION_DURATION
 from handlers.request_handler import RequestHandler
 from server.abstract_pyrssw_server import AbstractPyRSSWHTTPServer
@@ -18,10 +19,31 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
     """Handle every HTTP request.
     Find out which Handler has to be provided to process it.
     Handle http basic auth.
+    Connections are persistent (HTTP/1.1): they are closed after server.keepalive_timeout_s seconds without request
+    or after server.keepalive_max_requests requests.
     """
 
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        config = Config.instance()
+        self.timeout = config.get_float_property(SERVER_KEEPALIVE_TIMEOUT_KEY, DEFAULT_KEEPALIVE_TIMEOUT_S)
+        self.max_requests: int = config.get_int_property(SERVER_KEEPALIVE_MAX_REQUESTS_KEY,
+                                                         DEFAULT_KEEPALIVE_MAX_REQUESTS)
+        self.requests_count: int = 0
+        super().setup()
+
+    def end_headers(self):
+        self.requests_count += 1
+        if self.requests_count >= self.max_requests:
+            self.send_header("Connection", "close")
+        elif not self.close_connection:
+            self.send_header("Keep-Alive", "timeout=%d, max=%d" % (
+                self.timeout, self.max_requests - self.requests_count))
+        super().end_headers()
+
     def do_HEAD(self):
-        return
+        self.close_connection = True  # not supported: the connection is closed without response
 
     def do_POST(self):
         # <--- Gets the size of data
@@ -30,13 +52,15 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         post_data = self.rfile.read(content_length)
         logging.info("POST request,\nPath: %s\nHeaders:\n%s\n\nBody:\n%s\n",
                      str(self.path), str(self.headers), post_data.decode('utf-8'))
+        HandlersManager.instance().get_handlers()
+        fernet = Fernet(Config.instance().get_crypto_key())
+        content = ("Crypted field: %s" % fernet.encrypt(unquote_plus(
+            post_data.decode("utf-8")).split("=")[1].encode("utf-8")).decode("utf-8")).encode("utf-8")
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
+        self.send_header("Content-Length", str(len(content)))
         self.end_headers()
-        HandlersManager.instance().get_handlers()
-        fernet = Fernet(Config.instance().get_crypto_key())
-        self.wfile.write(("Crypted field: %s" % fernet.encrypt(unquote_plus(
-            post_data.decode("utf-8")).split("=")[1].encode("utf-8")).decode("utf-8")).encode("utf-8"))
+        self.wfile.write(content)
 
     def do_GET(self):
         self._process_request()
@@ -60,6 +84,7 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
             self.send_header("WWW-Authenticate",
                              "Basic realm=\"PyRSSW Realm\"")
             self.send_header("Content-type", "application/json")
+            self.send_header("Content-Length", "0")
             self.end_headers()
 
     def check_auth(self, auth_key):
@@ -101,6 +126,8 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         status_code = handler.get_status()
 
         self.send_response(status_code)
+        for name, value in handler.get_headers().items():
+            self.send_header(name, value)
 
         if status_code != 401:
             if status_code == 200:
@@ -116,15 +143,14 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
             else:
                 content = "404 Not Found"
 
+        if content is None:
+            content = "error no content"
+        if not isinstance(content, bytes):
+            content = bytes(content, 'UTF-8')
+        self.send_header("Content-Length", str(len(content)))
         self.end_headers()
 
-        if content is not None:
-            if not isinstance(content, bytes):
-                content = bytes(content, 'UTF-8')
-
-            return content  # type: ignore
-        else:
-            return bytes("error no content", 'UTF-8')
+        return content  # type: ignore
 
     def respond(self, opts):
         response = self.handle_http(opts['handler'])
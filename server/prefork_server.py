@@ -0,0 +1,202 @@
+"""Pre-fork multi-process mode of main.py, used when server.workers is greater than 1.
+
+The master process loads the configuration, the handlers and the TLS context once, then forks the workers: each
+worker listens on its own socket bound to the same address with SO_REUSEPORT (the kernel balances the connections
+between them) and shares the code and data loaded by the master (copy on write), TLS session tickets issued by a
+worker are accepted by the other ones.
+The master restarts the workers which exit, and:
+ - stops the workers gracefully on SIGTERM or SIGINT: a worker stops accepting connections and finishes its
+   current request, it is killed after server.graceful_timeout_s seconds
+ - reloads on SIGHUP: the configuration file is read again, new workers are started, then the previous ones are
+   stopped gracefully (the code of the handlers is not reloaded)
+"""
+
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config.config import SERVER_GRACEFUL_TIMEOUT_KEY, SERVER_WORKERS_KEY, Config
+from pyrssw_handlers.handlers_manager import HandlersManager
+from server.pyrssw_server import PyRSSWHTTPServer, get_ssl_context
+from utils.cpu_pool import CPUPool
+
+# environment variable overriding the server.workers setting
+WORKERS_ENV = "PYRSSW_SERVER_WORKERS"
+
+DEFAULT_GRACEFUL_TIMEOUT_S = 30.0
+SUPERVISION_INTERVAL_S = 0.2
+MIN_WORKER_LIFETIME_S = 1.0  # workers exiting sooner are restarted after RESTART_DELAY_S
+RESTART_DELAY_S = 1.0
+
+
+def get_workers_count() -> int:
+    """Number of worker processes: server.workers, 0 for one per CPU"""
+    value = os.environ.get(WORKERS_ENV, Config.instance().get_property(SERVER_WORKERS_KEY, "1")).strip()
+    workers = int(value) if value.isdigit() else 1
+
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def is_prefork_supported() -> bool:
+    return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+
+class _Worker:
+    def __init__(self, pid: int, generation: int) -> None:
+        self.pid: int = pid
+        self.generation: int = generation
+        self.started_at: float = time.monotonic()
+        self.kill_at: Optional[float] = None  # set once asked to stop
+
+
+class PreforkServer:
+    """Master process of the workers"""
+
+    def __init__(self, workers: int) -> None:
+        self.workers_count: int = workers
+        self.generation: int = 0
+        self._workers: Dict[int, _Worker] = {}
+        self._restarts: List[float] = []  # times at which workers of the current generation are restarted
+        self._signals: List[int] = []
+
+    def run(self) -> int:
+        """Serve until SIGTERM or SIGINT, returns the exit code of the master"""
+        self._check_address()
+        self._preload()
+        for signum in [signal.SIGTERM, signal.SIGINT, signal.SIGHUP]:
+            signal.signal(signum, lambda signum, _: self._signals.append(signum))
+
+        logging.getLogger().info("Server Starts - %d workers listening on %s:%d", self.workers_count,
+                                 Config.instance().get_server_listening_hostname(),
+                                 Config.instance().get_server_listening_port())
+        for _ in range(self.workers_count):
+            self._spawn_worker()
+
+        while True:
+            while len(self._signals) > 0:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self._reload()
+                else:
+                    self._stop()
+                    logging.getLogger().info("Server Stops")
+                    return 0
+            self._reap_workers()
+            self._supervise()
+            time.sleep(SUPERVISION_INTERVAL_S)
+
+    def _check_address(self):
+        """Fails fast when the address can not be bound (ie: already used by another program)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((Config.instance().get_server_listening_hostname(),
+                       Config.instance().get_server_listening_port()))
+        finally:
+            sock.close()
+
+    def _preload(self):
+        """Load what the workers share (copy on write)"""
+        config = Config.instance()
+        HandlersManager.instance().get_handlers()
+        if config.get_key_file() is not None and config.get_cert_file() is not None:
+            get_ssl_context(config.get_cert_file(), config.get_key_file())  # the same TLS session ticket keys
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                exit_code = _run_worker()
+            except Exception as e:
+                logging.getLogger().exception("Worker %d failed: %s", os.getpid(), str(e))
+            finally:
+                logging.shutdown()
+                os._exit(exit_code)
+
+        self._workers[pid] = _Worker(pid, self.generation)
+
+    def _reap_workers(self):
+        while len(self._workers) > 0:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            worker = self._workers.pop(pid, None)
+            if worker is not None and worker.generation == self.generation and worker.kill_at is None:
+                logging.getLogger().warning("Worker %d exited (status %d), it is restarted", pid, status)
+                lifetime = time.monotonic() - worker.started_at
+                self._restarts.append(time.monotonic() + (RESTART_DELAY_S if lifetime < MIN_WORKER_LIFETIME_S else 0))
+
+    def _supervise(self):
+        now = time.monotonic()
+        for restart_at in [restart_at for restart_at in self._restarts if restart_at <= now]:
+            self._restarts.remove(restart_at)
+            self._spawn_worker()
+        for worker in self._workers.values():
+            if worker.kill_at is not None and worker.kill_at <= now:
+                logging.getLogger().warning("Worker %d did not stop in time, it is killed", worker.pid)
+                _signal_worker(worker.pid, signal.SIGKILL)
+                worker.kill_at = float("inf")
+
+    def _reload(self):
+        config = Config.instance()
+        config.load_config_file(config.config_file)
+        self.workers_count = get_workers_count()
+        get_ssl_context.cache_clear()  # renewed certificates are loaded
+        self._preload()
+        logging.getLogger().info("Server reloads - %d workers", self.workers_count)
+        previous_workers = list(self._workers.values())
+        self.generation += 1
+        self._restarts.clear()
+        for _ in range(self.workers_count):
+            self._spawn_worker()
+        self._stop_workers(previous_workers)
+
+    def _stop(self):
+        self._restarts.clear()
+        self._stop_workers(list(self._workers.values()))
+        while len(self._workers) > 0:
+            self._reap_workers()
+            self._supervise()
+            time.sleep(SUPERVISION_INTERVAL_S)
+
+    def _stop_workers(self, workers: List[_Worker]):
+        kill_at = time.monotonic() + Config.instance().get_float_property(
+            SERVER_GRACEFUL_TIMEOUT_KEY, DEFAULT_GRACEFUL_TIMEOUT_S)
+        for worker in workers:
+            if worker.kill_at is None:
+                worker.kill_at = kill_at
+                _signal_worker(worker.pid, signal.SIGTERM)
+
+
+def _run_worker() -> int:
+    """Serve until SIGTERM, the current request is finished"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master stops the workers
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    httpd = PyRSSWHTTPServer(reuse_port=True)
+    signal.signal(signal.SIGTERM, lambda signum, _: threading.Thread(target=httpd.shutdown).start())
+    CPUPool.instance().start()  # each worker has its own pool
+    logging.getLogger().info("Worker %d started", os.getpid())
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        CPUPool.instance().shutdown()
+    logging.getLogger().info("Worker %d stopped", os.getpid())
+
+    return 0
+
+
+def _signal_worker(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
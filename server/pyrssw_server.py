@@ -1,30 +1,56 @@
 import base64
 import logging
+import socket
 import ssl
+from functools import lru_cache
 from http.server import HTTPServer
-from typing import Optional
+from socketserver import ThreadingMixIn
+from typing import Optional, cast
 
 from config.config import Config
 from server.abstract_pyrssw_server import AbstractPyRSSWHTTPServer
 from server.http_request_handler import HTTPRequestHandler
 
 
-class PyRSSWHTTPServer(HTTPServer, AbstractPyRSSWHTTPServer):
+@lru_cache(maxsize=4)
+def get_ssl_context(cert_file: str, key_file: str) -> ssl.SSLContext:
+    """TLS configuration of the server, with session tickets so that returning clients resume their sessions
+    without a full handshake. The context is created once per process (by the master in pre-fork mode, so that
+    the workers share the same ticket keys), and again when the server reloads."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.options &= ~ssl.OP_NO_TICKET
+    context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+
+    return context
+
+
+class PyRSSWHTTPServer(ThreadingMixIn, HTTPServer, AbstractPyRSSWHTTPServer):
     """HTTP server overriding the basic HTTPServer.
     This class using configuration to apply listening host, port and protocol and also to build the basic auth key if needed.
+    Every connection is served by its own thread, connections being persistent. server_close waits for the
+    requests in progress.
     """
 
-    def __init__(self):
+    daemon_threads = True
+
+    def __init__(self, reuse_port: bool = False):
+        self.reuse_port: bool = reuse_port  # several processes listen on the same address (see server.prefork_server)
         super().__init__((Config.instance().get_server_listening_hostname(),
                           Config.instance().get_server_listening_port()), HTTPRequestHandler)
 
         if self.get_protocol() == "https":
-            self.socket = ssl.wrap_socket(self.socket,
-                                          keyfile=Config.instance().get_key_file(),
-                                          certfile=Config.instance().get_cert_file(),
-                                          server_side=True)
+            # the handshake is made by the thread of the connection, not by the accepting one
+            context = get_ssl_context(cast(str, Config.instance().get_cert_file()),
+                                      cast(str, Config.instance().get_key_file()))
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
         self._load_auth_key()
 
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
     def _load_auth_key(self):
         self.auth_key: Optional[str] = None
         login, password = Config.instance().get_basic_auth_credentials()
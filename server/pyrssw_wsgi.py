@@ -7,12 +7,17 @@ from typing import Optional
 from handlers.favicon_handler import FaviconHandler
 from config.config import Config
 from handlers.bad_request_handler import BadRequestHandler
+from handlers.debug_handler import DebugHandler
 from handlers.help_handler import HelpHandler
-from handlers.launcher_handler import LauncherHandler, SESSION_DURATION
+from handlers.launcher_handler import LauncherHandler, SESSION_DURATION, get_render_key
+from handlers.rate_limited_handler import RateLimitedHandler
 from handlers.request_handler import RequestHandler
 from handlers.thumbnails_handler import ThumbnailHandler
 from pyrssw_handlers.handlers_manager import HandlersManager
 from utils.arguments import parse_command_line
+from utils.circuit_breaker import StaleCache
+from utils.rate_limiter import RateLimiter, get_client_key
+from utils.request_context import get_client, reset_client, set_client
 
 
 def application(environ, start_response):
@@ -49,7 +54,7 @@ def application(environ, start_response):
     if len(suffix.split("/")) > 0:
         cookie["sessionId"]["Path"] = suffix.split("/")[0]
     headers = [("Content-type", handler.get_content_type()),
-               ("Set-Cookie", cookie["sessionId"].OutputString())]
+               ("Set-Cookie", cookie["sessionId"].OutputString())] + list(handler.get_headers().items())
 
     start_response(str(handler.get_status()), headers)
     contents = handler.get_contents()
@@ -72,15 +77,28 @@ class WSGILauncherHandler:
         self.source_ip: Optional[str] = source_ip
 
     def get_handler(self, cookies: SimpleCookie, referer: str) -> RequestHandler:
+        client_token = set_client(get_client_key(
+            self.source_ip, cookies["sessionId"].value if "sessionId" in cookies else None))
+        try:
+            return self._get_handler(cookies, referer)
+        finally:
+            reset_client(client_token)
+
+    def _get_handler(self, cookies: SimpleCookie, referer: str) -> RequestHandler:
         try:
             module_name = self._parse_module_name()
             handler: Optional[RequestHandler] = None
             suffix_url: str = self.path[len(module_name)+1:]
+            rate_limited_handler = self._get_rate_limited_handler(module_name, suffix_url, cookies)
+            if rate_limited_handler is not None:
+                return rate_limited_handler
             if module_name == "":  # root page
                 handler = HelpHandler(
                     HandlersManager.instance().get_handlers(), self.serving_url_prefix, self.source_ip)
             elif module_name == "thumbnails":
                 handler = ThumbnailHandler(suffix_url, self.source_ip)
+            elif module_name == "debug":
+                handler = DebugHandler(suffix_url, self.source_ip)
             elif module_name == "favicon.ico":
                 handler = FaviconHandler(
                     HandlersManager.instance().get_handlers(), referer, self.source_ip)
@@ -95,6 +113,24 @@ class WSGILauncherHandler:
 
         return handler
 
+    def _get_rate_limited_handler(self, module_name: str, suffix_url: str,
+                                  cookies: SimpleCookie) -> Optional[RequestHandler]:
+        """Returns the handler answering the request when its client is over its rate limit (see
+        utils.rate_limiter), None otherwise"""
+        route: str = "other"
+        if module_name in HandlersManager.instance().get_handlers():
+            route = "rss" if suffix_url.find("/rss") == 0 else "content"
+        allowed, retry_after = RateLimiter.instance().allow(get_client(), module_name, route, self.source_ip)
+        if allowed:
+            return None
+
+        stale = None
+        if route != "other":
+            stale = StaleCache.instance().get(get_render_key(
+                "%s/%s" % (self.serving_url_prefix, module_name), suffix_url, ""))
+
+        return RateLimitedHandler(route == "rss", stale, retry_after, self._get_sessionid(cookies), self.source_ip)
+
     def _parse_module_name(self):
         module_name = ""
         split_path = self.path.split('/')
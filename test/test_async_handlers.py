@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+from typing import Dict
+
+import requests
+
+from pyrssw_handlers.abstract_pyrssw_request_handler import PyRSSWRequestHandler
+from request.pyrssw_content import PyRSSWContent
+from utils.async_http_client import is_async_enabled
+from utils.http_replay import TRANSPORT_MODE_ENV
+from utils.request_context import get_handler_name, reset_handler_name, set_handler_name
+
+
+class SyncHandler(PyRSSWRequestHandler):
+
+    def get_original_website(self) -> str:
+        return "https://www.example.org/"
+
+    def get_rss_url(self) -> str:
+        return "https://www.example.org/rss"
+
+    @staticmethod
+    def get_favicon_url(parameters: Dict[str, str]) -> str:
+        return ""
+
+    def get_feed(self, parameters: dict, session: requests.Session) -> str:
+        return "|".join([session.headers["User-Agent"], get_handler_name(), threading.current_thread().name])
+
+    def get_content(self, url: str, parameters: dict, session: requests.Session) -> PyRSSWContent:
+        return PyRSSWContent(url, "")
+
+
+class AsyncHandler(SyncHandler):
+
+    async def get_feed_async(self, parameters: dict, session) -> str:
+        return "async feed"
+
+
+class FakeAsyncSession:
+    headers = {"User-Agent": "test agent"}
+
+
+def test_sync_handler_run_async():
+    handler = SyncHandler()
+    if handler.has_async_feed() or handler.has_async_content():
+        raise AssertionError
+
+    token = set_handler_name("sync")
+    try:
+        feed = asyncio.run(handler.get_feed_async({}, FakeAsyncSession()))
+        content = asyncio.run(handler.get_content_async("https://www.example.org/1", {}, FakeAsyncSession()))
+    finally:
+        reset_handler_name(token)
+
+    # run in a thread executor, with the headers and the context of the request
+    user_agent, handler_name, thread_name = feed.split("|")
+    if user_agent != "test agent" or handler_name != "sync" or thread_name == threading.current_thread().name:
+        raise AssertionError(feed)
+    if content.content != "https://www.example.org/1":
+        raise AssertionError
+
+
+def test_async_handler_detection():
+    handler = AsyncHandler()
+    if not handler.has_async_feed() or handler.has_async_content():
+        raise AssertionError
+    if asyncio.run(handler.get_feed_async({}, FakeAsyncSession())) != "async feed":
+        raise AssertionError
+
+
+def test_async_disabled_with_recorded_traffic():
+    previous = os.environ.get(TRANSPORT_MODE_ENV)
+    os.environ[TRANSPORT_MODE_ENV] = "replay"
+    try:
+        if is_async_enabled():
+            raise AssertionError
+    finally:
+        if previous is None:
+            del os.environ[TRANSPORT_MODE_ENV]
+        else:
+            os.environ[TRANSPORT_MODE_ENV] = previous
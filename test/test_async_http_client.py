@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from utils.async_http_client import AsyncHTTPSession
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreakers, CircuitOpenError
+from utils.http_client import DeadlineExceededError
+from utils.request_context import reset_deadline, set_deadline
+
+httpx = pytest.importorskip("httpx")
+
+
+def _response(status: int, text: str = ""):
+    """Response streamed like the ones of the network (the elapsed time is only known once it is read)"""
+    return httpx.Response(status, stream=httpx.ByteStream(text.encode("utf-8")))
+
+
+def _request(handler, url: str, **kwargs):
+    async def _run():
+        async with AsyncHTTPSession(transport=httpx.MockTransport(handler)) as session:
+            return await session.get(url, **kwargs)
+
+    return asyncio.run(_run())
+
+
+def _open_long_ago(host: str):
+    """Breaker of the host, half open at the next call"""
+    breaker = CircuitBreakers.instance().get(host)
+    breaker.state, breaker.opened_at, breaker.failures = OPEN, 0, breaker.failures_threshold
+    return breaker
+
+
+def test_async_session_circuit_breaker():
+    host = "async-breaker.example.org"
+    url = "https://%s/feed" % host
+    breaker = CircuitBreakers.instance().get(host)
+    response = _request(lambda request: _response(200, request.headers["User-Agent"]), url)
+    if response.status_code != 200 or "pyrssw" not in response.text or breaker.state != CLOSED:
+        raise AssertionError
+
+    for _ in range(breaker.failures_threshold):
+        _request(lambda request: _response(503), url)
+    if breaker.state != OPEN:
+        raise AssertionError
+    try:
+        _request(lambda request: _response(200), url)
+        raise AssertionError
+    except CircuitOpenError:
+        pass
+
+    # the probe closes the breaker when it succeeds, opens it again when the host can not be reached
+    _open_long_ago(host)
+    try:
+        _request(lambda request: (_ for _ in ()).throw(httpx.ConnectError("refused")), url)
+        raise AssertionError
+    except httpx.ConnectError:
+        pass
+    if breaker.state != OPEN:
+        raise AssertionError
+    _open_long_ago(host)
+    if _request(lambda request: _response(200), url).status_code != 200 or breaker.state != CLOSED:
+        raise AssertionError
+
+
+def test_async_session_probe_released():
+    """A cancelled probe or an exceeded deadline lets the next call probe the host, without closing the breaker"""
+    host = "async-probe.example.org"
+    url = "https://%s/feed" % host
+
+    async def _slow(request):
+        await asyncio.sleep(0.3)
+        raise httpx.ReadTimeout("slow", request=request)
+
+    async def _cancelled():
+        async with AsyncHTTPSession(transport=httpx.MockTransport(_slow)) as session:
+            await asyncio.wait_for(session.get(url), 0.05)
+
+    breaker = _open_long_ago(host)
+    try:
+        asyncio.run(_cancelled())
+        raise AssertionError
+    except asyncio.TimeoutError:
+        pass
+    if breaker.state != HALF_OPEN:
+        raise AssertionError
+    breaker.before_call()  # not rejected: the probe has been released
+    breaker.release_probe()
+
+    token = set_deadline(0.1)
+    try:
+        _request(_slow, url)
+        raise AssertionError
+    except DeadlineExceededError:
+        pass
+    finally:
+        reset_deadline(token)
+    if breaker.state != HALF_OPEN:
+        raise AssertionError
+    breaker.before_call()
+    breaker.release_probe()
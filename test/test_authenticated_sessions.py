@@ -0,0 +1,95 @@
+import threading
+import time
+
+import requests
+
+from pyrssw_handlers.le_monde_handler import URL_CONNECTION, LeMondeHandler
+from utils.authenticated_sessions import AuthenticatedSessions, LoginError
+from utils.http_replay import RecordedExchange, ReplayAdapter, ReplayArchive
+
+LOGIN_URL = "https://secure.example.org/login"
+ARTICLE_URL = "https://www.example.org/article"
+PARAMETERS = {"login": "reader@example.org", "password": "secret"}
+
+
+def test_authenticated_sessions():
+    archive = ReplayArchive()
+    archive.add(RecordedExchange("POST", LOGIN_URL, 200, {
+        "Set-Cookie": "sid=logged; Max-Age=3600; Path=/; Domain=.example.org"}, b""))
+    archive.add(RecordedExchange("GET", ARTICLE_URL, 200, {}, b"article"))
+    adapter = ReplayAdapter(archive)
+    logins = []
+
+    def log_in(parameters: dict, session: requests.Session):
+        session.mount("https://", adapter)
+        time.sleep(0.05)
+        session.post(LOGIN_URL, data={"email": parameters["login"], "password": parameters["password"]})
+        logins.append(parameters["login"])
+
+    pool = AuthenticatedSessions._cls()
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(
+        pool.get_session("example", PARAMETERS, requests.Session(), log_in))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # concurrent requests of the same account share a single login
+    if len(logins) != 1 or len(set(id(session) for session in sessions)) != 1:
+        raise AssertionError
+    if sessions[0].cookies.get("sid") != "logged" or \
+            any(PARAMETERS["login"] in key or PARAMETERS["password"] in key for key in pool._sessions._entries):
+        raise AssertionError
+
+    # an authentication failure logs in again
+    page = pool.get("example", ARTICLE_URL, PARAMETERS, requests.Session(), log_in,
+                    lambda response: len(logins) == 1)
+    if page.text != "article" or len(logins) != 2:
+        raise AssertionError
+
+    # without credentials, the session of the request is used
+    session = requests.Session()
+    if pool.get_session("example", {}, session, log_in) is not session:
+        raise AssertionError
+
+
+def test_failed_login_not_cached():
+    pool = AuthenticatedSessions._cls()
+    logins = []
+
+    def log_in_without_cookie(parameters: dict, session: requests.Session):
+        logins.append(parameters["login"])
+
+    # a login which did not set any cookie failed, whatever the log_in function says
+    for _ in range(2):
+        try:
+            pool.get_session("example", PARAMETERS, requests.Session(), log_in_without_cookie)
+            raise AssertionError
+        except LoginError:
+            pass
+    if len(logins) != 2 or len(pool._sessions._entries) != 0:
+        raise AssertionError
+
+
+def test_le_monde_login():
+    form = b"""<html><body><form><input type="hidden" id="newsletters" value="[]"/>
+<input type="hidden" id="csrf_token_0123456789" value="token"/></form></body></html>"""
+    login_page = RecordedExchange("GET", URL_CONNECTION, 200, {"Set-Cookie": "visitor=1; Path=/"}, form)
+    refused = ReplayArchive([login_page, RecordedExchange("POST", URL_CONNECTION, 200, {}, form)])
+    accepted = ReplayArchive([login_page, RecordedExchange(
+        "POST", URL_CONNECTION, 302, {"Location": "https://www.lemonde.fr/", "Set-Cookie": "lmd_a_s=1; Path=/"}, b""),
+        RecordedExchange("GET", "https://www.lemonde.fr/", 200, {}, b"home")])
+    no_form = ReplayArchive([RecordedExchange("GET", URL_CONNECTION, 503, {}, b"maintenance")])
+    handler = LeMondeHandler()
+
+    for archive, logged_in in [(refused, False), (no_form, False), (accepted, True)]:
+        session = requests.Session()
+        session.mount("https://", ReplayAdapter(archive))
+        try:
+            handler._authent(PARAMETERS, session)
+            if not logged_in:
+                raise AssertionError
+        except LoginError:
+            if logged_in:
+                raise
@@ -0,0 +1,23 @@
+
+from benchmarks.handlers_benchmark import load_scenarios, run_scenario
+from utils.http_client import http_client
+from utils.http_replay import ReplayAdapter
+from utils.scraper_sessions import ScraperSessions
+
+
+def test_benchmark_scenarios():
+    scenarios = load_scenarios()
+    if len(scenarios) == 0:
+        raise AssertionError
+
+    for scenario in scenarios:
+        result = run_scenario(scenario, iterations=1)
+        if len(result.errors) > 0:
+            raise AssertionError("%s: %s" % (scenario.handler_name, result.errors))
+        if "get_feed" not in result.durations or "get_readable_content" not in result.durations:
+            raise AssertionError(scenario.handler_name)
+
+    # the transport of the global client and of the scraper sessions is restored
+    if isinstance(http_client.session.get_adapter("https://www.lemonde.fr/"), ReplayAdapter) \
+            or ScraperSessions.instance()._transport_adapter is not None:
+        raise AssertionError
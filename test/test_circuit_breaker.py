@@ -0,0 +1,84 @@
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, CircuitOpenError
+from utils.http_client import DeadlineExceededError, HTTPSession
+from utils.http_replay import ReplayMissError
+from utils.request_context import reset_deadline, set_deadline
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("www.example.org", failures_threshold=3, open_s=0.2)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    if breaker.state != OPEN:
+        raise AssertionError
+
+    try:
+        breaker.before_call()
+        raise AssertionError
+    except CircuitOpenError:
+        pass
+
+    time.sleep(0.25)
+    breaker.before_call()  # probe call
+    if breaker.state != HALF_OPEN:
+        raise AssertionError
+    try:
+        breaker.before_call()  # only one probe at a time
+        raise AssertionError
+    except CircuitOpenError:
+        pass
+    breaker.record_failure()
+    if breaker.state != OPEN:
+        raise AssertionError
+
+    time.sleep(0.25)
+    breaker.before_call()
+    breaker.record_success()
+    if breaker.state != CLOSED or breaker.failures != 0:
+        raise AssertionError
+
+
+class _FailingAdapter(BaseAdapter):
+    def __init__(self, error: Exception, delay_s: float = 0) -> None:
+        super().__init__()
+        self.error = error
+        self.delay_s = delay_s
+
+    def send(self, request, **kwargs):
+        time.sleep(self.delay_s)
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def test_half_open_probe_released():
+    """A probe which tells nothing about the host lets the next call probe it, without closing the breaker"""
+    host = "half-open.example.org"
+    url = "http://%s/feed" % host
+    breaker = CircuitBreakers.instance().get(host)
+    session = HTTPSession()
+    session.circuit_breaker_enabled = True
+    for adapter, deadline_s, error in [(_FailingAdapter(ReplayMissError("not recorded")), None, ReplayMissError),
+                                       (_FailingAdapter(requests.exceptions.Timeout("slow"), 0.3), 0.1,
+                                        DeadlineExceededError)]:
+        breaker.state, breaker.opened_at = OPEN, 0  # open long ago: the next call is a probe
+        session.mount("http://%s/" % host, adapter)
+        token = set_deadline(deadline_s) if deadline_s is not None else None
+        try:
+            session.get(url)
+            raise AssertionError
+        except error:
+            pass
+        finally:
+            if token is not None:
+                reset_deadline(token)
+        if breaker.state != HALF_OPEN:
+            raise AssertionError
+        breaker.before_call()  # not rejected: the probe has been released
+        breaker.release_probe()
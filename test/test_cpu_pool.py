@@ -0,0 +1,53 @@
+import io
+import time
+
+from PIL import Image
+
+from handlers.thumbnails_handler import blur_image
+from utils.cpu_pool import CPUPool, CPUTaskTimeoutError
+from utils.metrics import Metrics
+
+
+def test_cpu_pool():
+    pool = CPUPool.instance()
+    settings = (pool.size, pool.min_input_size, pool.max_pending, pool.timeout_s)
+    pool.size, pool.min_input_size, pool.max_pending, pool.timeout_s = 2, 1024, 8, 10
+    image = io.BytesIO()
+    Image.new("RGB", (400, 300), "red").save(image, format="PNG")
+    try:
+        # small inputs are processed in the calling thread
+        if pool.run("test", len, b"small", input_size=5) != 5 \
+                or Metrics.instance().get_counter("cpu_pool.tasks", stage="test", outcome="small") != 1:
+            raise AssertionError
+        # ... with the local callable when given, the picklable function is only used by the pool
+        if pool.run("test", len, b"small", input_size=5, local=lambda: -1) != -1 \
+                or pool.run("test", len, b"0" * 2048, input_size=2048, local=lambda: -1) != 2048:
+            raise AssertionError
+
+        if pool.run("blur_image", blur_image, image.getvalue(), input_size=10000) != blur_image(image.getvalue()) \
+                or Metrics.instance().get_counter("cpu_pool.tasks", stage="blur_image", outcome="pool") != 1:
+            raise AssertionError
+
+        # errors of the tasks are raised by run
+        try:
+            pool.run("blur_image", blur_image, b"not an image", input_size=10000)
+            raise AssertionError
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+
+        # a stuck worker is replaced
+        pool.timeout_s = 0.5
+        started = time.monotonic()
+        try:
+            pool.run("test", time.sleep, 30, input_size=10000)
+            raise AssertionError
+        except CPUTaskTimeoutError:
+            pass
+        pool.timeout_s = 10
+        if time.monotonic() - started > 5 or pool.run("test", len, b"0" * 2048, input_size=2048) != 2048:
+            raise AssertionError
+    finally:
+        pool.shutdown()
+        pool.size, pool.min_input_size, pool.max_pending, pool.timeout_s = settings
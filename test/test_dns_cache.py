@@ -0,0 +1,61 @@
+import socket
+import time
+
+from utils import dns_cache
+from utils.dns_cache import DNSCache, parse_hosts
+from utils.metrics import Metrics
+
+
+def test_dns_cache():
+    calls = []
+
+    def fake_resolve(host, port):
+        calls.append(host)
+        if host == "unknown.example.org":
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return ["192.0.2.%d" % len(calls)]
+
+    cache = DNSCache.instance()
+    ttl_s, negative_ttl_s, static_hosts = cache.ttl_s, cache.negative_ttl_s, cache.static_hosts
+    system_resolve = dns_cache.system_resolve
+    dns_cache.system_resolve = fake_resolve
+    cache.ttl_s, cache.negative_ttl_s = 0.5, 10
+    cache.static_hosts = parse_hosts("static.example.org=192.0.2.100, static.example.org = 2001:db8::1")
+    cache.clear()
+    try:
+        if cache.resolve("www.example.org", 443) != ["192.0.2.1"] or cache.resolve("WWW.example.org", 443) != [
+                "192.0.2.1"] or len(calls) != 1:
+            raise AssertionError
+
+        # used after 80% of its TTL: served, then refreshed in the background
+        time.sleep(0.45)
+        if cache.resolve("www.example.org", 443) != ["192.0.2.1"]:
+            raise AssertionError
+        time.sleep(0.1)
+        if cache.resolve("www.example.org", 443) != ["192.0.2.2"] or len(calls) != 2:
+            raise AssertionError
+
+        for _ in range(2):
+            try:
+                cache.resolve("unknown.example.org", 443)
+                raise AssertionError
+            except socket.gaierror:
+                pass
+        if len(calls) != 3 or Metrics.instance().get_counter(
+                "upstream.dns_cache", host="unknown.example.org", outcome="negative_hit") != 1:
+            raise AssertionError
+
+        if cache.resolve("static.example.org", 443) != ["192.0.2.100", "2001:db8::1"] or len(calls) != 3:
+            raise AssertionError
+    finally:
+        dns_cache.system_resolve = system_resolve
+        cache.ttl_s, cache.negative_ttl_s, cache.static_hosts = ttl_s, negative_ttl_s, static_hosts
+        cache.clear()
+
+
+def test_parse_dns_hosts():
+    try:
+        parse_hosts("www.example.org=not an address")
+        raise AssertionError
+    except ValueError:
+        pass
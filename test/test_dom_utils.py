@@ -0,0 +1,79 @@
+import threading
+
+import requests
+from lxml import etree
+from requests.structures import CaseInsensitiveDict
+
+from utils.dom_utils import (XPathRegistry, compiled_xpath, delete_xpaths, get_parser, parse_response, to_string,
+                             xpath)
+
+NAMESPACES = {"atom": "http://www.w3.org/2005/Atom"}
+
+
+def test_compiled_xpath():
+    registry = XPathRegistry.instance()
+    dom = etree.fromstring('<feed xmlns="http://www.w3.org/2005/Atom"><entry/><entry/></feed>')
+    misses = registry.misses
+    hits = registry.hits
+
+    if len(xpath(dom, "//atom:entry", namespaces=NAMESPACES)) != 2:
+        raise AssertionError
+    if len(xpath(dom, "//atom:entry", namespaces=dict(NAMESPACES))) != 2:
+        raise AssertionError
+    if compiled_xpath("//atom:entry", NAMESPACES) is not compiled_xpath("//atom:entry", NAMESPACES):
+        raise AssertionError
+    if registry.misses != misses + 1 or registry.hits != hits + 3:
+        raise AssertionError
+    if len(xpath(dom, "//entry")) != 0:
+        raise AssertionError
+    if len(xpath(None, "//entry")) != 0:
+        raise AssertionError
+
+
+def test_delete_xpaths():
+    dom = etree.HTML('<div><p class="ad"><script>x</script></p><p>text</p><aside><script>y</script></aside></div>')
+
+    delete_xpaths(dom, ['//*[@class="ad"]', "//script", "//aside"])
+    if to_string(dom) != "<html><body><div><p>text</p></div></body></html>":
+        raise AssertionError
+    delete_xpaths(dom, [])
+    if to_string(dom) != "<html><body><div><p>text</p></div></body></html>":
+        raise AssertionError
+
+
+def _get_response(content: bytes, content_type: str) -> requests.Response:
+    response = requests.Response()
+    response.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    response._content = content
+    return response
+
+
+def test_parse_response():
+    latin1 = _get_response("<rss><title>Été</title></rss>".encode("latin-1"), "text/xml; charset=ISO-8859-1")
+    if xpath(parse_response(latin1), "//title")[0].text != "Été":
+        raise AssertionError
+
+    declared = _get_response('<?xml version="1.0" encoding="ISO-8859-1"?><rss><title>Été</title></rss>'.encode(
+        "latin-1"), "application/rss+xml")
+    if xpath(parse_response(declared), "//title")[0].text != "Été":
+        raise AssertionError
+
+    html = _get_response('<html><body><p>Ça <b>marche</p></body></html>'.encode("utf-8"), 'text/html; charset="utf-8"')
+    if xpath(parse_response(html, html=True), "//b")[0].text != "marche":
+        raise AssertionError
+
+    malformed = _get_response(b"<rss><item><title>unclosed</item></rss>", "text/xml")
+    if xpath(parse_response(malformed), "//title")[0].text != "unclosed":
+        raise AssertionError
+
+
+def test_get_parser():
+    parsers = []
+    thread = threading.Thread(target=lambda: parsers.append(get_parser()))
+    thread.start()
+    thread.join()
+
+    if get_parser() is not get_parser() or get_parser() is parsers[0]:
+        raise AssertionError
+    if get_parser(html=True) is get_parser() or get_parser(encoding="utf-8") is not get_parser(encoding="UTF-8"):
+        raise AssertionError
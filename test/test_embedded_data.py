@@ -0,0 +1,55 @@
+import json
+
+from utils.embedded_data import _cache, get_embedded_data
+
+
+def _push(chunk: str) -> str:
+    return "<script>self.__next_f.push(%s)</script>" % json.dumps([1, chunk])
+
+
+def test_embedded_data():
+    text = "Déjà vu\nsur deux lignes"
+    rows = '0:["$","div",null,{}]\n1:I["chunk",[]]\n2:T%x,%s3:{"ARTICLE|42":{"title":"Été"}}\n' % (
+        len(text.encode("utf-8")), text)
+    page = """<html><head><script type="application/ld+json">{"@type": "NewsArticle", "articlebody": "body"}</script>
+<script>var x = 1;</script><script>Fusion.globalContent={"headlines":{"basic":"};Fusion"}};Fusion.spa=false;</script>
+</head><body><script>self.__next_f.push([0])</script>%s%s</body></html>""" % (_push(rows[:40]), _push(rows[40:]))
+
+    embedded_data = get_embedded_data(page)
+    if get_embedded_data(page) is not embedded_data:
+        raise AssertionError
+
+    # rows split across several pushes, text rows measured in bytes
+    flight_rows = embedded_data.get_flight_rows()
+    if flight_rows.get("2") != text or "1" in flight_rows:
+        raise AssertionError
+    if list(embedded_data.get_flight_rows("ARTICLE|42").values()) != [{"ARTICLE|42": {"title": "Été"}}]:
+        raise AssertionError
+
+    if embedded_data.get_assigned_json("Fusion.globalContent") != {"headlines": {"basic": "};Fusion"}}:
+        raise AssertionError
+    if embedded_data.get_assigned_json("Fusion.missing") is not None:
+        raise AssertionError
+    if [article["articlebody"] for article in embedded_data.get_json_ld("NewsArticle")] != ["body"]:
+        raise AssertionError
+    if embedded_data.get_json_ld("VideoObject") != []:
+        raise AssertionError
+
+
+def test_embedded_data_cache():
+    max_size = _cache.max_size
+    _cache.max_size = 100
+    try:
+        pages = ["<script>var page = %d; // %s</script>" % (i, "x" * 20) for i in range(5)]
+        cached = [get_embedded_data(page) for page in pages]
+        # bounded by the size of the scripts
+        if _cache.size > 100 or len(_cache) != 100 // cached[0].size:
+            raise AssertionError
+        if get_embedded_data(pages[-1]) is not cached[-1] or get_embedded_data(pages[0]) is cached[0]:
+            raise AssertionError
+        # pages whose scripts are larger than the cache are not cached
+        large_page = "<script>%s</script>" % ("x" * 200)
+        if get_embedded_data(large_page) is get_embedded_data(large_page):
+            raise AssertionError
+    finally:
+        _cache.max_size = max_size
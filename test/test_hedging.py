@@ -0,0 +1,58 @@
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.hedging import MIN_SAMPLES, HedgingPolicy
+from utils.http_client import HTTPSession
+from utils.metrics import Metrics
+
+SLOW_RESPONSE_S = 0.5
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Every other request is slow"""
+    calls = itertools.count()
+
+    def do_GET(self):
+        if next(_Handler.calls) % 2 == 0:
+            time.sleep(SLOW_RESPONSE_S)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_hedged_requests():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d/" % server.server_address[1]
+    metrics = Metrics.instance()
+    for _ in range(MIN_SAMPLES):
+        metrics.observe("upstream.ttfb_ms", 20, host="127.0.0.1")
+
+    policy = HedgingPolicy.instance()
+    hosts, tokens = policy.hosts, policy.tokens
+    policy.hosts = ["127.0.0.1"]
+    session = HTTPSession()
+    session.hedging_enabled = True
+    try:
+        policy.tokens = 1
+        started = time.perf_counter()
+        if session.get(url).text != "ok" or time.perf_counter() - started >= SLOW_RESPONSE_S \
+                or metrics.get_counter("upstream.hedges", host="127.0.0.1", outcome="won") != 1:
+            raise AssertionError
+
+        # no hedge left in the budget: the slow response is awaited
+        policy.tokens = 0
+        started = time.perf_counter()
+        if session.get(url).text != "ok" or time.perf_counter() - started < SLOW_RESPONSE_S \
+                or metrics.get_counter("upstream.hedges", host="127.0.0.1", outcome="no_budget") != 1:
+            raise AssertionError
+    finally:
+        policy.hosts, policy.tokens = hosts, tokens
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,199 @@
+import datetime
+import gzip
+import os
+import socket
+import socketserver
+import ssl
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from utils import http2_transport
+from utils.http2_transport import HTTP2Adapter, HTTP2ConnectionPools, is_selected_host, parse_hosts
+from utils.metrics import Metrics
+
+BODY = "Un été à Paris".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = gzip.compress(BODY)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "first=1; Path=/")
+        self.send_header("Set-Cookie", "second=2; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _BrokenHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.rfile.readline()
+        self.wfile.write(b"NOT HTTP\r\n\r\n")
+
+
+def _create_certificate(directory: str):
+    """Self signed certificate of localhost, returns the certificate and key files"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1)) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False) \
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True) \
+        .sign(key, hashes.SHA256())
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+
+    return certfile, keyfile
+
+
+def _serve_http2(listener: socket.socket, context: ssl.SSLContext, connections: list):
+    """Minimal HTTP/2 server answering BODY to every stream"""
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    def _handle(sock: socket.socket):
+        try:
+            with context.wrap_socket(sock, server_side=True) as tls:
+                connections.append(tls.selected_alpn_protocol())
+                connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+                connection.initiate_connection()
+                tls.sendall(connection.data_to_send())
+                data = tls.recv(65535)
+                while data:
+                    for event in connection.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            connection.send_headers(event.stream_id, [(":status", "200"),
+                                                                      ("content-length", str(len(BODY)))])
+                            connection.send_data(event.stream_id, BODY, end_stream=True)
+                    tls.sendall(connection.data_to_send())
+                    data = tls.recv(65535)
+        except (OSError, ssl.SSLError):
+            pass
+
+    while True:
+        try:
+            sock, _ = listener.accept()
+        except OSError:  # closed at the end of the test
+            return
+        threading.Thread(target=_handle, args=(sock,), daemon=True).start()
+
+
+def _serve(server) -> str:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:%d/" % server.server_address[1]
+
+
+def test_http2_hosts():
+    hosts = parse_hosts(" www.lequipe.fr, *.redd.it ,")
+    if hosts != ["www.lequipe.fr", "*.redd.it"]:
+        raise AssertionError
+    if not is_selected_host("i.redd.it", hosts) or is_selected_host("www.reddit.com", hosts) \
+            or not is_selected_host("any.host", ["*"]):
+        raise AssertionError
+
+
+def test_http2_adapter_reuses_connections():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    url = _serve(server)
+    session = requests.Session()
+    session.mount("http://", HTTP2Adapter(["127.0.0.1"]))
+    try:
+        for _ in range(3):
+            response = session.get(url, timeout=(5, 5))
+            if response.status_code != 200 or response.content != BODY or response.text != "Un été à Paris":
+                raise AssertionError
+        if session.cookies.get("first") != "1" or session.cookies.get("second") != "2":
+            raise AssertionError
+
+        metrics = Metrics.instance()
+        if metrics.get_counter("upstream.connections", host="127.0.0.1", version="HTTP/1.1", outcome="new") != 1 \
+                or metrics.get_counter("upstream.connections", host="127.0.0.1", version="HTTP/1.1",
+                                       outcome="reused") != 2:
+            raise AssertionError
+
+        # other hosts are sent by the default transport
+        session.mount("http://", HTTP2Adapter(["www.example.org"]))
+        if session.get(url, timeout=(5, 5)).content != BODY or metrics.get_counter(
+                "upstream.connections", host="127.0.0.1", version="HTTP/1.1", outcome="reused") != 2:
+            raise AssertionError
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http2_adapter_falls_back_to_http1():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _BrokenHandler)
+    url = _serve(server)
+    session = requests.Session()
+    session.mount("http://", HTTP2Adapter(["127.0.0.1"]))
+    http2_available = http2_transport.HTTP2_AVAILABLE
+    http2_transport.HTTP2_AVAILABLE = True  # HTTP/2 is only negotiated with TLS, h2 is not needed here
+    try:
+        try:
+            session.get(url, timeout=(5, 5))
+            raise AssertionError
+        except requests.exceptions.ConnectionError:
+            pass
+        if HTTP2ConnectionPools.instance().is_http2_allowed("127.0.0.1") \
+                or Metrics.instance().get_counter("upstream.http2_fallbacks", host="127.0.0.1") != 1:
+            raise AssertionError
+    finally:
+        http2_transport.HTTP2_AVAILABLE = http2_available
+        server.shutdown()
+        server.server_close()
+
+
+def test_http2_adapter_multiplexes_calls():
+    pytest.importorskip("h2")
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = _create_certificate(directory)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        context.set_alpn_protocols(["h2", "http/1.1"])
+        listener = socket.create_server(("127.0.0.1", 0))
+        connections: list = []
+        threading.Thread(target=_serve_http2, args=(listener, context, connections), daemon=True).start()
+        url = "https://localhost:%d/" % listener.getsockname()[1]
+        session = requests.Session()
+        session.mount("https://", HTTP2Adapter(["localhost"]))
+        try:
+            # HTTP/2 is negotiated with ALPN
+            response = session.get(url, timeout=(5, 5), verify=certfile)
+            if response.status_code != 200 or response.content != BODY or response.raw.version_string != "HTTP/2":
+                raise AssertionError
+
+            # concurrent calls share the connection
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                responses = list(executor.map(lambda _: session.get(url, timeout=(5, 5), verify=certfile), range(10)))
+            if any(r.content != BODY or r.raw.version_string != "HTTP/2" for r in responses) or connections != ["h2"]:
+                raise AssertionError(connections)
+            metrics = Metrics.instance()
+            if metrics.get_counter("upstream.connections", host="localhost", version="HTTP/2", outcome="new") != 1 \
+                    or metrics.get_counter("upstream.connections", host="localhost", version="HTTP/2",
+                                           outcome="reused") != 10:
+                raise AssertionError
+        finally:
+            listener.close()
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from utils.http_replay import (RECORDING_INDEX, REDACTED, ArchiveRecorder, RecordedExchange, RecordingAdapter,
+                               ReplayAdapter, ReplayArchive, ReplayMissError, parse_latencies,
+                               redact_headers, redact_url)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _count_lines(path: str) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def test_redact_headers():
+    headers = redact_headers({
+        "Authorization": "Bearer secret",
+        "Cookie": "sid=secret; lang=fr",
+        "Set-Cookie": "sid=secret; Path=/; Expires=Wed, 21 Oct 2026 07:28:00 GMT, token=secret2; HttpOnly",
+        "Accept": "text/html"
+    })
+
+    if headers["Authorization"] != REDACTED:
+        raise AssertionError
+    if headers["Cookie"] != "sid=%s; lang=%s" % (REDACTED, REDACTED):
+        raise AssertionError
+    if "secret" in headers["Set-Cookie"] or "Path=/" not in headers["Set-Cookie"] or "token=" not in headers["Set-Cookie"]:
+        raise AssertionError
+    if headers["Accept"] != "text/html":
+        raise AssertionError
+
+
+def test_zip_archive_replay():
+    archive = ReplayArchive()
+    archive.add(RecordedExchange("GET", "https://www.example.org/feed?b=2&a=1", 200, {}, b"first", elapsed_ms=12))
+    archive.add(RecordedExchange("GET", "https://www.example.org/feed?b=2&a=1", 200, {}, b"second"))
+    archive.add(RecordedExchange("GET", "https://www.example.org/other", 404, {}, b"first"))
+    path = os.path.join(tempfile.mkdtemp(), "traffic.zip")
+    archive.save(path)
+
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter(ReplayArchive.load(path), parse_latencies("www.example.org=recorded")))
+    response = session.get("https://WWW.example.org:443/feed?a=1&b=2#top")
+    if response.text != "first" or response.elapsed.total_seconds() * 1000 < 12:
+        raise AssertionError
+    if session.get("https://www.example.org/feed?a=1&b=2").text != "second":
+        raise AssertionError
+    if session.get("https://www.example.org/feed?a=1&b=2").text != "second":
+        raise AssertionError
+    if session.get("https://www.example.org/other").status_code != 404:
+        raise AssertionError
+
+    try:
+        session.get("https://www.example.org/unknown")
+        raise AssertionError
+    except ReplayMissError:
+        pass
+
+
+def test_redact_url():
+    url = redact_url("https://api.example.org/feed?api_key=secret&page=2&access_token=secret2&sig=secret3")
+    if "secret" in url or "page=2" not in url or "api_key=%s" % REDACTED not in url:
+        raise AssertionError(url)
+    if redact_url("https://www.example.org/feed?page=2") != "https://www.example.org/feed?page=2":
+        raise AssertionError
+
+    # recordings of redacted urls are served whatever the secret values
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter(ReplayArchive([RecordedExchange("GET", url, 200, {}, b"feed")])))
+    if session.get("https://api.example.org/feed?page=2&api_key=other&sig=x&access_token=y").text != "feed":
+        raise AssertionError
+
+
+def test_archive_recorder():
+    path = tempfile.mkdtemp()
+    recorder = ArchiveRecorder(path)
+    exchange = RecordedExchange("GET", "https://www.example.org/feed", 200, {}, b"feed", elapsed_ms=3)
+    recorder.add(exchange)
+    # written as soon as recorded
+    if not os.path.exists(os.path.join(path, exchange.get_body_name())) \
+            or _count_lines(os.path.join(path, RECORDING_INDEX)) != 1:
+        raise AssertionError
+
+    # exchanges already recorded, by this process or another one, are not appended again
+    other_process = ArchiveRecorder(path)
+    other_process.add(exchange)
+    other_process.add(RecordedExchange("GET", "https://www.example.org/other", 200, {}, b"other"))
+    recorder.add(RecordedExchange("GET", "https://www.example.org/other", 200, {}, b"other"))
+    recorder.add(exchange)
+    if _count_lines(os.path.join(path, RECORDING_INDEX)) != 2:
+        raise AssertionError
+    archive = ReplayArchive.load(path)
+    if [e.body for e in archive.get_exchanges()] != [b"feed", b"other"] or archive.get_exchanges()[0].elapsed_ms != 3:
+        raise AssertionError
+
+    # saving the archive writes its complete index
+    archive.save(path)
+    if os.path.exists(os.path.join(path, RECORDING_INDEX)) or len(ReplayArchive.load(path).get_exchanges()) != 2:
+        raise AssertionError
+
+
+def test_zip_archive_recording():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    path = os.path.join(tempfile.mkdtemp(), "traffic.zip")
+    try:
+        for paths in [["/feed?token=secret", "/first"], ["/first", "/second"]]:  # two runs of the server
+            recorder = ArchiveRecorder(path)
+            session = requests.Session()
+            session.mount("http://", RecordingAdapter(recorder))
+            for url_path in paths:
+                session.get(url + url_path, timeout=5)
+            recorder.pack()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # the zip archive keeps the previous recordings, without duplicates
+    exchanges = ReplayArchive.load(path).get_exchanges()
+    if sorted(exchange.url[len(url):] for exchange in exchanges) != ["/feed?token=%s" % REDACTED, "/first", "/second"]:
+        raise AssertionError
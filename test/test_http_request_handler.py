@@ -0,0 +1,50 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def test_persistent_connections():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, "config.ini")
+        with open(config_file, "w") as f:
+            f.write("server.listening_hostname=127.0.0.1\nserver.listening_port=%d\nserver.workers=1\n"
+                    "server.keepalive_max_requests=3\n" % port)
+        server = subprocess.Popen([sys.executable, "main.py", "-c", config_file],
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 10
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            for idx in range(3):
+                connection.request("GET", "/")
+                response = connection.getresponse()
+                body = response.read()
+                if response.version != 11 or response.status != 200 \
+                        or int(response.getheader("Content-Length", "-1")) != len(body) or len(body) == 0:
+                    raise AssertionError
+                # the same connection serves every request, the last one allowed closes it
+                if (idx < 2 and response.getheader("Connection") == "close") \
+                        or (idx == 2 and response.getheader("Connection") != "close"):
+                    raise AssertionError
+            connection.close()
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
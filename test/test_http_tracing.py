@@ -0,0 +1,81 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from utils.http_tracing import SLOW_CALLS_EVENT, TracingHTTPAdapter, UpstreamTrace, record_trace, trace_upstream_call
+from utils.metrics import Metrics
+
+BODY = b"<html>traced</html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # persistent connections
+
+    def do_GET(self):
+        time.sleep(0.05)
+        self.send_response(203)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("X-Cache", "HIT from proxy")
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def _trace(host: str, total_ms: float, status: int = 200, error: str = "") -> UpstreamTrace:
+    trace = UpstreamTrace("get", "https://%s/%d" % (host, total_ms), "test")
+    trace.status, trace.total_ms, trace.ttfb_ms, trace.response_bytes, trace.error = \
+        status, total_ms, total_ms / 2, 2048, error
+    return trace
+
+
+def test_record_trace():
+    metrics = Metrics.instance()
+    host = "record.tracing.test"
+    for total_ms in [10, 600, 700, 800]:
+        record_trace(_trace(host, total_ms), slow_threshold_ms=500, max_slow_calls=2)
+    record_trace(_trace(host, 900, status=0, error="ConnectTimeout"), slow_threshold_ms=1000, max_slow_calls=2)
+
+    if metrics.get_counter("upstream.requests", host=host, handler="test", outcome="200") != 4 \
+            or metrics.get_counter("upstream.requests", host=host, handler="test", outcome="ConnectTimeout") != 1:
+        raise AssertionError
+    total = metrics.get_histogram("upstream.total_ms", host=host)
+    ttfb = metrics.get_histogram("upstream.ttfb_ms", host=host)
+    if total is None or total.count != 5 or ttfb is None or ttfb.count != 4 \
+            or metrics.get_histogram("upstream.dns_ms", host=host) is not None:  # no new connection
+        raise AssertionError
+
+    # only the last slow calls are kept, failed calls faster than the threshold are not
+    if [event["url"] for event in metrics.get_events(SLOW_CALLS_EVENT)] != ["https://%s/700" % host,
+                                                                            "https://%s/800" % host]:
+        raise AssertionError
+
+
+def test_tracing_adapter():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d/page" % server.server_address[1]
+    session = requests.Session()
+    session.mount("http://", TracingHTTPAdapter())
+    try:
+        with trace_upstream_call("GET", url, 10000, 10) as trace:
+            trace.set_response(session.get(url))
+
+        if trace.status != 203 or trace.host != "127.0.0.1" or trace.ttfb_ms < 50 or trace.total_ms < trace.ttfb_ms \
+                or trace.response_bytes != len(BODY) or trace.cache != "HIT" or trace.new_connections != 1:
+            raise AssertionError(trace.to_dict())
+        if Metrics.instance().get_counter("upstream.cache", host="127.0.0.1", outcome="HIT") < 1:
+            raise AssertionError
+
+        # the connection is reused by the next call
+        with trace_upstream_call("GET", url, 10000, 10) as trace:
+            trace.set_response(session.get(url))
+        if trace.status != 203 or trace.new_connections != 0:
+            raise AssertionError(trace.to_dict())
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
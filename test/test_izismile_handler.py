@@ -0,0 +1,55 @@
+import threading
+import time
+from typing import List
+
+from cryptography.fernet import Fernet
+
+from pyrssw_handlers.izismile_handler import IzismileHandler
+
+FOLDER = "https://izismile.com/2025/10/13"
+NAME = "pics-300000.html"
+NB_PAGES = 5
+
+
+def _get_page(number: int) -> str:
+    pager = "".join('<a href="%s/page,%d,%s">%d</a>' % (FOLDER, n, NAME, n) for n in range(1, NB_PAGES + 1))
+    if number < NB_PAGES:
+        pager += '<a href="%s/page,%d,%s">next</a>' % (FOLDER, number + 1, NAME)
+    return """<html><body><h1>Pics</h1><div id="post-list">
+<div class="postpages">%s</div><div class="imgbox"><img src="https://izismile.com/img%d.jpg"/></div>
+<div class="postpages">%s</div></div></body></html>""" % (pager, number, pager)
+
+
+class FakeIzismileHandler(IzismileHandler):
+
+    def __init__(self) -> None:
+        super().__init__(Fernet(Fernet.generate_key()), "http://localhost:8001/izismile")
+        self.requested: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _get_page_from_url(self, url, session) -> str:
+        with self.lock:
+            self.requested.append(url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        number = int(url.split("page,")[1].split(",")[0]) if "page," in url else 1
+        return _get_page(number)
+
+
+def test_pipelined_pages():
+    handler = FakeIzismileHandler()
+    content = handler.get_content("%s/%s" % (FOLDER, NAME), {}, None).content  # type: ignore
+
+    # pages are assembled in order, each page once
+    positions = [content.find("img%d.jpg" % number) for number in range(1, NB_PAGES + 1)]
+    if -1 in positions or positions != sorted(positions):
+        raise AssertionError
+    if len(handler.requested) != NB_PAGES or len(set(handler.requested)) != NB_PAGES:
+        raise AssertionError
+    if handler.max_in_flight < 2:
+        raise AssertionError
@@ -1,5 +1,7 @@
 
-from utils.json_utils import get_nodes_by_name
+import json
+
+from utils.json_utils import JSONIndex, find_nodes_by_name, get_nodes_by_name, query_nodes
 
 
 def test_get_nodes_by_name():
@@ -45,3 +47,42 @@ def test_get_nodes_by_name():
         raise AssertionError
     if nodes[1]["title"] != "this is my 2nd article":
         raise AssertionError
+
+
+def test_json_index():
+    _json = {
+        "tree": {
+            "article": {"article": "nested article", "url": "https://example.com/1"},
+            "children": [
+                {"article": "this is my 2nd article"},
+                [{"url": "https://example.com/2"}]
+            ]
+        }
+    }
+    index = JSONIndex(_json)
+
+    if index.get_nodes_by_name("article") != get_nodes_by_name(_json, "article"):
+        raise AssertionError
+    if index.get_nodes_by_name("url") != ["https://example.com/1", "https://example.com/2"]:
+        raise AssertionError
+    if index.get_nodes_by_name("unknown") != []:
+        raise AssertionError
+    if index.query("tree.children.1.0.url") != ["https://example.com/2"]:
+        raise AssertionError
+    if index.query("..article.url") != ["https://example.com/1"]:
+        raise AssertionError
+    if query_nodes(_json, "tree.children.*.article") != ["this is my 2nd article"]:
+        raise AssertionError
+    if index.query_first("tree.unknown") is not None:
+        raise AssertionError
+
+
+def test_find_nodes_by_name():
+    text = '{"a": {"article": {"article": 1}}, "b": "\\"article\\": 2", "c": [{"article" : [3]}, {"article": 4}]}'
+
+    if find_nodes_by_name(text, "article") != get_nodes_by_name(json.loads(text), "article"):
+        raise AssertionError
+    if find_nodes_by_name(text, "article", 2) != [{"article": 1}, [3]]:
+        raise AssertionError
+    if find_nodes_by_name(text, "unknown") != []:
+        raise AssertionError
@@ -0,0 +1,56 @@
+from benchmarks.load_generator import LoadTest, build_report, parse_mix, percentile
+
+
+def test_parse_mix():
+    if parse_mix("rss=45, content=45,thumbnail=0,help=10") != {"rss": 45, "content": 45, "thumbnail": 0, "help": 10}:
+        raise AssertionError
+
+    for mix in ["rss=50,feed=50", "rss=fifty", "rss=-5", "rss", "rss=0,help=0"]:
+        try:
+            parse_mix(mix)
+            raise AssertionError(mix)
+        except ValueError:
+            pass
+
+
+def test_percentile():
+    if percentile([], 50) != 0:
+        raise AssertionError
+    if [percentile([12.5], p) for p in [0, 50, 99, 100]] != [12.5, 12.5, 12.5, 12.5]:
+        raise AssertionError
+    if [percentile([10, 20], p) for p in [50, 51, 95, 100]] != [10, 20, 20, 20]:
+        raise AssertionError
+    # the rank is rounded up, not to the nearest integer
+    if percentile([float(value) for value in range(1, 11)], 91) != 10 or percentile([1.0] * 99 + [2.0], 99.5) != 2:
+        raise AssertionError
+
+    ordered = [float(value) for value in range(1, 101)]
+    if [percentile(ordered, p) for p in [1, 50, 95, 99, 100]] != [1, 50, 95, 99, 100]:
+        raise AssertionError
+
+
+def _worker_report(worker: int, latencies: dict, errors: dict, cpu_s: float) -> dict:
+    return {"worker": worker, "pid": 1000 + worker, "elapsed_s": 2.0, "cpu_s": cpu_s, "max_rss_mb": 50.0,
+            "latencies": dict({"rss": [], "content": [], "thumbnail": [], "help": []}, **latencies),
+            "errors": dict({"rss": 0, "content": 0, "thumbnail": 0, "help": 0}, **errors)}
+
+
+def test_build_report():
+    reports = [_worker_report(0, {"rss": [10, 20, 30], "help": [1]}, {"rss": 1}, cpu_s=1.0),
+               _worker_report(1, {"rss": [40], "content": [100, 200]}, {"content": 2}, cpu_s=0.5)]
+    report = build_report(LoadTest(mix="rss=1,content=1"), reports, elapsed_s=2.0)
+
+    if report["requests"] != 7 or report["errors"] != 3 or report["throughput_rps"] != 3.5 \
+            or report["latency_ms"]["max"] != 200 or report["load_test"]["mix"] != {"rss": 1, "content": 1}:
+        raise AssertionError
+    # routes without requests are not reported
+    if sorted(report["routes"]) != ["content", "help", "rss"]:
+        raise AssertionError
+    if report["routes"]["rss"] != {"p50": 20, "p95": 40, "p99": 40, "max": 40, "requests": 4, "errors": 1} \
+            or report["routes"]["content"]["requests"] != 2 or report["routes"]["content"]["errors"] != 2:
+        raise AssertionError
+    if [(w["requests"], w["cpu_percent"]) for w in report["workers"]] != [(4, 50.0), (3, 25.0)]:
+        raise AssertionError
+
+    if build_report(LoadTest(), [], elapsed_s=0)["throughput_rps"] != 0:
+        raise AssertionError
@@ -0,0 +1,80 @@
+from utils.metrics import SIZE_BUCKETS_BYTES, Histogram, Metrics
+
+
+def test_percentile():
+    histogram = Histogram()
+    if histogram.percentile(50) != 0 or histogram.to_dict()["avg"] != 0:
+        raise AssertionError
+
+    # one value: every percentile is the value, not the upper bound of its bucket
+    histogram.observe(7)
+    if [histogram.percentile(p) for p in [0, 50, 100]] != [7, 7, 7]:
+        raise AssertionError
+
+    # a value equal to an upper bound belongs to that bucket, values above the last bound to the unbounded one
+    histogram = Histogram()
+    histogram.observe(5)
+    if histogram.counts[0] != 1 or histogram.percentile(99) != 5:
+        raise AssertionError
+    histogram.observe(45000)
+    if histogram.counts[-1] != 1 or histogram.percentile(100) != 45000 or histogram.percentile(50) != 5:
+        raise AssertionError
+
+    # 9 fast values and a slow one
+    histogram = Histogram()
+    for _ in range(9):
+        histogram.observe(3)
+    histogram.observe(400)
+    if histogram.percentile(50) != 5 or histogram.percentile(90) != 5 or histogram.percentile(95) != 400 \
+            or histogram.to_dict()["buckets"]["500"] != 1 or histogram.to_dict()["max"] != 400:
+        raise AssertionError
+
+    histogram = Histogram(SIZE_BUCKETS_BYTES)
+    histogram.observe(2048)
+    if histogram.to_dict()["buckets"][str(10 * 1024)] != 1:
+        raise AssertionError
+
+
+def test_metrics():
+    metrics = Metrics._cls()
+    metrics.increment("test.requests", handler="a", outcome="200")
+    metrics.increment("test.requests", 2, outcome="200", handler="a")  # labels order does not matter
+    metrics.increment("test.requests", handler="b", outcome="200")
+    metrics.increment("other.requests")
+    if metrics.get_counter("test.requests", handler="a", outcome="200") != 3 \
+            or metrics.get_counter("test.requests", handler="b", outcome="200") != 1 \
+            or metrics.get_counter("test.requests", handler="a") != 0 \
+            or metrics.get_counter("other.requests") != 1 or metrics.get_counter("unknown") != 0:
+        raise AssertionError
+
+    # gauges keep the last value
+    metrics.set_gauge("test.pending", 4, pool="cpu")
+    metrics.set_gauge("test.pending", 2, pool="cpu")
+    metrics.observe("test.duration_ms", 12, status=200)  # label values are converted to strings
+    histogram = metrics.get_histogram("test.duration_ms", status="200")
+    if histogram is None or histogram.count != 1 or metrics.get_histogram("test.duration_ms") is not None:
+        raise AssertionError
+
+    snapshot = metrics.snapshot("test.")
+    if sorted(snapshot["counters"]) != ["test.requests"] \
+            or {"labels": {"handler": "b", "outcome": "200"}, "value": 1} not in snapshot["counters"]["test.requests"] \
+            or snapshot["gauges"]["test.pending"] != [{"labels": {"pool": "cpu"}, "value": 2}] \
+            or snapshot["histograms"]["test.duration_ms"][0]["value"]["count"] != 1:
+        raise AssertionError
+
+    metrics.reset()
+    if metrics.get_counter("test.requests", handler="a", outcome="200") != 0 or metrics.snapshot()["gauges"] != {}:
+        raise AssertionError
+
+
+def test_events():
+    metrics = Metrics._cls()
+    for i in range(5):
+        metrics.record_event("test.events", {"id": i}, max_events=3)
+    if [event["id"] for event in metrics.get_events("test.events")] != [2, 3, 4]:
+        raise AssertionError
+
+    # a smaller ring buffer keeps the last events
+    metrics.record_event("test.events", {"id": 5}, max_events=2)
+    if [event["id"] for event in metrics.get_events("test.events")] != [4, 5] or metrics.get_events("unknown") != []:
+        raise AssertionError
@@ -0,0 +1,123 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from config.config import Config
+from server.prefork_server import PreforkServer, is_prefork_supported
+from server.pyrssw_server import get_ssl_context
+
+
+def _get_children(pid: int) -> List[int]:
+    with open("/proc/%d/task/%d/children" % (pid, pid)) as f:
+        return [int(child) for child in f.read().split()]
+
+
+def _wait_for(condition, timeout_s: float = 10) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return True
+        except (OSError, requests.exceptions.RequestException):
+            pass
+        time.sleep(0.1)
+
+    return False
+
+
+def _write_certificate(cert_file: str, key_file: str):
+    """Self-signed certificate of localhost"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(now + timedelta(days=1)) \
+        .sign(key, hashes.SHA256())
+    with open(cert_file, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+
+
+def test_reload_certificate():
+    config = Config.instance()
+    configuration, config_file = config._get_configuration(), config.config_file
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        _write_certificate(cert_file, key_file)
+        with open(os.path.join(directory, "config.ini"), "w") as f:
+            f.write("server.workers=1\nserver.certfile=%s\nserver.keyfile=%s\n" % (cert_file, key_file))
+        server = PreforkServer(1)
+        server._spawn_worker = lambda: None  # type: ignore
+        try:
+            config.load_config_file(os.path.join(directory, "config.ini"))
+            server._preload()
+            context = get_ssl_context(cert_file, key_file)
+
+            # the renewed certificate is loaded by the reload
+            _write_certificate(cert_file, key_file)
+            server._reload()
+            if get_ssl_context(cert_file, key_file) is context:
+                raise AssertionError
+        finally:
+            config.configuration, config.config_file = configuration, config_file
+            get_ssl_context.cache_clear()
+
+
+def test_prefork_server():
+    if not is_prefork_supported() or not os.path.isdir("/proc/self/task"):
+        return
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, "config.ini")
+        with open(config_file, "w") as f:
+            f.write("server.listening_hostname=127.0.0.1\nserver.listening_port=%d\nserver.workers=2\n"
+                    "server.graceful_timeout_s=5\n" % port)
+        master = subprocess.Popen([sys.executable, "main.py", "-c", config_file],
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = "http://127.0.0.1:%d/" % port
+        try:
+            if not _wait_for(lambda: len(_get_children(master.pid)) == 2
+                             and requests.get(url, timeout=5).status_code == 200):
+                raise AssertionError
+
+            # a worker which exits is restarted
+            workers = _get_children(master.pid)
+            os.kill(workers[0], signal.SIGKILL)
+            if not _wait_for(lambda: len(set(_get_children(master.pid)) - set(workers)) == 1
+                             and len(_get_children(master.pid)) == 2):
+                raise AssertionError
+
+            # reloaded workers replace the previous ones
+            workers = _get_children(master.pid)
+            master.send_signal(signal.SIGHUP)
+            if not _wait_for(lambda: len(set(_get_children(master.pid)) & set(workers)) == 0
+                             and len(_get_children(master.pid)) == 2
+                             and requests.get(url, timeout=5).status_code == 200):
+                raise AssertionError
+
+            master.send_signal(signal.SIGTERM)
+            if master.wait(timeout=10) != 0:
+                raise AssertionError
+        finally:
+            if master.poll() is None:
+                master.kill()
@@ -0,0 +1,141 @@
+import json
+import os
+import pstats
+import tempfile
+import time
+import types
+from collections import deque
+
+from cryptography.fernet import Fernet
+
+from config.config import PROFILING_SAMPLE_RATE_KEY, SERVER_DEBUG_ENDPOINTS_KEY, Config
+from handlers.debug_handler import DebugHandler
+from handlers.launcher_handler import LauncherHandler
+from pyrssw_handlers.abstract_pyrssw_request_handler import ENCRYPTED_PREFIX
+from utils import profiling
+from utils.profiling import Profiler
+
+
+def _set_properties(properties: dict) -> dict:
+    """Set configuration properties, returns the previous values (None: not set)"""
+    configuration = Config.instance()._get_configuration()
+    previous = {key: configuration.get(key) for key in properties}
+    for key, value in properties.items():
+        if value is None:
+            configuration.pop(key, None)
+        else:
+            configuration[key] = value
+
+    return previous
+
+
+def _busy_work() -> str:
+    started = time.perf_counter()
+    while time.perf_counter() - started < 0.05:
+        sum(range(1000))
+
+    return "done"
+
+
+class _RunningProfile:
+    """cProfile.Profile of python >= 3.12 when another profiler is already running"""
+
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+
+def test_sampling():
+    profiler = Profiler.instance()
+    previous = _set_properties({PROFILING_SAMPLE_RATE_KEY: "0", "%s.sampled" % PROFILING_SAMPLE_RATE_KEY: "3"})
+    try:
+        if [profiler.is_sampled("sampled") for _ in range(6)] != [False, False, True, False, False, True]:
+            raise AssertionError
+        if any(profiler.is_sampled("not_sampled") for _ in range(6)):
+            raise AssertionError
+    finally:
+        _set_properties(previous)
+
+
+def test_profile():
+    profiler = Profiler.instance()
+    profiles = profiler._profiles
+    profiler._profiles = deque(maxlen=2)
+    try:
+        if profiler.profile("test", "/test/rss", "sampled", _busy_work) != "done":
+            raise AssertionError
+        profile = profiler.get_profiles()[-1]
+        if profile.handler != "test" or profile.reason != "sampled" or profile.duration_ms < 50 \
+                or profiler.get_profile(profile.profile_id) is not profile or "_busy_work" not in profile.folded:
+            raise AssertionError
+
+        # the pstats dump can be loaded by pstats
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.pstats")
+            with open(path, "wb") as f:
+                f.write(profile.pstats)
+            if not any(function[2] == "_busy_work" for function in pstats.Stats(path).stats):  # type: ignore
+                raise AssertionError
+
+        # only the last profiles are kept
+        for i in range(2):
+            profiler.profile("test", "/test/%d" % i, "requested", lambda: None)
+        if [p.url for p in profiler.get_profiles()] != ["/test/0", "/test/1"] \
+                or profiler.get_profile(profile.profile_id) is not None:
+            raise AssertionError
+
+        # another profiler is already running (python >= 3.12): only the stacks are sampled
+        previous_cprofile = profiling.cProfile
+        profiling.cProfile = types.SimpleNamespace(Profile=_RunningProfile)  # type: ignore
+        try:
+            if profiler.profile("test", "/test/nested", "sampled", lambda: "result") != "result":
+                raise AssertionError
+        finally:
+            profiling.cProfile = previous_cprofile
+        if profiler.get_profiles()[-1].url != "/test/nested" or profiler.get_profiles()[-1].pstats != b"":
+            raise AssertionError
+    finally:
+        profiler._profiles = profiles
+
+
+def test_profile_requested():
+    key = Fernet.generate_key()
+    handler = LauncherHandler.__new__(LauncherHandler)
+    handler.fernet = Fernet(key)
+    for url, requested in [("/test/rss?profile=true", False),
+                           ("/test/rss", False),
+                           ("/test/rss?profile=%s%s" % (ENCRYPTED_PREFIX, Fernet(key).encrypt(b"true").decode()), True),
+                           ("/test/rss?profile=%s%s" % (ENCRYPTED_PREFIX, Fernet(Fernet.generate_key()).encrypt(
+                               b"true").decode()), False)]:
+        handler.url = url
+        if handler._is_profile_requested() != requested:
+            raise AssertionError(url)
+
+
+def test_profiles_endpoints():
+    profiler = Profiler.instance()
+    profiles = profiler._profiles
+    profiler._profiles = deque(maxlen=2)
+    previous = _set_properties({SERVER_DEBUG_ENDPOINTS_KEY: "true"})
+    try:
+        profiler.profile("test", "/test/rss", "requested", _busy_work)
+        profile = profiler.get_profiles()[-1]
+
+        listed = json.loads(DebugHandler("/profiles", None).contents)
+        if [p["id"] for p in listed] != [profile.profile_id] or listed[0]["pstats_size"] != len(profile.pstats):
+            raise AssertionError
+        handler = DebugHandler("/profiles/%s.pstats" % profile.profile_id, None)
+        if handler.get_status() != 200 or handler.contents != profile.pstats:
+            raise AssertionError
+        handler = DebugHandler("/profiles/%s.folded" % profile.profile_id, None)
+        if handler.get_status() != 200 or handler.contents != profile.folded:
+            raise AssertionError
+        for path in ["/profiles/%s.txt" % profile.profile_id, "/profiles/unknown.pstats"]:
+            if DebugHandler(path, None).get_status() != 404:
+                raise AssertionError(path)
+
+        _set_properties({SERVER_DEBUG_ENDPOINTS_KEY: "false"})
+        if DebugHandler("/profiles", None).get_status() != 404:
+            raise AssertionError
+    finally:
+        _set_properties(previous)
+        profiler._profiles = profiles
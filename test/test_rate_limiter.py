@@ -0,0 +1,81 @@
+import tempfile
+from http.cookies import SimpleCookie
+
+from config.config import RATELIMIT_CLIENT_KEY, Config
+from handlers.rate_limited_handler import RateLimitedHandler
+from server.pyrssw_wsgi import WSGILauncherHandler
+from utils.rate_limiter import RateLimiter, get_client_key
+
+
+def test_rate_limiter():
+    limiter = RateLimiter.instance()
+    quotas, shared_dir = dict(limiter._quotas), limiter.shared_dir
+    directory = tempfile.TemporaryDirectory()
+    try:
+        limiter._quotas[("lequipe", "rss")] = (1, 2)  # 1 request per minute, bursts of 2
+        for limiter.shared_dir in ["", directory.name]:
+            client = get_client_key("10.0.0.1", None)
+            if [limiter.allow(client, "lequipe", "rss")[0] for _ in range(3)] != [True, True, False]:
+                raise AssertionError
+            allowed, retry_after = limiter.allow(client, "lequipe", "rss")
+            if allowed or not 0 < retry_after <= 60:
+                raise AssertionError
+            # other clients and routes have their own buckets
+            if not limiter.allow(get_client_key("10.0.0.2", None), "lequipe", "rss")[0] \
+                    or not limiter.allow(client, "lequipe", "content")[0]:
+                raise AssertionError
+
+        # requests over the limit are answered without invoking the handlers
+        limiter.shared_dir = ""
+        limiter._quotas[("", "other")] = (1, 1)
+        launcher = WSGILauncherHandler("/", "http://localhost", "10.0.0.3")
+        if isinstance(launcher.get_handler(SimpleCookie(), ""), RateLimitedHandler):
+            raise AssertionError
+        handler = launcher.get_handler(SimpleCookie(), "")
+        if not isinstance(handler, RateLimitedHandler) or handler.get_status() != 429 \
+                or int(handler.get_headers()["Retry-After"]) <= 0:
+            raise AssertionError
+    finally:
+        limiter._quotas, limiter.shared_dir = quotas, shared_dir
+        directory.cleanup()
+
+
+def test_rate_limiter_sessions():
+    limiter = RateLimiter.instance()
+    configuration = Config.instance()._get_configuration()
+    quotas, shared_dir, factor = dict(limiter._quotas), limiter.shared_dir, limiter.session_ip_factor
+    client_mode = configuration.get(RATELIMIT_CLIENT_KEY)
+    directory = tempfile.TemporaryDirectory()
+    try:
+        configuration[RATELIMIT_CLIENT_KEY] = "session"
+        limiter.shared_dir, limiter.session_ip_factor = "", 2
+        limiter._quotas[("lemonde", "rss")] = (1, 2)
+        # readers behind the same address have their own buckets
+        for session_id in ["1", "2"]:
+            client = get_client_key("10.0.1.1", session_id)
+            if [limiter.allow(client, "lemonde", "rss", "10.0.1.1")[0] for _ in range(3)] != [True, True, False]:
+                raise AssertionError
+        # but a client sending new session cookies does not get fresh buckets: its address is limited too
+        if limiter.allow(get_client_key("10.0.1.1", "3"), "lemonde", "rss", "10.0.1.1")[0]:
+            raise AssertionError
+        if not limiter.allow(get_client_key("10.0.1.2", "3"), "lemonde", "rss", "10.0.1.2")[0]:
+            raise AssertionError
+
+        # the requests refused because of the address do not spend the tokens of the session
+        for limiter.shared_dir in ["", directory.name]:
+            session_id = "4" if limiter.shared_dir == "" else "5"
+            for reader in range(4):  # the address quota is used up by other readers
+                limiter.allow(get_client_key("10.0.1.1", "%s.%d" % (session_id, reader)), "lemonde", "rss", "10.0.1.1")
+            for _ in range(3):
+                if limiter.allow(get_client_key("10.0.1.1", session_id), "lemonde", "rss", "10.0.1.1")[0]:
+                    raise AssertionError
+            client = get_client_key("10.0.1.3", session_id)
+            if [limiter.allow(client, "lemonde", "rss", "10.0.1.3")[0] for _ in range(3)] != [True, True, False]:
+                raise AssertionError
+    finally:
+        limiter._quotas, limiter.shared_dir, limiter.session_ip_factor = quotas, shared_dir, factor
+        directory.cleanup()
+        if client_mode is None:
+            configuration.pop(RATELIMIT_CLIENT_KEY, None)
+        else:
+            configuration[RATELIMIT_CLIENT_KEY] = client_mode
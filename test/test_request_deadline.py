@@ -0,0 +1,32 @@
+import time
+
+import requests
+
+from utils.http_client import DeadlineExceededError, fit_timeout_in_deadline
+from utils.request_context import get_remaining_time, is_deadline_exceeded, reset_deadline, set_deadline
+
+
+def test_request_deadline():
+    request = requests.Request("GET", "https://www.example.org/").prepare()
+    if get_remaining_time() is not None or fit_timeout_in_deadline(request, 10) != (10, False):
+        raise AssertionError
+
+    token = set_deadline(0.2)
+    try:
+        timeout, shortened = fit_timeout_in_deadline(request, (5, 30))
+        if not shortened or timeout[0] > 0.2 or timeout[1] > 0.2:
+            raise AssertionError
+
+        time.sleep(0.25)
+        if not is_deadline_exceeded():
+            raise AssertionError
+        try:
+            fit_timeout_in_deadline(request, 10)
+            raise AssertionError
+        except DeadlineExceededError:
+            pass
+    finally:
+        reset_deadline(token)
+
+    if get_remaining_time() is not None:
+        raise AssertionError
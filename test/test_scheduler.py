@@ -0,0 +1,111 @@
+import threading
+import time
+
+from config.config import SCHEDULING_RESERVED_KEY, SCHEDULING_SLOTS_KEY, Config
+from utils.metrics import Metrics
+from utils.scheduler import BULK, FEED, INTERACTIVE, OverloadedError, PriorityScheduler, _FairQueue, _Waiter, parse_clients
+
+
+def _wait_for(condition, timeout_s: float = 5) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+
+    return False
+
+
+def test_priority_scheduling():
+    scheduler = PriorityScheduler.instance()
+    settings = (scheduler.slots, scheduler.bulk_clients, dict(scheduler.reserved), dict(scheduler.queue_sizes))
+    scheduler.slots = 2
+    scheduler.reserved[INTERACTIVE] = 1
+    scheduler.queue_sizes[FEED] = 1
+    scheduler.bulk_clients = []
+    granted = []
+    try:
+        if scheduler.classify(False, "10.0.0.1") != INTERACTIVE or scheduler.classify(True, "10.0.0.1") != FEED:
+            raise AssertionError
+
+        # the second slot is reserved for content pages
+        if not scheduler.try_acquire(FEED) or scheduler.try_acquire(FEED) or not scheduler.try_acquire(INTERACTIVE):
+            raise AssertionError
+
+        # feeds wait in a bounded queue
+        feed = threading.Thread(target=lambda: (scheduler.acquire(FEED), granted.append(FEED)))
+        feed.start()
+        if not _wait_for(lambda: len(scheduler._queues[FEED]) == 1):
+            raise AssertionError
+        try:
+            scheduler.acquire(FEED)
+            raise AssertionError
+        except OverloadedError:
+            pass
+
+        # a freed slot goes to the content page first, even if the feed waits since longer
+        content = threading.Thread(target=lambda: (scheduler.acquire(INTERACTIVE), granted.append(INTERACTIVE)))
+        content.start()
+        if not _wait_for(lambda: len(scheduler._queues[INTERACTIVE]) == 1):
+            raise AssertionError
+        scheduler.release()
+        content.join(5)
+        if granted != [INTERACTIVE]:
+            raise AssertionError
+        scheduler.release()
+        scheduler.release()
+        feed.join(5)
+        if granted != [INTERACTIVE, FEED] or scheduler.active != 1:
+            raise AssertionError
+        scheduler.release()
+
+        # bulk clients give up quickly
+        scheduler.bulk_clients = parse_clients("192.168.0.0/16,invalid")
+        if scheduler.classify(True, "192.168.1.12") != BULK:
+            raise AssertionError
+        scheduler.try_acquire(INTERACTIVE)
+        started = time.monotonic()
+        try:
+            scheduler.acquire(BULK, remaining_time=0.1)
+            raise AssertionError
+        except OverloadedError:
+            pass
+        if time.monotonic() - started > 1 \
+                or Metrics.instance().get_counter("scheduler.requests", priority=BULK, outcome="timeout") < 1:
+            raise AssertionError
+        scheduler.release()
+    finally:
+        scheduler.slots, scheduler.bulk_clients, scheduler.reserved, scheduler.queue_sizes = settings
+        scheduler.active = 0
+
+
+def test_fair_queuing():
+    queue = _FairQueue()
+    for client in ["a", "a", "a", "b", "c", "b"]:
+        queue.append(_Waiter(client))
+    if queue.count("a") != 3 or len(queue) != 6:
+        raise AssertionError
+    # clients are served in turn
+    if [queue.popleft().client for _ in range(6)] != ["a", "b", "c", "a", "b", "a"] or len(queue) != 0:
+        raise AssertionError
+
+
+def test_reserved_slots_clamped():
+    configuration = Config.instance()._get_configuration()
+    properties = {SCHEDULING_SLOTS_KEY: "2", "%s.%s" % (SCHEDULING_RESERVED_KEY, INTERACTIVE): "2",
+                  "%s.%s" % (SCHEDULING_RESERVED_KEY, FEED): "1"}
+    previous = {key: configuration.get(key) for key in properties}
+    configuration.update(properties)
+    try:
+        # slots=2 with 2 slots reserved for content pages: feeds would never start
+        scheduler = PriorityScheduler._cls()
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                configuration.pop(key, None)
+            else:
+                configuration[key] = value
+    if scheduler.reserved[INTERACTIVE] != 1 or scheduler.reserved[FEED] != 0:
+        raise AssertionError(scheduler.reserved)
+    if not scheduler.try_acquire(BULK) or scheduler.try_acquire(FEED) or not scheduler.try_acquire(INTERACTIVE):
+        raise AssertionError
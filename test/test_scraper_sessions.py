@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+
+from utils.http_replay import RecordedExchange, ReplayAdapter, ReplayArchive
+from utils.scraper_sessions import ScraperSessions
+
+CLEARANCE_URL = "https://www.example.org/challenge"
+PAGE_URL = "https://www.example.org/page"
+
+
+def _create_pool(cookies_dir: str, adapter: ReplayAdapter):
+    pool = ScraperSessions._cls()  # a new pool is like a new process
+    pool.cookies_dir = cookies_dir
+    pool.set_transport_adapter(adapter)
+    return pool
+
+
+def test_scraper_sessions():
+    archive = ReplayArchive()
+    archive.add(RecordedExchange("GET", CLEARANCE_URL, 200, {
+        "Set-Cookie": "cf_clearance=cleared; Max-Age=3600; Path=/; Domain=www.example.org"}, b"cleared"))
+    archive.add(RecordedExchange("GET", PAGE_URL, 200, {}, b"page"))
+    adapter = ReplayAdapter(archive)
+    cookies_dir = tempfile.mkdtemp()
+
+    pool = _create_pool(cookies_dir, adapter)
+    with pool.session(CLEARANCE_URL) as session:
+        session.get(CLEARANCE_URL)
+        user_agent = session.headers["User-Agent"]
+    with pool.session(PAGE_URL) as reused_session:
+        if reused_session is not session:
+            raise AssertionError
+
+    # the clearance and its user agent are reused by the sessions of another process
+    with _create_pool(cookies_dir, adapter).session(PAGE_URL) as other_session:
+        if other_session.cookies.get("cf_clearance") != "cleared" or other_session.headers["User-Agent"] != user_agent:
+            raise AssertionError
+        if other_session.get(PAGE_URL).text != "page":
+            raise AssertionError
+
+    # the clearance is stored as JSON
+    with open(os.path.join(cookies_dir, "www.example.org.json")) as f:
+        if json.load(f)["user_agent"] != user_agent:
+            raise AssertionError
+
+
+def test_scraper_sessions_private_directory():
+    archive = ReplayArchive()
+    archive.add(RecordedExchange("GET", CLEARANCE_URL, 200, {
+        "Set-Cookie": "cf_clearance=cleared; Max-Age=3600; Path=/; Domain=www.example.org"}, b"cleared"))
+    cookies_dir = os.path.join(tempfile.mkdtemp(), "cookies")
+    pool = _create_pool(cookies_dir, ReplayAdapter(archive))
+    with pool.session(CLEARANCE_URL) as session:
+        session.get(CLEARANCE_URL)
+    if os.stat(cookies_dir).st_mode & 0o777 != 0o700:
+        raise AssertionError
+
+    # without directory, nothing is persisted
+    pool = _create_pool("", ReplayAdapter(archive))
+    with pool.session(CLEARANCE_URL) as session:
+        session.get(CLEARANCE_URL)
+    with _create_pool("", ReplayAdapter(archive)).session(CLEARANCE_URL) as other_session:
+        if other_session.cookies.get("cf_clearance") is not None:
+            raise AssertionError
+
+
+def test_scraper_sessions_foreign_file():
+    if not hasattr(os, "getuid") or os.getuid() != 0:
+        return  # changing the owner of a file needs root
+    cookies_dir = tempfile.mkdtemp()
+    path = os.path.join(cookies_dir, "www.example.org.json")
+    with open(path, "w") as f:
+        json.dump({"user_agent": "planted", "cookies": []}, f)
+    os.chown(path, 65534, 65534)
+    with _create_pool(cookies_dir, ReplayAdapter(ReplayArchive())).session(PAGE_URL) as session:
+        if session.headers["User-Agent"] == "planted":
+            raise AssertionError
@@ -0,0 +1,51 @@
+import multiprocessing
+import tempfile
+import threading
+import time
+
+from utils.single_flight import FileLockSingleFlight, SingleFlight
+
+
+def test_single_flight():
+    single_flight = SingleFlight("test")
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "feed"
+
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if len(calls) != 1 or results != ["feed"] * 5:
+        raise AssertionError
+    if single_flight.do("key", lambda: "computed again") != "computed again":
+        raise AssertionError
+
+
+def _compute_in_process(directory: str, results):
+    def compute():
+        time.sleep(0.5)
+        return "computed by %d" % multiprocessing.current_process().pid
+
+    results.put(FileLockSingleFlight("test", directory).do("key", compute))
+
+
+def test_file_lock_single_flight():
+    directory = tempfile.mkdtemp()
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=_compute_in_process, args=(directory, results)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    values = [results.get(timeout=10) for _ in processes]
+    for process in processes:
+        process.join()
+
+    if len(set(values)) != 1:
+        raise AssertionError(values)
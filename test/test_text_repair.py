@@ -0,0 +1,61 @@
+from lxml import etree
+
+from utils.text_repair import FULL, OFF, SELECTIVE, is_mojibake_likely, repair_dom, repair_text
+
+# (text as served, expected text): UTF-8 texts decoded as latin-1 or cp1252 are repaired
+MOJIBAKE_CORPUS = [
+    ("Ã‰tÃ© Ã  la plage", "Été à la plage"),
+    ("lâ€™Ã©quipe de France", "l’équipe de France"),
+    ("Ã§a commence Ã  12â‚¬", "ça commence à 12€"),
+    ("Â« Citation Â»", "« Citation »"),
+    ("ZoÃ« et NoÃ«l", "Zoë et Noël"),
+    ("naÃ¯ve cafÃ©", "naïve café"),
+    ("Ð¿Ñ€Ð¸Ð²ÐµÑ‚", "привет"),
+    ("â€œquotedâ€\x9d", "“quoted”"),
+]
+
+# texts which must be left as is, curly quotes included
+CLEAN_CORPUS = [
+    "plain ascii text",
+    "L’équipe « été » à Noël",
+    "voilà !",
+    "Straße, naïve, café, ÇA",
+    "“quoted” — em dash… 12 €",
+    "привет, 你好",
+    "Le café\xa0! Voilà\xa0: été",
+    "à\xa0Paris",
+    "Élysée\xa0; ÉTÉ\xa0?",
+]
+
+
+def test_repair_text():
+    for text, expected in MOJIBAKE_CORPUS:
+        if not is_mojibake_likely(text) or repair_text(text) != expected:
+            raise AssertionError("%s: %s" % (text, repair_text(text)))
+
+    for text in CLEAN_CORPUS:
+        if repair_text(text) != text:
+            raise AssertionError(text)
+
+    if repair_text("Ã©tÃ©", OFF) != "Ã©tÃ©":
+        raise AssertionError
+    if repair_text("“quoted”", FULL) != '"quoted"':
+        raise AssertionError
+
+
+def test_repair_dom():
+    dom = etree.HTML('<html><body><p title="lâ€™Ã©tÃ©">Ã‰tÃ© <b>Â« Citation Â»</b> &amp;eacute; “clean”</p></body></html>')
+
+    if repair_dom(dom, SELECTIVE) != 3:
+        raise AssertionError
+    p = dom.xpath("//p")[0]
+    if p.get("title") != "l’été" or p.text != "Été " or p.xpath("./b")[0].text != "« Citation »":
+        raise AssertionError
+    if p.xpath("./b")[0].tail != " &eacute; “clean”":  # entities are not decoded twice, quotes are kept
+        raise AssertionError
+
+    clean = etree.HTML("<p>L’équipe « été »</p>")
+    if repair_dom(clean, SELECTIVE) != 0 or clean.xpath("//p")[0].text != "L’équipe « été »":
+        raise AssertionError
+    if repair_dom(etree.HTML("<p>Ã©tÃ©</p>"), OFF) != 0:
+        raise AssertionError
@@ -0,0 +1,164 @@
+"""Async HTTP session of the handlers implementing the async contract (get_feed_async / get_content_async of
+PyRSSWRequestHandler), so that a handler can overlap its own upstream calls (ie: asyncio.gather) without threads.
+
+The session has the same timeout defaults as HTTPSession (http.timeout and http.connect_timeout), fits its
+timeouts in the deadline of the current request, traces its calls and uses the circuit breakers of the hosts.
+It relies on httpx (see requirements.txt): when httpx is not installed, when async handlers are disabled
+(http.async.enabled=false) or when upstream calls are recorded or replayed (http.transport.mode, only supported
+by HTTPSession), handlers are run through their sync contract.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+from urllib.parse import urlparse
+
+from config.config import (DEFAULT_HTTP_CONNECT_TIMEOUT, DEFAULT_HTTP_TIMEOUT, HTTP_ASYNC_ENABLED_KEY,
+                           HTTP_CONNECT_TIMEOUT_KEY, HTTP_TIMEOUT_KEY, HTTP_TRACE_SLOW_CALLS_KEY,
+                           HTTP_TRACE_SLOW_THRESHOLD_KEY, HTTP_TRANSPORT_MODE_KEY, Config)
+from utils.circuit_breaker import CircuitBreakers, is_failure_status
+from utils.http_client import DeadlineExceededError, HTTPSession
+from utils.http_replay import TRANSPORT_LIVE, TRANSPORT_MODE_ENV
+from utils.http_tracing import trace_upstream_call
+from utils.request_context import get_remaining_time, is_deadline_exceeded
+
+try:
+    import httpx
+except ImportError:  # optional dependency: handlers are run through their sync contract
+    httpx = None  # type: ignore
+
+T = TypeVar("T")
+
+USER_AGENT = "Mozilla/5.0 (compatible; pyrssw/1.0)"
+
+
+def is_async_enabled() -> bool:
+    """True when handlers can be run through their async contract"""
+    config = Config.instance()
+    transport_mode = os.environ.get(TRANSPORT_MODE_ENV, config.get_property(HTTP_TRANSPORT_MODE_KEY, TRANSPORT_LIVE))
+    return httpx is not None and config.get_bool_property(HTTP_ASYNC_ENABLED_KEY, True) \
+        and transport_mode.strip().lower() in ["", TRANSPORT_LIVE]
+
+
+class AsyncHTTPSession:
+    """Async counterpart of HTTPSession, responses are httpx.Response objects"""
+
+    def __init__(self, transport: Optional[Any] = None) -> None:
+        config = Config.instance()
+        self.timeout: float = config.get_float_property(HTTP_TIMEOUT_KEY, DEFAULT_HTTP_TIMEOUT)
+        self.connect_timeout: float = config.get_float_property(HTTP_CONNECT_TIMEOUT_KEY, DEFAULT_HTTP_CONNECT_TIMEOUT)
+        self.trace_slow_threshold_ms: float = config.get_float_property(
+            HTTP_TRACE_SLOW_THRESHOLD_KEY, HTTPSession.DEFAULT_TRACE_SLOW_THRESHOLD_MS)
+        self.trace_slow_calls: int = config.get_int_property(
+            HTTP_TRACE_SLOW_CALLS_KEY, HTTPSession.DEFAULT_TRACE_SLOW_CALLS)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                                        headers={"User-Agent": USER_AGENT}, follow_redirects=True,
+                                        transport=transport)
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    @property
+    def cookies(self):
+        return self.client.cookies
+
+    async def __aenter__(self) -> "AsyncHTTPSession":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def get(self, url: str, **kwargs) -> Any:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Any:
+        return await self.request("POST", url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> Any:
+        return await self.request("HEAD", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs) -> Any:
+        """Send the request unless the circuit breaker of the host is open, the call is traced.
+        The timeout is shortened to fit in the deadline of the current request, if any.
+
+        Raises:
+            CircuitOpenError: if the circuit breaker of the host is open
+            DeadlineExceededError: if the deadline of the current request is exceeded
+        """
+        shortened = self._fit_timeout_in_deadline(url, kwargs)
+        breaker = CircuitBreakers.instance().get(urlparse(url).hostname or "")
+        breaker.before_call()
+        try:
+            response = await self._send(method, url, shortened, **kwargs)
+        except DeadlineExceededError:
+            breaker.release_probe()  # the host is not responsible for the budget of the request
+            raise
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        except Exception:
+            breaker.record_success()  # the host answered
+            raise
+        except BaseException:  # ie: task cancelled by asyncio.gather or asyncio.wait_for
+            breaker.release_probe()
+            raise
+
+        if is_failure_status(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        return response
+
+    async def _send(self, method: str, url: str, shortened: bool, **kwargs) -> Any:
+        with trace_upstream_call(method, url, self.trace_slow_threshold_ms, self.trace_slow_calls) as trace:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TimeoutException as e:
+                if shortened and is_deadline_exceeded():
+                    raise DeadlineExceededError("Request deadline exceeded: %s" % str(e)) from e
+                raise
+            trace.status = response.status_code
+            trace.ttfb_ms = response.elapsed.total_seconds() * 1000
+            trace.response_bytes = len(response.content)
+
+        return response
+
+    def _fit_timeout_in_deadline(self, url: str, kwargs: dict) -> bool:
+        remaining = get_remaining_time()
+        if remaining is None:
+            return False
+        if remaining <= 0:
+            raise DeadlineExceededError("Request deadline exceeded before calling %s" % url)
+
+        timeout = kwargs.get("timeout", self.client.timeout)
+        if not isinstance(timeout, httpx.Timeout):
+            timeout = httpx.Timeout(timeout)
+        if timeout.read is not None and timeout.read <= remaining and timeout.connect is not None \
+                and timeout.connect <= remaining:
+            return False
+
+        kwargs["timeout"] = httpx.Timeout(
+            _min(timeout.read, remaining), connect=_min(timeout.connect, remaining),
+            write=_min(timeout.write, remaining), pool=_min(timeout.pool, remaining))
+        return True
+
+
+def run_async(func: Callable[[AsyncHTTPSession], Awaitable[T]], user_agent: Optional[str] = None) -> T:
+    """Run the coroutine of func(session) in a new event loop of the current thread, with a new async session
+    closed at the end. Context variables of the request (deadline, handler name) are copied to the loop."""
+    async def _run() -> T:
+        async with AsyncHTTPSession() as session:
+            if user_agent is not None:
+                session.headers["User-Agent"] = user_agent
+            return await func(session)
+
+    return asyncio.run(_run())
+
+
+def _min(value: Optional[float], remaining: float) -> float:
+    return remaining if value is None else min(value, remaining)
@@ -0,0 +1,141 @@
+"""Pool of logged in sessions of the handlers of subscriber websites, keyed by handler and account.
+
+Logging in takes several upstream calls (login page, credentials form) and repeated logins may lock the
+account: a logged in session is reused by the following requests of the same account until one of its login
+cookies expires, an authentication failure is detected, or it is older than auth.session_max_age_s.
+Concurrent logins of the same account are coalesced (see utils.single_flight). A failed login raises a LoginError
+and is not cached: log_in functions must check that the website accepted the credentials.
+Credentials are only used to log in: sessions are keyed by a keyed hash (HMAC) of the account, with a secret
+generated by each process, so that neither credentials nor reversible hashes of them are kept.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from http.cookiejar import Cookie
+from typing import Callable, List, Optional
+
+import requests
+
+from config.config import AUTH_POOL_SIZE_KEY, AUTH_SESSION_MAX_AGE_KEY, Config
+from utils.circuit_breaker import ExpiringCache
+from utils.http_client import HTTPSession
+from utils.metrics import Metrics
+from utils.single_flight import get_single_flight
+from utils.singleton import Singleton
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_SESSION_MAX_AGE_S = 6 * 3600.0
+
+LOGIN_KEY = "login"
+PASSWORD_KEY = "password"
+
+
+class LoginError(Exception):
+    """The website did not log the account in"""
+
+
+class _AuthenticatedSession:
+    """Logged in session and the cookies set by its login"""
+
+    def __init__(self, session: requests.Session) -> None:
+        self.session: requests.Session = session
+        self.login_cookies: List[Cookie] = list(session.cookies)
+
+    def is_valid(self) -> bool:
+        """False when a login cookie has expired or has been removed by the website"""
+        current = {(cookie.domain, cookie.path, cookie.name) for cookie in self.session.cookies}
+        return all(not cookie.is_expired() and (cookie.domain, cookie.path, cookie.name) in current
+                   for cookie in self.login_cookies)
+
+
+@Singleton
+class AuthenticatedSessions:
+    """Logged in sessions of the worker, at most auth.pool_size accounts, least recently used first evicted"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self._sessions: ExpiringCache[str, _AuthenticatedSession] = ExpiringCache(
+            config.get_int_property(AUTH_POOL_SIZE_KEY, DEFAULT_POOL_SIZE),
+            config.get_float_property(AUTH_SESSION_MAX_AGE_KEY, DEFAULT_SESSION_MAX_AGE_S))
+        self._secret: bytes = os.urandom(32)
+
+    def get_session(self, handler_name: str, parameters: dict, session: requests.Session,
+                    log_in: Callable[[dict, requests.Session], None]) -> requests.Session:
+        """Returns the logged in session of the account given by the login and password parameters, logging in
+        with log_in(parameters, new_session) when there is no valid one.
+        The given session is returned when there are no credentials.
+
+        Args:
+            handler_name (str): name of the handler, sessions are not shared between handlers
+            parameters (dict): parameters of the request, with the decrypted login and password
+            session (requests.Session): session of the request, its headers are copied to new sessions
+            log_in (Callable[[dict, requests.Session], None]): log the given session in, raising a LoginError when
+                the website does not accept the credentials
+
+        Raises:
+            LoginError: if the account can not log in
+        """
+        if LOGIN_KEY not in parameters or PASSWORD_KEY not in parameters:
+            return session
+
+        key = self._get_key(handler_name, parameters)
+        authenticated_session = self._get_valid_session(key)
+        if authenticated_session is not None:
+            Metrics.instance().increment("auth.sessions", handler=handler_name, outcome="reused")
+            return authenticated_session.session
+
+        return get_single_flight("login").do(
+            key, lambda: self._log_in(key, handler_name, parameters, session, log_in)).session
+
+    def get(self, handler_name: str, url: str, parameters: dict, session: requests.Session,
+            log_in: Callable[[dict, requests.Session], None],
+            is_logged_out: Callable[[requests.Response], bool], **kwargs) -> requests.Response:
+        """GET the url with the logged in session of the account (see get_session).
+        When the response shows that the session is not logged in anymore, the account logs in again once."""
+        response = self.get_session(handler_name, parameters, session, log_in).get(url, **kwargs)
+        if LOGIN_KEY in parameters and PASSWORD_KEY in parameters and is_logged_out(response):
+            Metrics.instance().increment("auth.sessions", handler=handler_name, outcome="logged_out")
+            self.invalidate(handler_name, parameters)
+            response = self.get_session(handler_name, parameters, session, log_in).get(url, **kwargs)
+
+        return response
+
+    def invalidate(self, handler_name: str, parameters: dict):
+        """Forget the session of the account, the next request logs in again"""
+        self._sessions.delete(self._get_key(handler_name, parameters))
+
+    def _get_key(self, handler_name: str, parameters: dict) -> str:
+        account = "\0".join([handler_name, parameters[LOGIN_KEY], parameters[PASSWORD_KEY]])
+        return hmac.new(self._secret, account.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _get_valid_session(self, key: str) -> Optional[_AuthenticatedSession]:
+        authenticated_session = self._sessions.get(key)
+        if authenticated_session is not None and not authenticated_session.is_valid():
+            self._sessions.delete(key)
+            authenticated_session = None
+
+        return authenticated_session
+
+    def _log_in(self, key: str, handler_name: str, parameters: dict, session: requests.Session,
+                log_in: Callable[[dict, requests.Session], None]) -> _AuthenticatedSession:
+        # the account may have logged in while this request was waiting for the previous login
+        authenticated_session = self._get_valid_session(key)
+        if authenticated_session is None:
+            new_session = HTTPSession()
+            new_session.headers.update(session.headers)
+            started = time.perf_counter()
+            try:
+                log_in(parameters, new_session)
+                if len(new_session.cookies) == 0:
+                    raise LoginError("%s login did not set any cookie" % handler_name)
+            except Exception:
+                Metrics.instance().increment("auth.logins", handler=handler_name, outcome="error")
+                raise
+            Metrics.instance().increment("auth.logins", handler=handler_name, outcome="ok")
+            Metrics.instance().observe("auth.login_ms", (time.perf_counter() - started) * 1000, handler=handler_name)
+            authenticated_session = _AuthenticatedSession(new_session)
+            self._sessions.put(key, authenticated_session)
+
+        return authenticated_session
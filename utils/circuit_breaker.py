@@ -0,0 +1,212 @@
+"""Per host circuit breakers and negative cache of upstream calls.
+
+A breaker opens after consecutive failures (connection errors, timeouts, 5xx and 429 responses) of its host:
+calls fail fast with a CircuitOpenError instead of waiting for the HTTP timeout. Once open_s is elapsed, the
+breaker is half open: one probe call is let through, it closes the breaker when it succeeds, otherwise the
+breaker opens again.
+The state of every breaker is exported to the metrics (upstream.circuit_state gauge: 0 closed, 1 half open,
+2 open).
+Rendered feeds and contents are kept in a StaleCache, to be served again while a breaker is open.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+import requests
+
+from config.config import (HTTP_CIRCUIT_BREAKER_FAILURES_KEY, HTTP_CIRCUIT_BREAKER_OPEN_KEY,
+                           HTTP_NEGATIVE_CACHE_KEY, SERVER_STALE_CACHE_SIZE_KEY, Config)
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_FAILURES = 5
+DEFAULT_OPEN_S = 30.0
+DEFAULT_NEGATIVE_CACHE_S = 60.0
+NEGATIVE_CACHE_SIZE = 500
+DEFAULT_STALE_CACHE_SIZE = 100
+
+# statuses cached by the negative cache
+NEGATIVE_STATUSES = [404, 410]
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+
+def is_failure_status(status: int) -> bool:
+    return status >= 500 or status == 429
+
+
+class CircuitBreaker:
+    """Circuit breaker of one host"""
+
+    def __init__(self, host: str, failures_threshold: int = DEFAULT_FAILURES, open_s: float = DEFAULT_OPEN_S) -> None:
+        self.host: str = host
+        self.failures_threshold: int = failures_threshold
+        self.open_s: float = open_s
+        self.state: str = CLOSED
+        self.failures: int = 0
+        self.opened_at: float = 0.0
+        self._probing: bool = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Checks that the host can be called
+
+        Raises:
+            CircuitOpenError: when the breaker is open, or half open with a probe call already in flight
+        """
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.open_s:
+                self._set_state(HALF_OPEN)
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+                Metrics.instance().increment("upstream.circuit_rejected", host=self.host)
+                raise CircuitOpenError("Circuit breaker of '%s' is open after %d failures, retry in %ds" % (
+                    self.host, self.failures, max(0, round(self.open_s - time.time() + self.opened_at))))
+            if self.state == HALF_OPEN:
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def release_probe(self):
+        """The call ended without telling whether the host is healthy (ie: request deadline exceeded, url not
+        recorded in replay mode): the state is kept, a half open breaker lets the next call probe the host"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failures_threshold):
+                self.opened_at = time.time()
+                self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        Metrics.instance().set_gauge("upstream.circuit_state", STATE_VALUES[state], host=self.host)
+        Metrics.instance().increment("upstream.circuit_transitions", host=self.host, state=state)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened_at": round(self.opened_at, 3)
+            }
+
+
+@Singleton
+class CircuitBreakers:
+    """Circuit breakers of the process, one per host"""
+
+    def __init__(self) -> None:
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                config = Config.instance()
+                self._breakers[host] = CircuitBreaker(
+                    host,
+                    config.get_int_property(HTTP_CIRCUIT_BREAKER_FAILURES_KEY, DEFAULT_FAILURES),
+                    config.get_float_property(HTTP_CIRCUIT_BREAKER_OPEN_KEY, DEFAULT_OPEN_S))
+
+            return self._breakers[host]
+
+    def to_dict(self) -> Dict[str, dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.host: breaker.to_dict() for breaker in breakers}
+
+
+class ExpiringCache(Generic[K, V]):
+    """Bounded cache whose entries expire after a duration, least recently used entries are evicted first"""
+
+    def __init__(self, max_entries: int, ttl_s: float) -> None:
+        self.max_entries: int = max_entries
+        self.ttl_s: float = ttl_s
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        value: Optional[V] = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() - entry[0] < self.ttl_s:
+                    self._entries.move_to_end(key)
+                    value = entry[1]
+                else:
+                    del self._entries[key]
+
+        return value
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: K):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+@Singleton
+class NegativeCache:
+    """Upstream 404/410 responses, served again for a short time (http.negative_cache_s) without calling the host"""
+
+    def __init__(self) -> None:
+        self._cache: ExpiringCache[str, requests.Response] = ExpiringCache(
+            NEGATIVE_CACHE_SIZE, Config.instance().get_float_property(HTTP_NEGATIVE_CACHE_KEY, DEFAULT_NEGATIVE_CACHE_S))
+
+    def is_enabled(self) -> bool:
+        return self._cache.ttl_s > 0
+
+    def get(self, url: str) -> Optional[requests.Response]:
+        response = self._cache.get(url)
+        if response is not None:
+            Metrics.instance().increment("upstream.negative_cache_hits", host=urlparse(url).hostname or "")
+            response = copy.copy(response)
+
+        return response
+
+    def put(self, url: str, response: requests.Response):
+        if response.status_code in NEGATIVE_STATUSES:
+            self._cache.put(url, response)
+
+
+@Singleton
+class StaleCache:
+    """Last rendering of the most recently requested feeds and contents (server.stale_cache_size entries),
+    served while the circuit breaker of their upstream host is open"""
+
+    def __init__(self) -> None:
+        self._cache: ExpiringCache[str, object] = ExpiringCache(
+            Config.instance().get_int_property(SERVER_STALE_CACHE_SIZE_KEY, DEFAULT_STALE_CACHE_SIZE), float("inf"))
+
+    def get(self, key: str):
+        return self._cache.get(key)
+
+    def put(self, key: str, value):
+        self._cache.put(key, value)
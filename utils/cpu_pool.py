@@ -0,0 +1,185 @@
+"""Pool of processes running the CPU heavy stages of the requests (readability extraction, content processing,
+thumbnails blurring), so that they do not hold the GIL of the threads serving the other requests.
+
+The pool is disabled by default (cpu_pool.size=0). Tasks are module functions whose arguments and result are
+pickled: inputs smaller than cpu_pool.min_input_kb are processed in the calling thread (the pickling would cost more
+than the work), as well as every task while cpu_pool.max_pending tasks are already waiting for the pool, and during
+BROKEN_POOL_RETRY_S seconds once the pool is broken (ie: a worker has been killed by the OOM killer).
+A task not finished after cpu_pool.timeout_s seconds (or after the deadline of its request) raises a
+CPUTaskTimeoutError, the workers are then restarted: the other tasks in progress are processed again in their
+calling thread.
+Workers are started in advance from a forkserver which has imported the parsing modules, they load the
+configuration and the handlers once, and are replaced after cpu_pool.max_tasks_per_worker tasks to bound their memory.
+
+Tasks are reported by the cpu_pool.tasks counter (per stage, outcome: pool, small, saturated, broken or timeout) and
+the cpu_pool.task_ms histogram (per stage, duration seen by the caller).
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, TypeVar
+
+from config.config import (CPU_POOL_MAX_PENDING_KEY, CPU_POOL_MAX_TASKS_KEY, CPU_POOL_MIN_INPUT_KEY, CPU_POOL_SIZE_KEY,
+                           CPU_POOL_TIMEOUT_KEY, Config)
+from utils.metrics import Metrics
+from utils.request_context import get_remaining_time
+from utils.singleton import Singleton
+
+DEFAULT_TIMEOUT_S = 30.0
+DEFAULT_MIN_INPUT_KB = 32
+DEFAULT_MAX_TASKS_PER_WORKER = 500
+BROKEN_POOL_RETRY_S = 60.0
+PRELOADED_MODULES = ["lxml.etree", "lxml.html", "utils.readability", "handlers.content.content_processor",
+                     "pyrssw_handlers.handlers_manager"]
+
+T = TypeVar("T")
+
+
+class CPUTaskTimeoutError(TimeoutError):
+    """A task of the pool did not finish in time"""
+
+
+def _init_worker(config_file: str):
+    if config_file != "":
+        Config.instance().load_config_file(config_file)
+    from pyrssw_handlers.handlers_manager import HandlersManager
+    HandlersManager.instance().get_handlers()
+
+
+def _warm_up():
+    pass
+
+
+@Singleton
+class CPUPool:
+    """Worker processes of the CPU heavy stages"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self.size: int = config.get_int_property(CPU_POOL_SIZE_KEY, 0)
+        self.timeout_s: float = config.get_float_property(CPU_POOL_TIMEOUT_KEY, DEFAULT_TIMEOUT_S)
+        self.max_pending: int = config.get_int_property(CPU_POOL_MAX_PENDING_KEY, self.size * 4)
+        self.min_input_size: int = config.get_int_property(CPU_POOL_MIN_INPUT_KEY, DEFAULT_MIN_INPUT_KB) * 1024
+        self.max_tasks_per_worker: int = config.get_int_property(CPU_POOL_MAX_TASKS_KEY, DEFAULT_MAX_TASKS_PER_WORKER)
+        self.pending: int = 0
+        self._broken_until: float = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        """Start the workers in advance, instead of at the first task"""
+        if self.is_enabled():
+            self._get_executor()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, stage: str, func: Callable[..., T], *args: Any, input_size: int = 0,
+            local: Optional[Callable[[], T]] = None) -> T:
+        """Returns func(*args), computed by a worker of the pool when it is enabled and the input is large enough.
+        When the task is processed in the calling thread, local() is called instead if given: it computes the same
+        result without rebuilding the objects of the caller from the picklable arguments.
+
+        Raises:
+            CPUTaskTimeoutError: the task did not finish in time
+        """
+        in_thread: Callable[[], T] = local if local is not None else lambda: func(*args)
+        if not self.is_enabled():
+            return in_thread()
+        if input_size < self.min_input_size:
+            return self._run_in_thread(stage, "small", in_thread)
+        if time.monotonic() < self._broken_until:
+            return self._run_in_thread(stage, "broken", in_thread)
+        with self._lock:
+            if self.pending >= self.max_pending:
+                saturated = True
+            else:
+                saturated = False
+                self.pending += 1
+        if saturated:
+            return self._run_in_thread(stage, "saturated", in_thread)
+
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(func, *args)
+            except RuntimeError as e:  # shut down by the timed out task of another thread
+                raise BrokenProcessPool(str(e)) from e
+            timeout = self._get_timeout()
+            try:
+                result = future.result(timeout)
+            except FutureTimeoutError:
+                if not future.cancel():  # a worker is stuck on it
+                    self._terminate(executor, restart=True)
+                Metrics.instance().increment("cpu_pool.tasks", stage=stage, outcome="timeout")
+                raise CPUTaskTimeoutError("%s not finished after %.1f s" % (stage, timeout))
+        except (BrokenProcessPool, CancelledError) as e:
+            logging.getLogger().warning("CPU pool unavailable for %s, processed in the thread: %s", stage, str(e))
+            if executor is self._executor:  # not already restarted after the timeout of another task
+                self._broken_until = time.monotonic() + BROKEN_POOL_RETRY_S
+                self._terminate(executor, restart=False)
+            return self._run_in_thread(stage, "broken", in_thread)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+        Metrics.instance().increment("cpu_pool.tasks", stage=stage, outcome="pool")
+        Metrics.instance().observe("cpu_pool.task_ms", (time.perf_counter() - started) * 1000, stage=stage)
+        return result
+
+    def _get_timeout(self) -> float:
+        remaining_time = get_remaining_time()
+        return self.timeout_s if remaining_time is None else max(min(self.timeout_s, remaining_time), 0)
+
+    def _run_in_thread(self, stage: str, outcome: str, func: Callable[[], T]) -> T:
+        started = time.perf_counter()
+        result = func()
+        Metrics.instance().increment("cpu_pool.tasks", stage=stage, outcome=outcome)
+        Metrics.instance().observe("cpu_pool.task_ms", (time.perf_counter() - started) * 1000, stage=stage)
+        return result
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(PRELOADED_MODULES)
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size, mp_context=context, initializer=_init_worker,
+                    initargs=(Config.instance().config_file,),
+                    max_tasks_per_child=self.max_tasks_per_worker if self.max_tasks_per_worker > 0 else None)
+                for _ in range(self.size):  # every worker is started
+                    self._executor.submit(_warm_up)
+
+            return self._executor
+
+    def _terminate(self, executor: ProcessPoolExecutor, restart: bool):
+        """Kill the workers of the executor, new ones are started right now when restart is True, otherwise by the
+        first task after BROKEN_POOL_RETRY_S seconds"""
+        with self._lock:
+            restart = restart and self._executor is executor
+            if self._executor is executor:
+                self._executor = None
+        terminate_workers = getattr(executor, "terminate_workers", None)  # python >= 3.14
+        if terminate_workers is not None:
+            terminate_workers()
+        else:
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        if restart:
+            self._get_executor()
@@ -0,0 +1,178 @@
+"""Cache of the name resolutions of upstream hosts, shared by the sessions of a worker.
+
+Every new upstream connection resolves its host (see utils.http_tracing.resolve): with the system resolver of a
+container this often takes tens of milliseconds, and it sometimes stalls under load. Resolved addresses are kept
+for dns.cache.ttl_s seconds (the system resolver does not give the TTL of the records, the setting should not be
+longer than the TTL of the upstream hosts), failures for dns.cache.negative_ttl_s seconds.
+An entry used during the last part of its life (REFRESH_RATIO) is resolved again in the background, so that the
+hosts called regularly are never resolved by a request. Concurrent resolutions of the same host are coalesced.
+Addresses of some hosts can be forced with dns.hosts (ie: www.lequipe.fr=1.2.3.4,www.lequipe.fr=1.2.3.5).
+
+Resolutions are reported by the upstream.resolve_ms histogram and the upstream.dns_cache counter (per host).
+"""
+
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from urllib3.util.connection import allowed_gai_family
+
+from config.config import DNS_CACHE_ENABLED_KEY, DNS_CACHE_NEGATIVE_TTL_KEY, DNS_CACHE_TTL_KEY, DNS_HOSTS_KEY, Config
+from utils.metrics import Metrics
+from utils.single_flight import get_single_flight
+from utils.singleton import Singleton
+
+DEFAULT_TTL_S = 60.0
+DEFAULT_NEGATIVE_TTL_S = 10.0
+REFRESH_RATIO = 0.8  # entries used after 80% of their TTL are refreshed in the background
+MAX_ENTRIES = 1000
+
+
+def system_resolve(host: str, port: int) -> List[str]:
+    """Resolve the host with the system resolver into the list of its addresses, in the resolver order
+
+    Raises:
+        socket.gaierror: if the host can not be resolved
+    """
+    addresses: List[str] = []
+    for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM):
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+
+    return addresses
+
+
+def parse_hosts(value: str) -> Dict[str, List[str]]:
+    """Parse the dns.hosts setting: list of host=address, a host may be given several times
+
+    Raises:
+        ValueError: if an address is not an IP address
+    """
+    hosts: Dict[str, List[str]] = {}
+    for item in value.split(","):
+        if item.strip() != "":
+            host, _, address = item.partition("=")
+            hosts.setdefault(host.strip().lower(), []).append(str(ipaddress.ip_address(address.strip())))
+
+    return hosts
+
+
+class _Entry:
+    """Addresses of a host (or the error of its resolution) and their expiration time"""
+
+    def __init__(self, addresses: List[str], error: Optional[socket.gaierror], ttl_s: float) -> None:
+        self.addresses: List[str] = addresses
+        self.error: Optional[socket.gaierror] = error
+        self.resolved_at: float = time.monotonic()
+        self.expires_at: float = self.resolved_at + ttl_s
+        self.refreshing: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "addresses": self.addresses,
+            "error": str(self.error) if self.error is not None else "",
+            "expires_in_s": round(self.expires_at - time.monotonic(), 1)
+        }
+
+
+@Singleton
+class DNSCache:
+    """Name resolutions of the worker, by host"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self.enabled: bool = config.get_bool_property(DNS_CACHE_ENABLED_KEY, True)
+        self.ttl_s: float = config.get_float_property(DNS_CACHE_TTL_KEY, DEFAULT_TTL_S)
+        self.negative_ttl_s: float = config.get_float_property(DNS_CACHE_NEGATIVE_TTL_KEY, DEFAULT_NEGATIVE_TTL_S)
+        self.static_hosts: Dict[str, List[str]] = {}
+        try:
+            self.static_hosts = parse_hosts(config.get_property(DNS_HOSTS_KEY, ""))
+        except ValueError as e:
+            logging.getLogger().error("Invalid %s setting, it is ignored: %s", DNS_HOSTS_KEY, str(e))
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """Addresses of the host, from the cache when possible
+
+        Raises:
+            socket.gaierror: if the host can not be resolved (or could not be resolved recently)
+        """
+        key = host.lower()
+        if key in self.static_hosts:
+            Metrics.instance().increment("upstream.dns_cache", host=host, outcome="static")
+            return self.static_hosts[key]
+        if not self.enabled or _is_ip_address(host):
+            return system_resolve(host, port)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            refresh = entry is not None and not entry.refreshing and entry.error is None \
+                and time.monotonic() >= entry.resolved_at + (entry.expires_at - entry.resolved_at) * REFRESH_RATIO
+            if refresh:
+                entry.refreshing = True  # type: ignore
+
+        if entry is None or time.monotonic() >= entry.expires_at:
+            Metrics.instance().increment("upstream.dns_cache", host=host, outcome="miss")
+            entry = get_single_flight("dns").do(key, lambda: self._resolve(key, host, port))
+        else:
+            Metrics.instance().increment("upstream.dns_cache", host=host,
+                                         outcome="hit" if entry.error is None else "negative_hit")
+            if refresh:
+                threading.Thread(target=self._refresh, args=(key, host, port), daemon=True).start()
+
+        if entry.error is not None:
+            raise socket.gaierror(*entry.error.args)
+
+        return entry.addresses
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def to_dict(self) -> Dict[str, dict]:
+        with self._lock:
+            entries = dict(self._entries)
+        return {host: entry.to_dict() for host, entry in sorted(entries.items())}
+
+    def _resolve(self, key: str, host: str, port: int) -> _Entry:
+        started = time.perf_counter()
+        try:
+            entry = _Entry(system_resolve(host, port), None, self.ttl_s)
+        except socket.gaierror as e:
+            entry = _Entry([], e, self.negative_ttl_s)
+        Metrics.instance().observe("upstream.resolve_ms", (time.perf_counter() - started) * 1000, host=host)
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > MAX_ENTRIES:
+                del self._entries[next(iter(self._entries))]
+
+        return entry
+
+    def _refresh(self, key: str, host: str, port: int):
+        """Resolve the host again, the current addresses are kept until they expire when it fails"""
+        started = time.perf_counter()
+        try:
+            addresses = system_resolve(host, port)
+        except socket.gaierror:
+            Metrics.instance().increment("upstream.dns_cache", host=host, outcome="refresh_error")
+            with self._lock:
+                if key in self._entries:
+                    self._entries[key].refreshing = False
+            return
+        Metrics.instance().observe("upstream.resolve_ms", (time.perf_counter() - started) * 1000, host=host)
+
+        with self._lock:
+            self._entries[key] = _Entry(addresses, None, self.ttl_s)
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
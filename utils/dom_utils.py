@@ -1,12 +1,68 @@
 import logging
+import threading
 import traceback
-from typing import Dict, List, Optional, Tuple, cast, Any
+from typing import Dict, List, Optional, Tuple, Union, cast, Any
+import requests
+from utils.metrics import Metrics
+from utils.singleton import Singleton
 from utils.url_utils import is_url_valid
 from lxml import etree
 import httpcore
 
 setattr(httpcore, "SyncHTTPTransport", Any)
 
+# beyond this number of distinct expressions (ie: built from parameters), expressions are compiled for each call
+MAX_COMPILED_XPATHS = 1000
+
+# parsers of each thread, by type and encoding
+_parsers = threading.local()
+
+
+@Singleton
+class XPathRegistry:
+    """XPath expressions of the process compiled once (libxml2 compiles an expression string again on every call
+    of dom.xpath), by expression and namespaces. Compiled expressions can be shared by threads: lxml serializes
+    the evaluations of each one."""
+
+    def __init__(self) -> None:
+        self._compiled: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], etree.XPath] = {}
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, expression: str, namespaces: Optional[Dict[str, str]] = None) -> etree.XPath:
+        key = (expression, tuple(sorted(namespaces.items())) if namespaces is not None else ())
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self.hits += 1  # not locked: an approximate count is enough for statistics
+        else:
+            compiled = etree.XPath(expression, namespaces=namespaces)
+            Metrics.instance().increment("xpath.compilations")
+            with self._lock:
+                self.misses += 1
+                if len(self._compiled) < MAX_COMPILED_XPATHS:
+                    self._compiled[key] = compiled
+
+        return compiled
+
+    def get_union(self, expressions: List[str], namespaces: Optional[Dict[str, str]] = None) -> etree.XPath:
+        """Single query matching the nodes of every expression, in document order"""
+        return self.get(" | ".join(expressions), namespaces)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "expressions": len(self._compiled),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / (self.hits + self.misses), 4) if self.hits + self.misses > 0 else 0
+            }
+
+
+def compiled_xpath(expression: str, namespaces: Optional[Dict[str, str]] = None) -> etree.XPath:
+    """Compiled expression, from the registry of the process"""
+    return XPathRegistry.instance().get(expression, namespaces)
+
 
 def to_string(dom: etree._Element) -> str:
     return (
@@ -45,7 +101,7 @@ def get_all_contents(
     content: str = ""
     alts: str = ""
     for xpath in xpaths:
-        results = cast(list, dom.xpath(xpath))
+        results = cast(list, compiled_xpath(xpath)(dom))
         if len(results) > 0:
             for result in results:
                 enclosing: str = "%s%s"
@@ -64,12 +120,7 @@ def xpath(
 ) -> List[etree._Element]:
     nodes: List[etree._Element] = []
     if dom is not None:
-        if namespaces is None:
-            nodes = cast(List[etree._Element], dom.xpath(xpath_query))
-        else:
-            nodes = cast(
-                List[etree._Element], dom.xpath(xpath_query, namespaces=namespaces)
-            )
+        nodes = cast(List[etree._Element], compiled_xpath(xpath_query, namespaces)(dom))
 
     return nodes
 
@@ -134,10 +185,7 @@ def get_first_node(
     """get first node found in the list of xpath expressions"""
     node: Optional[etree._Element] = None
     for xpath in xpaths:
-        if namespaces is not None:
-            results = cast(list, dom.xpath(xpath, namespaces=namespaces))
-        else:
-            results = cast(list, dom.xpath(xpath))
+        results = cast(list, compiled_xpath(xpath, namespaces)(dom))
         if len(results) > 0:
             node = results[0]
             break
@@ -145,9 +193,9 @@ def get_first_node(
 
 
 def delete_xpaths(dom: etree._Element, xpaths: List[str]):
-    """delete nodes of the given dom matching xpath exrepssions"""
-    for xpath in xpaths:
-        delete_nodes(dom.xpath(xpath))
+    """delete nodes of the given dom matching xpath exrepssions, found by a single union query"""
+    if len(xpaths) > 0:
+        delete_nodes(XPathRegistry.instance().get_union(xpaths)(dom))
 
 
 def delete_nodes(nodes):
@@ -180,3 +228,52 @@ def get_xpath_expression_for_filters(parameters, xpath_to_include, xpath_to_excl
                 xpath_expression += " and "
             xpath_expression += xpath_to_exclude % category
     return "//rss/channel/item[%s]" % xpath_expression
+
+
+def get_declared_charset(response: requests.Response) -> Optional[str]:
+    """Charset of the Content-Type header of the response, None when not declared (unlike response.encoding,
+    which defaults to ISO-8859-1 for text/* types)"""
+    charset: Optional[str] = None
+    for param in response.headers.get("Content-Type", "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset" and value.strip(" \"'") != "":
+            charset = value.strip(" \"'")
+
+    return charset
+
+
+def get_parser(html: bool = False, encoding: Optional[str] = None) -> Union[etree.XMLParser, etree.HTMLParser]:
+    """Parser of the current thread (lxml parsers can not be shared by threads), recovering from malformed
+    documents. Without encoding, it is read from the document (BOM, XML declaration, meta charset)."""
+    parsers: Dict[Tuple[bool, Optional[str]], Union[etree.XMLParser, etree.HTMLParser]] = _parsers.__dict__.setdefault("parsers", {})
+    key = (html, encoding.lower() if encoding is not None else None)
+    if key not in parsers:
+        if html:
+            parsers[key] = etree.HTMLParser(encoding=encoding, recover=True, no_network=True)
+        else:
+            parsers[key] = etree.XMLParser(encoding=encoding, recover=True, no_network=True,
+                                           resolve_entities=False)
+
+    return parsers[key]
+
+
+def parse_response(response: requests.Response, html: bool = False, content: Optional[bytes] = None) -> etree._Element:
+    """Parse the body of the response (or the given content, ie: the body fixed by the handler) from its bytes,
+    with the charset declared by the response: the body is never decoded as a text.
+
+    Args:
+        response (requests.Response): the response
+        html (bool, optional): True to parse an HTML document, False for an XML one. Defaults to False.
+        content (Optional[bytes], optional): content to parse instead of the body. Defaults to None.
+
+    Returns:
+        etree._Element: root element
+    """
+    content = response.content if content is None else content
+    parser = get_parser(html, get_declared_charset(response))
+    return etree.fromstring(content, parser) if not html else etree.HTML(content, parser)
+
+
+def fetch_dom(session: requests.Session, url: str, html: bool = False, **kwargs) -> etree._Element:
+    """GET the url with the session and parse the response (see parse_response)"""
+    return parse_response(session.get(url, **kwargs), html)
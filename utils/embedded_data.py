@@ -0,0 +1,214 @@
+"""Data embedded in the scripts of web pages.
+
+Many websites render their articles from data embedded in the page rather than from its markup:
+ - JSON-LD scripts (<script type="application/ld+json">)
+ - JSON assigned to a javascript variable (ie: Fusion.globalContent={...};)
+ - Next.js flight data: self.__next_f.push([1, "<rows>"]) scripts whose strings, once concatenated, are rows
+   like <id>:<json> (or <id>:T<hexadecimal length>,<text> for text rows)
+
+The scripts of a page are located in a single scan, and a script (or a flight row) is only parsed when it
+contains the requested marker. Parsed blobs are cached by the EmbeddedData of the page, itself cached for the
+last pages by get_embedded_data, so that the functions of a handler working on the same page share them. The cache
+is keyed on a digest of the pages (they are not kept alive) and bounded by the size of their scripts.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+TYPE_PATTERN = re.compile(r"""\btype\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+NEXT_FLIGHT_PUSH = "self.__next_f.push("
+JSON_LD_TYPE = "application/ld+json"
+CACHED_SCRIPTS_SIZE = 4 * 1024 * 1024  # characters of the scripts of the cached pages
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+class Script:
+    """Script of a page"""
+
+    def __init__(self, script_type: str, text: str) -> None:
+        self.type: str = script_type
+        self.text: str = text
+
+
+class EmbeddedData:
+    """Scripts of a page and the data they embed"""
+
+    def __init__(self, page: str) -> None:
+        self.scripts: List[Script] = _find_scripts(page)
+        self.size: int = sum(len(script.text) for script in self.scripts)
+        self._json_ld: Dict[int, List[Any]] = {}
+        self._assigned: Dict[str, Optional[Any]] = {}
+        self._flight_rows: Optional[Dict[str, Tuple[bool, str]]] = None
+        self._parsed_rows: Dict[str, Optional[Any]] = {}
+
+    def get_scripts(self, marker: str = "", script_type: Optional[str] = None) -> List[Script]:
+        """Scripts containing the marker, of the given type if any"""
+        return [script for script in self.scripts
+                if marker in script.text and (script_type is None or script.type == script_type)]
+
+    def get_json_ld(self, marker: str = "") -> List[Any]:
+        """JSON-LD objects of the scripts containing the marker (eg: "NewsArticle", "VideoObject"), invalid
+        scripts are ignored"""
+        objects: List[Any] = []
+        for idx, script in enumerate(self.scripts):
+            if script.type == JSON_LD_TYPE and marker in script.text:
+                if idx not in self._json_ld:
+                    self._json_ld[idx] = _parse_json_ld(script.text)
+                objects.extend(self._json_ld[idx])
+
+        return objects
+
+    def get_assigned_json(self, variable: str) -> Optional[Any]:
+        """JSON value assigned to the javascript variable (eg: Fusion.globalContent), None if not found"""
+        if variable not in self._assigned:
+            value: Optional[Any] = None
+            pattern = re.compile(r"%s\s*=\s*" % re.escape(variable))
+            for script in self.get_scripts(variable):
+                match = pattern.search(script.text)
+                if match is not None:
+                    try:
+                        value = _decoder.raw_decode(script.text, match.end())[0]
+                        break
+                    except ValueError:
+                        pass
+            self._assigned[variable] = value
+
+        return self._assigned[variable]
+
+    def get_flight_rows(self, marker: str = "") -> Dict[str, Any]:
+        """Next.js flight rows containing the marker, by row id: parsed JSON for JSON rows, strings for text
+        rows. Rows which are not JSON (module references, hints) are ignored."""
+        if self._flight_rows is None:
+            self._flight_rows = _split_flight_rows(self._get_flight_stream())
+
+        rows: Dict[str, Any] = {}
+        for row_id, (is_text, raw) in self._flight_rows.items():
+            if marker in raw:
+                if row_id not in self._parsed_rows:
+                    self._parsed_rows[row_id] = raw if is_text else _parse_json(raw)
+                if self._parsed_rows[row_id] is not None:
+                    rows[row_id] = self._parsed_rows[row_id]
+
+        return rows
+
+    def _get_flight_stream(self) -> str:
+        chunks: List[str] = []
+        for script in self.get_scripts(NEXT_FLIGHT_PUSH):
+            start = script.text.find(NEXT_FLIGHT_PUSH) + len(NEXT_FLIGHT_PUSH)
+            end = script.text.rfind(")")
+            push = _parse_json(script.text[start:end]) if end > start else None
+            if isinstance(push, list) and len(push) > 1 and push[0] == 1 and isinstance(push[1], str):
+                chunks.append(push[1])
+
+        return "".join(chunks)
+
+
+class _EmbeddedDataCache:
+    """Last EmbeddedData by digest of their page, at most max_size characters of scripts"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size: int = max_size
+        self.size: int = 0
+        self._entries: OrderedDict[bytes, EmbeddedData] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[EmbeddedData]:
+        with self._lock:
+            embedded_data = self._entries.get(key)
+            if embedded_data is not None:
+                self._entries.move_to_end(key)
+
+        return embedded_data
+
+    def put(self, key: bytes, embedded_data: EmbeddedData):
+        if embedded_data.size > self.max_size:
+            return
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = embedded_data
+                self.size += embedded_data.size
+            while self.size > self.max_size:
+                self.size -= self._entries.popitem(last=False)[1].size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache = _EmbeddedDataCache(CACHED_SCRIPTS_SIZE)
+
+
+def get_embedded_data(page: str) -> EmbeddedData:
+    """EmbeddedData of the page, cached for the last pages"""
+    key = hashlib.blake2b(page.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    embedded_data = _cache.get(key)
+    if embedded_data is None:
+        embedded_data = EmbeddedData(page)
+        _cache.put(key, embedded_data)
+
+    return embedded_data
+
+
+def _find_scripts(page: str) -> List[Script]:
+    """Scripts of the page, located with str.find which is much faster than a regular expression on large pages
+    (script tags are expected in lower case, as every website of the handlers writes them)"""
+    scripts: List[Script] = []
+    pos = page.find("<script")
+    while pos > -1:
+        start = page.find(">", pos)
+        end = page.find("</script>", start)
+        if start == -1 or end == -1:
+            break
+        if page[pos + len("<script")] in " \t\r\n>":  # not <scripts> or other tags
+            scripts.append(Script(_get_type(page[pos + len("<script"):start]), page[start + 1:end]))
+        pos = page.find("<script", end)
+
+    return scripts
+
+
+def _get_type(attributes: str) -> str:
+    match = TYPE_PATTERN.search(attributes)
+    return match.group(1).lower() if match is not None else ""
+
+
+def _parse_json(text: str) -> Optional[Any]:
+    try:
+        return _decoder.decode(text.strip())
+    except ValueError:
+        return None
+
+
+def _parse_json_ld(text: str) -> List[Any]:
+    value = _parse_json(text)
+    if value is None:
+        return []
+
+    return value if isinstance(value, list) else [value]
+
+
+def _split_flight_rows(stream: str) -> Dict[str, Tuple[bool, str]]:
+    """Rows of a flight stream by id: (True, text) for text rows, (False, raw JSON) for the other ones.
+    The length of text rows is given in bytes: the stream is split as UTF-8."""
+    rows: Dict[str, Tuple[bool, str]] = {}
+    data = stream.encode("utf-8")
+    pos = 0
+    while pos < len(data):
+        colon = data.find(b":", pos)
+        if colon == -1:
+            break
+        row_id = data[pos:colon].decode("utf-8").strip()
+        comma = data.find(b",", colon)
+        if data[colon + 1:colon + 2] == b"T" and comma > -1 and re.fullmatch(rb"[0-9a-fA-F]+", data[colon + 2:comma]):
+            end = comma + 1 + int(data[colon + 2:comma], 16)
+            rows[row_id] = (True, data[comma + 1:end].decode("utf-8", "replace"))
+        else:
+            end = data.find(b"\n", colon)
+            end = len(data) if end == -1 else end
+            rows[row_id] = (False, data[colon + 1:end].decode("utf-8", "replace"))
+        pos = end + 1 if data[end:end + 1] == b"\n" else end
+
+    return rows
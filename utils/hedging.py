@@ -0,0 +1,111 @@
+"""Hedged upstream GET requests, to cut the tail latency caused by a single slow connection.
+
+For the hosts listed by http.hedge.hosts, when a GET has not been answered after the http.hedge.percentile
+percentile of the time to first byte of its host (see the upstream.ttfb_ms histogram, used once it has
+MIN_SAMPLES values), the same request is sent again on another connection and the first response wins. The
+response of the other request is discarded once received.
+The hedges of the worker are bounded by a budget: each eligible request earns http.hedge.budget hedge (ie: 0.05
+allows 5% more upstream requests), a hedge costs one, at most MAX_BURST hedges can be saved.
+
+Hedges are reported by the upstream.hedges counter (per host, outcome: won, lost or no_budget).
+"""
+
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
+
+import requests
+
+from config.config import HTTP_HEDGE_BUDGET_KEY, HTTP_HEDGE_HOSTS_KEY, HTTP_HEDGE_PERCENTILE_KEY, Config
+from utils.http2_transport import is_selected_host, parse_hosts
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_BUDGET = 0.05
+MAX_BURST = 10.0
+MIN_SAMPLES = 20
+MIN_DELAY_MS = 10.0
+MAX_HEDGING_THREADS = 32  # requests are sent without hedging when every thread is busy
+
+
+@Singleton
+class HedgingPolicy:
+    """Hedged hosts, delays and budget of the worker"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self.hosts: List[str] = parse_hosts(config.get_property(HTTP_HEDGE_HOSTS_KEY, ""))
+        self.percentile: float = config.get_float_property(HTTP_HEDGE_PERCENTILE_KEY, DEFAULT_PERCENTILE)
+        self.budget: float = config.get_float_property(HTTP_HEDGE_BUDGET_KEY, DEFAULT_BUDGET)
+        self.tokens: float = 0.0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._threads = threading.BoundedSemaphore(MAX_HEDGING_THREADS)
+
+    def is_enabled(self) -> bool:
+        return len(self.hosts) > 0
+
+    def get_delay(self, host: str) -> Optional[float]:
+        """Delay (in seconds) before hedging a request to the host, None when its requests are not hedged"""
+        if not is_selected_host(host, self.hosts):
+            return None
+        histogram = Metrics.instance().get_histogram("upstream.ttfb_ms", host=host)
+        if histogram is None or histogram.count < MIN_SAMPLES:
+            return None
+
+        return max(histogram.percentile(self.percentile), MIN_DELAY_MS) / 1000
+
+    def send(self, send: Callable[[requests.PreparedRequest], requests.Response], request: requests.PreparedRequest,
+             host: str, delay: float) -> requests.Response:
+        """Returns send(request), or the response of its hedge when the hedge is answered first.
+        The exception of the first request to fail is raised when both fail."""
+        if not self._threads.acquire(blocking=False):
+            return send(request)
+
+        with self._lock:
+            self.tokens = min(self.tokens + self.budget, MAX_BURST)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_HEDGING_THREADS * 2, thread_name_prefix="hedge")
+            executor = self._executor
+
+        primary = self._submit(executor, send, request)
+        primary.add_done_callback(lambda _: self._threads.release())
+        done, _ = wait([primary], timeout=delay)
+        if len(done) > 0:
+            return primary.result()
+        if not self._acquire_token():
+            Metrics.instance().increment("upstream.hedges", host=host, outcome="no_budget")
+            return primary.result()
+
+        hedge = self._submit(executor, send, request.copy())
+        futures = [primary, hedge]
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None:  # the other request may still succeed
+            other = hedge if winner is primary else primary
+            if other.exception() is None:
+                winner = other
+        loser = hedge if winner is primary else primary
+        loser.add_done_callback(_close_response)
+        Metrics.instance().increment("upstream.hedges", host=host, outcome="won" if winner is hedge else "lost")
+
+        return winner.result()
+
+    def _acquire_token(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    @staticmethod
+    def _submit(executor: ThreadPoolExecutor, send: Callable[[requests.PreparedRequest], requests.Response],
+                request: requests.PreparedRequest) -> Future:
+        return executor.submit(contextvars.copy_context().run, send, request)
+
+
+def _close_response(future: Future):
+    if future.exception() is None:
+        future.result().close()
@@ -0,0 +1,284 @@
+"""HTTP/2 upstream transport of the hosts listed by http.http2.hosts.
+
+With the default transport, every concurrent call of a worker to the same website opens its own HTTP/1.1
+connection (ie: lequipe homepage enrichment fetching every article, reddit JSON and medias, izismile pages).
+The HTTP2Adapter sends the calls of the configured hosts through process wide httpcore connection pools
+negotiating HTTP/2 with ALPN: concurrent calls to the same origin are multiplexed over a single connection.
+
+HTTP/1.1 (with keep-alive) is used instead when the server does not support HTTP/2, when h2 (installed with
+httpcore[http2], see requirements.txt) is missing, and for the hosts whose HTTP/2 connections failed with a
+protocol error (idempotent calls are retried once with HTTP/1.1). Calls through a proxy or with a client
+certificate, and calls to the other hosts, are sent by the default transport.
+Response bodies are read at once, even for streamed requests.
+
+Connections are reported by the upstream.connections counter (per host, HTTP version and outcome: new or reused).
+"""
+
+import fnmatch
+import logging
+import os
+import socket
+import ssl
+import threading
+import time
+import weakref
+from http.client import HTTPMessage, responses
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+import httpcore
+import requests
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+from utils.http_tracing import TracingHTTPAdapter, get_current_trace, resolve
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+try:
+    import h2  # noqa: F401 pylint: disable=unused-import
+    HTTP2_AVAILABLE = True
+except ImportError:  # httpcore installed without its http2 extra: HTTP/1.1 is used
+    HTTP2_AVAILABLE = False
+
+ANY_HOST = "*"
+MAX_CONNECTIONS = 100  # per pool, all hosts included
+KEEPALIVE_EXPIRY_S = 30.0
+
+# methods retried with HTTP/1.1 after an HTTP/2 protocol error
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS"]
+
+
+def parse_hosts(value: str) -> List[str]:
+    """Parse the http.http2.hosts setting: host names, or patterns (ie: *.redd.it, * for every host)"""
+    return [host.strip().lower() for host in value.split(",") if host.strip() != ""]
+
+
+def is_selected_host(host: str, patterns: Iterable[str]) -> bool:
+    host = host.lower()
+    return any(pattern == ANY_HOST or fnmatch.fnmatchcase(host, pattern) for pattern in patterns)
+
+
+class TracedNetworkBackend(httpcore.SyncBackend):
+    """Network backend resolving host names with utils.http_tracing.resolve, and measuring name resolution and
+    TCP connect durations for the current trace, as the connections of the TracingHTTPAdapter do"""
+
+    def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                    local_address: Optional[str] = None, socket_options=None) -> httpcore.NetworkStream:
+        started = time.perf_counter()
+        try:
+            addresses = resolve(host, port)
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(str(e)) from e
+        resolved = time.perf_counter()
+
+        stream: Optional[httpcore.NetworkStream] = None
+        for idx, address in enumerate(addresses):
+            try:
+                stream = super().connect_tcp(address, port, timeout, local_address, socket_options)
+                break
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                if idx == len(addresses) - 1:
+                    raise
+
+        trace = get_current_trace()
+        if trace is not None:
+            trace.add_connection((resolved - started) * 1000, (time.perf_counter() - resolved) * 1000)
+
+        return stream  # type: ignore
+
+
+@Singleton
+class HTTP2ConnectionPools:
+    """Connection pools of the worker, by certificate verification and HTTP versions"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pools: Dict[Tuple[Union[bool, str], bool], httpcore.ConnectionPool] = {}
+        self._http1_hosts: Set[str] = set()
+        self._streams: "weakref.WeakSet[object]" = weakref.WeakSet()
+        if not HTTP2_AVAILABLE:
+            logging.getLogger().warning("h2 is not installed (pip install httpcore[http2]), HTTP/1.1 is used for the "
+                                        "hosts of http.http2.hosts")
+
+    def get_pool(self, host: str, verify: Union[bool, str]) -> httpcore.ConnectionPool:
+        http2 = self.is_http2_allowed(host)
+        with self._lock:
+            if (verify, http2) not in self._pools:
+                self._pools[(verify, http2)] = httpcore.ConnectionPool(
+                    ssl_context=_create_ssl_context(verify), max_connections=MAX_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_S, http1=True, http2=http2,
+                    network_backend=TracedNetworkBackend())
+
+            return self._pools[(verify, http2)]
+
+    def is_http2_allowed(self, host: str) -> bool:
+        return HTTP2_AVAILABLE and host not in self._http1_hosts
+
+    def use_http1(self, host: str):
+        """HTTP/1.1 is used for the following calls to the host"""
+        with self._lock:
+            self._http1_hosts.add(host)
+        Metrics.instance().increment("upstream.http2_fallbacks", host=host)
+
+    def record_connection(self, host: str, response: httpcore.Response):
+        """Count the connection of the response as new or reused"""
+        stream = response.extensions.get("network_stream")
+        version = response.extensions.get("http_version", b"HTTP/1.1").decode("ascii")
+        if stream is not None:
+            with self._lock:
+                outcome = "reused" if stream in self._streams else "new"
+                self._streams.add(stream)
+            Metrics.instance().increment("upstream.connections", host=host, version=version, outcome=outcome)
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+class HTTP2Adapter(TracingHTTPAdapter):
+    """Transport adapter sending the calls of the selected hosts through HTTP2ConnectionPools"""
+
+    def __init__(self, hosts: Iterable[str], *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.hosts: List[str] = list(hosts)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        host = urlparse(request.url).hostname or ""
+        if cert is not None or _get_proxy(request.url, proxies) or not is_selected_host(host, self.hosts):
+            return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+        pools = HTTP2ConnectionPools.instance()
+        try:
+            response = self._send_with_fallback(pools, host, request, timeout, verify)
+        except (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError,
+                httpcore.UnsupportedProtocol) as e:
+            raise _to_requests_error(e, request) from e
+        pools.record_connection(host, response)
+
+        return self.build_response(request, _to_urllib3_response(request, response))
+
+    def _send_with_fallback(self, pools: HTTP2ConnectionPools, host: str, request, timeout,
+                            verify: Union[bool, str]) -> httpcore.Response:
+        http2 = pools.is_http2_allowed(host)
+        try:
+            return self._send_with_pool(pools.get_pool(host, verify), request, timeout)
+        except httpcore.ProtocolError:
+            if not http2:
+                raise
+            pools.use_http1(host)
+            if request.method not in IDEMPOTENT_METHODS:
+                raise
+
+        return self._send_with_pool(pools.get_pool(host, verify), request, timeout)
+
+    def _send_with_pool(self, pool: httpcore.ConnectionPool, request, timeout) -> httpcore.Response:
+        return pool.request(request.method, request.url, headers=_get_headers(request),
+                            content=_get_body(request.body),
+                            extensions={"timeout": _get_timeouts(timeout), "trace": _trace_tls})
+
+
+def _to_requests_error(error: Exception, request) -> requests.exceptions.RequestException:
+    """requests exception of an httpcore one, as HTTPAdapter raises for urllib3 ones"""
+    if isinstance(error, (httpcore.ConnectTimeout, httpcore.PoolTimeout)):
+        return requests.exceptions.ConnectTimeout(error, request=request)
+    elif isinstance(error, httpcore.TimeoutException):
+        return requests.exceptions.ReadTimeout(error, request=request)
+    elif isinstance(error, httpcore.ConnectError) and isinstance(error.__context__, ssl.SSLError):
+        return requests.exceptions.SSLError(error, request=request)
+    elif isinstance(error, httpcore.UnsupportedProtocol):
+        return requests.exceptions.InvalidSchema(error, request=request)
+
+    return requests.exceptions.ConnectionError(error, request=request)
+
+
+class _OriginalResponse:
+    """Stands for the http.client response urllib3 reads the cookies from"""
+
+    def __init__(self, headers: List[Tuple[str, str]]) -> None:
+        self.msg = HTTPMessage()
+        for name, value in headers:
+            self.msg[name] = value  # repeated headers (ie: Set-Cookie) are all kept
+
+    def isclosed(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+def _to_urllib3_response(request, response: httpcore.Response) -> HTTPResponse:
+    """urllib3 response decoding the body (Content-Encoding) for requests"""
+    headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.headers]
+    header_dict = HTTPHeaderDict()
+    for name, value in headers:
+        header_dict.add(name, value)
+    version = response.extensions.get("http_version", b"HTTP/1.1").decode("ascii")
+    reason = response.extensions.get("reason_phrase", b"").decode("latin-1") or responses.get(response.status, "")
+
+    return HTTPResponse(body=BytesIO(response.content), headers=header_dict, status=response.status,
+                        version=20 if version == "HTTP/2" else 11, version_string=version, reason=reason,
+                        preload_content=False, decode_content=True, original_response=_OriginalResponse(headers),
+                        request_method=request.method, request_url=request.url)
+
+
+def _get_headers(request) -> List[Tuple[bytes, bytes]]:
+    headers = [(name.encode("latin-1"), value.encode("latin-1") if isinstance(value, str) else value)
+               for name, value in request.headers.items()]
+    if "Host" not in request.headers:
+        headers.insert(0, (b"Host", urlparse(request.url).netloc.encode("ascii")))
+
+    return headers
+
+
+def _get_body(body) -> Union[bytes, Iterable[bytes]]:
+    if body is None:
+        return b""
+    elif isinstance(body, str):
+        return body.encode("utf-8")
+    elif hasattr(body, "read"):
+        return body.read()
+
+    return body
+
+
+def _get_timeouts(timeout) -> Dict[str, Optional[float]]:
+    """httpcore timeouts of a requests timeout: None, a number or a (connect, read) tuple"""
+    connect = read = timeout
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+
+    return {"connect": connect, "read": read, "write": read, "pool": connect}
+
+
+def _get_proxy(url: str, proxies: Optional[dict]) -> Optional[str]:
+    return requests.utils.select_proxy(url, proxies) if proxies else None
+
+
+def _create_ssl_context(verify: Union[bool, str]) -> ssl.SSLContext:
+    context = httpcore.default_ssl_context()
+    if verify is False:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif isinstance(verify, str) and os.path.isdir(verify):
+        context.load_verify_locations(capath=verify)
+    elif isinstance(verify, str):
+        context.load_verify_locations(cafile=verify)
+
+    return context
+
+
+_tls_started = threading.local()
+
+
+def _trace_tls(event_name: str, info: dict):
+    """httpcore trace callback measuring the TLS handshake duration for the current trace"""
+    if event_name == "connection.start_tls.started":
+        _tls_started.value = time.perf_counter()
+    elif event_name == "connection.start_tls.complete":
+        trace = get_current_trace()
+        if trace is not None:
+            trace.add_tls((time.perf_counter() - getattr(_tls_started, "value", time.perf_counter())) * 1000)
@@ -1,20 +1,56 @@
 """HTTP client utilities with default timeouts and configuration."""
 
-from typing import Optional
+import copy
+import hashlib
+from typing import Any, Callable, Optional, Tuple
+from urllib.parse import urlparse
 import requests
+from requests.cookies import merge_cookies
+
+from utils.circuit_breaker import CircuitBreakers, NegativeCache, is_failure_status
+from utils.hedging import HedgingPolicy
+from utils.http2_transport import HTTP2Adapter, parse_hosts
+from utils.http_replay import TRANSPORT_LIVE, ReplayMissError, create_transport_adapter
+from utils.http_tracing import TracingHTTPAdapter, trace_upstream_call
+from utils.request_context import get_remaining_time, is_deadline_exceeded
+from utils.single_flight import get_single_flight
 
 
 class HTTPSession(requests.Session):
-    """Session with default timeout configuration."""
+    """Session with default timeout configuration, tracing every upstream call.
+
+    Depending on the transport mode (http.transport.mode setting or PYRSSW_HTTP_TRANSPORT_MODE environment
+    variable), upstream calls go to the network (live), are also recorded into an archive (record) or are
+    served from a recorded archive (replay), see utils.http_replay.
+    Identical concurrent GET requests (same url and headers, cookies included) share the same upstream call.
+    Calls to failing hosts fail fast while their circuit breaker is open and 404/410 responses are cached for a
+    short time, see utils.circuit_breaker.
+    Timeouts are shortened to fit in the deadline of the current request, see utils.request_context.
+    Live calls to the hosts of the http.http2.hosts setting use HTTP/2 when possible, see utils.http2_transport.
+    Slow GET requests to the hosts of the http.hedge.hosts setting are sent twice, see utils.hedging.
+    """
 
     DEFAULT_TIMEOUT = 30  # 30 seconds timeout
     DEFAULT_CONNECT_TIMEOUT = 10  # 10 seconds connection timeout
+    DEFAULT_TRACE_SLOW_THRESHOLD_MS = 2000  # calls slower than 2 seconds are kept
+    DEFAULT_TRACE_SLOW_CALLS = 100  # number of slow calls kept
 
     def __init__(
         self, timeout: Optional[float] = None, connect_timeout: Optional[float] = None
     ):
         super().__init__()
 
+        self.trace_enabled = True
+        self.trace_slow_threshold_ms = float(self.DEFAULT_TRACE_SLOW_THRESHOLD_MS)
+        self.trace_slow_calls = self.DEFAULT_TRACE_SLOW_CALLS
+        self.single_flight_enabled = True
+        self.circuit_breaker_enabled = True
+        transport_mode: str = TRANSPORT_LIVE
+        transport_archive: str = ""
+        replay_latency: str = ""
+        http2_hosts: str = ""
+        hedge_hosts: str = ""
+
         # Try to get timeout from config, fallback to defaults
         try:
             from config.config import (
@@ -23,6 +59,16 @@ class HTTPSession(requests.Session):
                 DEFAULT_HTTP_CONNECT_TIMEOUT,
                 HTTP_TIMEOUT_KEY,
                 HTTP_CONNECT_TIMEOUT_KEY,
+                HTTP_TRACE_ENABLED_KEY,
+                HTTP_TRACE_SLOW_THRESHOLD_KEY,
+                HTTP_TRACE_SLOW_CALLS_KEY,
+                HTTP_TRANSPORT_MODE_KEY,
+                HTTP_TRANSPORT_ARCHIVE_KEY,
+                HTTP_REPLAY_LATENCY_KEY,
+                HTTP_SINGLE_FLIGHT_ENABLED_KEY,
+                HTTP_CIRCUIT_BREAKER_ENABLED_KEY,
+                HTTP_HTTP2_HOSTS_KEY,
+                HTTP_HEDGE_HOSTS_KEY,
             )
 
             config_instance = Config.instance()
@@ -36,14 +82,132 @@ class HTTPSession(requests.Session):
                     HTTP_CONNECT_TIMEOUT_KEY, str(DEFAULT_HTTP_CONNECT_TIMEOUT)
                 )
             )
+            self.trace_enabled = config_instance.get_bool_property(
+                HTTP_TRACE_ENABLED_KEY, True)
+            self.trace_slow_threshold_ms = config_instance.get_float_property(
+                HTTP_TRACE_SLOW_THRESHOLD_KEY, self.trace_slow_threshold_ms)
+            self.trace_slow_calls = config_instance.get_int_property(
+                HTTP_TRACE_SLOW_CALLS_KEY, self.trace_slow_calls)
+            transport_mode = config_instance.get_property(HTTP_TRANSPORT_MODE_KEY, TRANSPORT_LIVE)
+            transport_archive = config_instance.get_property(HTTP_TRANSPORT_ARCHIVE_KEY, "")
+            replay_latency = config_instance.get_property(HTTP_REPLAY_LATENCY_KEY, "")
+            self.single_flight_enabled = config_instance.get_bool_property(
+                HTTP_SINGLE_FLIGHT_ENABLED_KEY, True)
+            self.circuit_breaker_enabled = config_instance.get_bool_property(
+                HTTP_CIRCUIT_BREAKER_ENABLED_KEY, True)
+            http2_hosts = config_instance.get_property(HTTP_HTTP2_HOSTS_KEY, "")
+            hedge_hosts = config_instance.get_property(HTTP_HEDGE_HOSTS_KEY, "")
         except Exception:
             # Fallback to provided values or defaults if config loading fails
             self.timeout = timeout or self.DEFAULT_TIMEOUT
             self.connect_timeout = connect_timeout or self.DEFAULT_CONNECT_TIMEOUT
 
+        # a misconfigured transport must not silently call the network: errors are raised
+        transport_adapter = create_transport_adapter(transport_mode, transport_archive, replay_latency)
+        if transport_adapter is not None:
+            self.mount("https://", transport_adapter)
+            self.mount("http://", transport_adapter)
+        elif len(parse_hosts(http2_hosts)) > 0:
+            self.mount("https://", HTTP2Adapter(parse_hosts(http2_hosts)))
+            self.mount("http://", HTTP2Adapter(parse_hosts(http2_hosts)))
+        elif self.trace_enabled:
+            self.mount("https://", TracingHTTPAdapter())
+            self.mount("http://", TracingHTTPAdapter())
+
+        # recorded or replayed calls are never hedged
+        self.hedging_enabled = transport_adapter is None and len(parse_hosts(hedge_hosts)) > 0
+
         # Set default headers
         self.headers.update({"User-Agent": "Mozilla/5.0 (compatible; pyrssw/1.0)"})
 
+    def request(self, method, url, *args, **kwargs):
+        """Override request to trace every upstream call (redirects included)."""
+        if not self.trace_enabled:
+            return super().request(method, url, *args, **kwargs)
+
+        with trace_upstream_call(
+            method, url, self.trace_slow_threshold_ms, self.trace_slow_calls
+        ) as trace:
+            response = super().request(method, url, *args, **kwargs)
+            trace.set_response(response)
+
+        return response
+
+    def send(self, request, **kwargs):
+        """Override send to share the response of identical concurrent GET requests.
+        Streamed requests and redirects (sent with allow_redirects=False) are not shared."""
+        if not self.single_flight_enabled or request.method != "GET" or kwargs.get("stream", False) \
+                or not kwargs.get("allow_redirects", True):
+            return self._send_upstream(request, **kwargs)
+
+        key = hashlib.sha1(("%s %s" % (request.url, sorted(request.headers.items()))).encode("utf-8")).hexdigest()
+        response = get_single_flight("upstream").do(key, lambda: self._send_upstream(request, **kwargs))
+        if response.request is not request:
+            # response of another session: copied (the body has been read), with its cookies
+            response = copy.copy(response)
+            response.request = request
+            merge_cookies(self.cookies, response.cookies)
+
+        return response
+
+    def _send_upstream(self, request, **kwargs):
+        """Send the request unless the host circuit breaker is open or the url recently returned 404/410.
+        The timeout is shortened to fit in the deadline of the current request, if any.
+
+        Raises:
+            CircuitOpenError: if the circuit breaker of the host is open
+            DeadlineExceededError: if the deadline of the current request is exceeded
+        """
+        kwargs["timeout"], shortened = fit_timeout_in_deadline(request, kwargs.get("timeout"))
+        if not self.circuit_breaker_enabled:
+            return send_within_deadline(lambda: self._send_hedged(request, **kwargs), shortened)
+
+        negative_cache = NegativeCache.instance()
+        if request.method == "GET" and negative_cache.is_enabled():
+            response = negative_cache.get(request.url)
+            if response is not None:
+                response.request = request
+                return response
+
+        breaker = CircuitBreakers.instance().get(urlparse(request.url).hostname or "")
+        breaker.before_call()
+        try:
+            response = send_within_deadline(lambda: self._send_hedged(request, **kwargs), shortened)
+        except (DeadlineExceededError, ReplayMissError):
+            breaker.release_probe()  # the host is not responsible for the budget of the request or the archive
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            breaker.record_failure()
+            raise
+        except Exception:
+            breaker.record_success()  # the host answered
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+
+        if is_failure_status(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            if request.method == "GET" and negative_cache.is_enabled() and not kwargs.get("stream", False):
+                negative_cache.put(request.url, response)
+
+        return response
+
+    def _send_hedged(self, request, **kwargs):
+        """Send the request, hedged when it is a GET to a hedged host (see utils.hedging)"""
+        def send(prepared_request):
+            return super(HTTPSession, self).send(prepared_request, **kwargs)
+
+        if self.hedging_enabled and request.method == "GET" and not kwargs.get("stream", False):
+            host = urlparse(request.url).hostname or ""
+            delay = HedgingPolicy.instance().get_delay(host)
+            if delay is not None:
+                return HedgingPolicy.instance().send(send, request, host, delay)
+
+        return send(request)
+
     def get(self, url, **kwargs):
         """Override get to add default timeout if not specified."""
         if "timeout" not in kwargs:
@@ -75,6 +239,42 @@ class HTTPSession(requests.Session):
         return super().delete(url, **kwargs)
 
 
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """Raised when the deadline of the current request (see utils.request_context) is exceeded"""
+
+
+def fit_timeout_in_deadline(request, timeout) -> Tuple[Any, bool]:
+    """Returns the timeout shortened to the remaining time of the current request, and if it was shortened
+
+    Raises:
+        DeadlineExceededError: if the deadline of the current request is already exceeded
+    """
+    remaining = get_remaining_time()
+    if remaining is None:
+        return timeout, False
+    if remaining <= 0:
+        raise DeadlineExceededError("Request deadline exceeded before calling %s" % request.url, request=request)
+
+    shortened = timeout
+    if timeout is None:
+        shortened = remaining
+    elif isinstance(timeout, tuple):
+        shortened = tuple(remaining if value is None else min(value, remaining) for value in timeout)
+    elif isinstance(timeout, (int, float)):
+        shortened = min(timeout, remaining)
+
+    return shortened, shortened != timeout
+
+
+def send_within_deadline(send: Callable[[], requests.Response], shortened: bool) -> requests.Response:
+    try:
+        return send()
+    except requests.exceptions.Timeout as e:
+        if shortened and is_deadline_exceeded():
+            raise DeadlineExceededError("Request deadline exceeded: %s" % str(e), request=e.request) from e
+        raise
+
+
 class HTTPClient:
     """HTTP client with default timeout and retry configuration."""
 
@@ -84,7 +284,7 @@ class HTTPClient:
     def __init__(
         self, timeout: Optional[float] = None, connect_timeout: Optional[float] = None
     ):
-        self.session = requests.Session()
+        self.session = HTTPSession(timeout, connect_timeout)
 
         # Try to get timeout from config, fallback to defaults
         try:
@@ -0,0 +1,580 @@
+"""Recording and replay of upstream HTTP traffic.
+
+An archive describes the recorded exchanges (method, url, redacted request headers, status, response headers,
+duration) in an index.json file and keeps one file per distinct response body. It is either a directory or,
+when its path ends with .zip, a compressed zip file. A directory archive can also list exchanges in an
+index.jsonl file (one entry per line), appended while the traffic is recorded.
+The ReplayAdapter serves the archive exchanges instead of calling the network: it can be mounted on any
+requests.Session (HTTPSession included) so that handlers run without network, with stable inputs.
+The RecordingAdapter performs real calls and adds every exchange to a ReplayArchive (kept in memory, to be saved)
+or to an ArchiveRecorder (written to disk as they are recorded).
+
+HTTPSession mounts them according to the http.transport.mode setting (see create_transport_adapter), so that
+the whole server can record its upstream traffic or run against a recorded one.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import timedelta
+from http.client import HTTPMessage, responses
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from utils.http_tracing import TracingHTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, concurrent recordings are not merged safely
+    fcntl = None  # type: ignore
+
+ARCHIVE_INDEX = "index.json"
+RECORDING_INDEX = "index.jsonl"  # entries appended while recording
+RECORDING_SUFFIX = ".recording"  # directory where a zip archive is recorded before being packed
+ARCHIVE_VERSION = 2
+ZIP_ARCHIVE_SUFFIX = ".zip"
+
+# response headers which are not kept in archives: bodies are stored decoded and headers depending on the transport are useless
+IGNORED_RESPONSE_HEADERS = ["content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"]
+
+# headers whose values are never written in archives
+SENSITIVE_HEADERS = ["authorization", "proxy-authorization", "x-api-key", "x-auth-token", "x-csrf-token"]
+COOKIE_HEADERS = ["cookie", "set-cookie"]
+REDACTED = "REDACTED"
+
+# query parameters whose values are never written in archives (ie: api keys and signatures of the called urls)
+SENSITIVE_PARAMETER_PATTERN = re.compile(r"token|secret|passw|api_?key|^(key|sig|signature|auth|session|sid)$",
+                                         re.IGNORECASE)
+
+TRANSPORT_LIVE = "live"
+TRANSPORT_RECORD = "record"
+TRANSPORT_REPLAY = "replay"
+TRANSPORT_MODES = [TRANSPORT_LIVE, TRANSPORT_RECORD, TRANSPORT_REPLAY]
+
+# environment variables overriding the http.transport.* and http.replay.* settings
+TRANSPORT_MODE_ENV = "PYRSSW_HTTP_TRANSPORT_MODE"
+TRANSPORT_ARCHIVE_ENV = "PYRSSW_HTTP_TRANSPORT_ARCHIVE"
+REPLAY_LATENCY_ENV = "PYRSSW_HTTP_REPLAY_LATENCY_MS"
+
+# latency value meaning that the recorded duration of every exchange is simulated
+RECORDED_LATENCY = "recorded"
+ANY_HOST = "*"
+
+# "name=value" at the beginning of a cookie (Cookie header) or of a Set-Cookie value (possibly joined by commas)
+_COOKIE_VALUE_PATTERN = re.compile(r"(^|;\s*|,\s*)([^=;,\s]+)=([^;,]*)")
+_SET_COOKIE_VALUE_PATTERN = re.compile(r"(^|,\s*)([^=;,\s]+)=([^;]*)")
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """Raised when the requested url has not been recorded in the archive"""
+
+
+class RecordedExchange:
+    """One recorded request/response pair"""
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes,
+                 request_headers: Optional[Dict[str, str]] = None, elapsed_ms: float = 0.0) -> None:
+        self.method: str = method.upper()
+        self.url: str = url
+        self.status: int = status
+        self.headers: Dict[str, str] = headers
+        self.body: bytes = body
+        self.request_headers: Dict[str, str] = request_headers or {}
+        self.elapsed_ms: float = elapsed_ms
+
+    def get_key(self) -> Tuple[str, str]:
+        return self.method, normalize_url(self.url)
+
+    def get_body_name(self) -> str:
+        return hashlib.sha1(self.body).hexdigest()[:16]
+
+
+class ReplayArchive:
+    """Recorded exchanges, looked up by method and normalized url.
+
+    When the same url has been recorded several times, the recordings are served in the recorded order and
+    the last one is served again once they have all been served. reset() restarts from the first recording.
+    """
+
+    def __init__(self, exchanges: Optional[List[RecordedExchange]] = None) -> None:
+        self._lock = threading.Lock()
+        self._exchanges: Dict[Tuple[str, str], List[RecordedExchange]] = {}
+        self._positions: Dict[Tuple[str, str], int] = {}
+        for exchange in exchanges or []:
+            self.add(exchange)
+
+    def add(self, exchange: RecordedExchange):
+        with self._lock:
+            self._exchanges.setdefault(exchange.get_key(), []).append(exchange)
+
+    def find(self, method: str, url: str) -> Optional[RecordedExchange]:
+        found: Optional[RecordedExchange] = None
+        key = (method.upper(), normalize_url(url))
+        with self._lock:
+            exchanges = self._exchanges.get(key, [])
+            if len(exchanges) > 0:
+                position = self._positions.get(key, 0)
+                found = exchanges[min(position, len(exchanges) - 1)]
+                self._positions[key] = position + 1
+
+        return found
+
+    def get_exchanges(self) -> List[RecordedExchange]:
+        with self._lock:
+            return [exchange for exchanges in self._exchanges.values() for exchange in exchanges]
+
+    def reset(self):
+        with self._lock:
+            self._positions.clear()
+
+    @staticmethod
+    def load(path: str) -> "ReplayArchive":
+        """Load an archive directory or zip file
+
+        Raises:
+            OSError: if the archive can not be read
+        """
+        archive = ReplayArchive()
+        if path.endswith(ZIP_ARCHIVE_SUFFIX):
+            try:
+                with zipfile.ZipFile(path, "r") as zip_file:
+                    archive._load_entries(json.loads(zip_file.read(ARCHIVE_INDEX)), zip_file.read)
+            except (zipfile.BadZipFile, KeyError) as e:
+                raise OSError("Invalid archive '%s': %s" % (path, str(e))) from e
+        else:
+            index: dict = {"entries": []}
+            if os.path.exists(os.path.join(path, ARCHIVE_INDEX)) \
+                    or not os.path.exists(os.path.join(path, RECORDING_INDEX)):
+                with open(os.path.join(path, ARCHIVE_INDEX), "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            index["entries"] = index.get("entries", []) + _read_recording_index(path)[0]
+            archive._load_entries(index, lambda name: _read_file(os.path.join(path, name)))
+
+        return archive
+
+    def _load_entries(self, index: dict, read_body):
+        bodies: Dict[str, bytes] = {}
+        for entry in index.get("entries", []):
+            if entry["body"] not in bodies:
+                bodies[entry["body"]] = read_body(entry["body"])
+            self.add(RecordedExchange(entry["method"], entry["url"], int(entry["status"]),
+                                      entry.get("headers", {}), bodies[entry["body"]],
+                                      entry.get("request_headers", {}), float(entry.get("elapsed_ms", 0))))
+
+    def save(self, path: str):
+        """Write the archive in the given directory or zip file, bodies are named after their content hash
+        so that identical bodies are only stored once"""
+        entries: List[dict] = []
+        bodies: Dict[str, bytes] = {}
+        for exchange in self.get_exchanges():
+            body_name = exchange.get_body_name()
+            bodies[body_name] = exchange.body
+            entries.append(_to_entry(exchange, body_name))
+
+        index = json.dumps({"version": ARCHIVE_VERSION, "entries": entries}, indent=2)
+        if path.endswith(ZIP_ARCHIVE_SUFFIX):
+            # written aside then renamed, so that a reader never sees a partial archive
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=ZIP_ARCHIVE_SUFFIX,
+                                            dir=os.path.dirname(os.path.abspath(path)))
+            with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr(ARCHIVE_INDEX, index)
+                for body_name, body in bodies.items():
+                    zip_file.writestr(body_name, body)
+            os.replace(tmp_path, path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for body_name, body in bodies.items():
+                with open(os.path.join(path, body_name), "wb") as f:
+                    f.write(body)
+            with open(os.path.join(path, ARCHIVE_INDEX), "w", encoding="utf-8") as f:
+                f.write(index)
+            if os.path.exists(os.path.join(path, RECORDING_INDEX)):  # its entries are in the archive if loaded
+                os.remove(os.path.join(path, RECORDING_INDEX))
+
+
+class ArchiveRecorder:
+    """Writes the recorded exchanges to disk as they are recorded, so that neither the bodies are kept in memory
+    nor the archive rewritten: a new body is written once in the archive directory and the entry of the exchange
+    appended to its index.jsonl, under the lock shared by the processes recording the same archive (uWSGI
+    workers). Exchanges already recorded (same method, url and body) are not appended again.
+
+    A zip archive is recorded in the <archive>.recording directory, then packed into the zip file (with the
+    exchanges it already contains) by pack(). The directory is kept, so that the recordings of the processes
+    killed before packing are packed by the next one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.directory: str = path + RECORDING_SUFFIX if path.endswith(ZIP_ARCHIVE_SUFFIX) else path
+        self._known: Set[Tuple[Tuple[str, str], str]] = set()
+        self._read_offset: int = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        if not path.endswith(ZIP_ARCHIVE_SUFFIX) and os.path.exists(os.path.join(path, ARCHIVE_INDEX)):
+            with open(os.path.join(path, ARCHIVE_INDEX), "r", encoding="utf-8") as f:
+                self._add_known(json.load(f).get("entries", []))
+
+    def add(self, exchange: RecordedExchange):
+        body_name = exchange.get_body_name()
+        with self._lock, _archive_lock(self.path):
+            entries, self._read_offset = _read_recording_index(self.directory, self._read_offset)
+            self._add_known(entries)  # recorded by the other processes
+            if (exchange.get_key(), body_name) in self._known:
+                return
+
+            body_path = os.path.join(self.directory, body_name)
+            if not os.path.exists(body_path):
+                _write_file(body_path, exchange.body)
+            with open(os.path.join(self.directory, RECORDING_INDEX), "ab") as f:
+                f.write((json.dumps(_to_entry(exchange, body_name)) + "\n").encode("utf-8"))
+                self._read_offset = f.tell()
+            self._known.add((exchange.get_key(), body_name))
+
+    def pack(self):
+        """Pack the exchanges recorded in the directory of a zip archive into the zip file. Only the index is
+        read in memory, bodies are copied from the previous zip file or from the recording directory."""
+        if not self.path.endswith(ZIP_ARCHIVE_SUFFIX):
+            return
+        with self._lock, _archive_lock(self.path):
+            entries: List[dict] = []
+            previous: Optional[zipfile.ZipFile] = None
+            if os.path.exists(self.path):
+                try:
+                    previous = zipfile.ZipFile(self.path, "r")
+                    entries = json.loads(previous.read(ARCHIVE_INDEX)).get("entries", [])
+                except (zipfile.BadZipFile, KeyError, ValueError) as e:
+                    logging.getLogger().warning("Recorded archive '%s' can not be read, it is replaced: %s",
+                                                self.path, str(e))
+                    if previous is not None:
+                        previous.close()
+                    previous, entries = None, []
+            try:
+                known = set(_get_entry_key(entry) for entry in entries)
+                for entry in _read_recording_index(self.directory)[0]:
+                    if _get_entry_key(entry) not in known:
+                        known.add(_get_entry_key(entry))
+                        entries.append(entry)
+
+                # written aside then renamed, so that a reader never sees a partial archive
+                fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=ZIP_ARCHIVE_SUFFIX,
+                                                dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                    zip_file.writestr(ARCHIVE_INDEX, json.dumps({"version": ARCHIVE_VERSION, "entries": entries},
+                                                                indent=2))
+                    for body_name in set(entry["body"] for entry in entries):
+                        if os.path.exists(os.path.join(self.directory, body_name)):
+                            zip_file.write(os.path.join(self.directory, body_name), body_name)
+                        elif previous is not None:
+                            with previous.open(body_name) as source, zip_file.open(body_name, "w") as target:
+                                shutil.copyfileobj(source, target)
+            finally:
+                if previous is not None:
+                    previous.close()
+            os.replace(tmp_path, self.path)
+
+    def _add_known(self, entries: List[dict]):
+        for entry in entries:
+            self._known.add(_get_entry_key(entry))
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter serving responses from an archive, never calling the network.
+
+    Latencies (in milliseconds) can be simulated per host, ANY_HOST being used for the other hosts.
+    A RECORDED_LATENCY value simulates the recorded duration of each exchange.
+    """
+
+    def __init__(self, archive: ReplayArchive, latencies: Optional[Dict[str, str]] = None) -> None:
+        super().__init__()
+        self.archive: ReplayArchive = archive
+        self.latencies: Dict[str, str] = latencies or {}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        exchange = self.archive.find(request.method, request.url)
+        if exchange is None:
+            raise ReplayMissError("No recorded response for %s %s" % (request.method, request.url), request=request)
+
+        latency_ms = self.get_latency_ms(exchange)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if isinstance(read_timeout, (int, float)) and latency_ms / 1000 > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout("Replayed response of %s %s takes more than %ss" % (
+                request.method, request.url, read_timeout), request=request)
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000)
+        response = build_response(request, exchange)
+        response.elapsed = timedelta(milliseconds=latency_ms)
+
+        return response
+
+    def get_latency_ms(self, exchange: RecordedExchange) -> float:
+        latency = self.latencies.get(urlsplit(exchange.url).hostname or "", self.latencies.get(ANY_HOST, "0"))
+        return exchange.elapsed_ms if latency == RECORDED_LATENCY else float(latency)
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(TracingHTTPAdapter):
+    """Transport adapter calling the network and keeping every exchange in an archive.
+    Sensitive headers and cookie values are redacted before being kept."""
+
+    def __init__(self, archive: Union[ReplayArchive, ArchiveRecorder], *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.archive: Union[ReplayArchive, ArchiveRecorder] = archive
+
+    def send(self, request, *args, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        response = super().send(request, *args, **kwargs)
+        content = response.content  # the whole body is read so that its download is part of the duration
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in IGNORED_RESPONSE_HEADERS}
+        self.archive.add(RecordedExchange(request.method, redact_url(request.url), response.status_code,
+                                          redact_headers(headers), content,
+                                          redact_headers(dict(request.headers)),
+                                          (time.perf_counter() - started) * 1000))
+
+        return response
+
+
+def redact_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Returns a copy of the headers without secrets: sensitive header values are replaced,
+    cookies keep their names but not their values"""
+    redacted: Dict[str, str] = {}
+    for name, value in headers.items():
+        lower_name = name.lower()
+        if lower_name in SENSITIVE_HEADERS:
+            value = REDACTED
+        elif lower_name == "cookie":
+            value = _COOKIE_VALUE_PATTERN.sub(r"\1\2=" + REDACTED, value)
+        elif lower_name == "set-cookie":
+            value = _SET_COOKIE_VALUE_PATTERN.sub(r"\1\2=" + REDACTED, value)
+        redacted[name] = value
+
+    return redacted
+
+
+def redact_url(url: str) -> str:
+    """Returns the url without the values of its sensitive query parameters (see SENSITIVE_PARAMETER_PATTERN)"""
+    parts = urlsplit(url)
+    parameters = parse_qsl(parts.query, keep_blank_values=True)
+    if not any(SENSITIVE_PARAMETER_PATTERN.search(name) for name, _ in parameters):
+        return url
+
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(_redact_parameters(parameters)),
+                       parts.fragment))
+
+
+def _redact_parameters(parameters: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return [(name, REDACTED if SENSITIVE_PARAMETER_PATTERN.search(name) else value) for name, value in parameters]
+
+
+class _ReplayedBody(BytesIO):
+    """Body of a replayed response, with the headers requests reads the cookies from"""
+
+    class _OriginalResponse:
+        def __init__(self, headers: Dict[str, str]) -> None:
+            self.msg = HTTPMessage()
+            for name, value in headers.items():
+                self.msg[name] = value
+
+    def __init__(self, body: bytes, headers: Dict[str, str]) -> None:
+        super().__init__(body)
+        self._original_response = _ReplayedBody._OriginalResponse(headers)
+
+
+def build_response(request: requests.PreparedRequest, exchange: RecordedExchange) -> requests.Response:
+    response = requests.Response()
+    response.status_code = exchange.status
+    response.headers = CaseInsensitiveDict(exchange.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = _ReplayedBody(exchange.body, exchange.headers)
+    extract_cookies_to_jar(response.cookies, request, response.raw)
+    response._content = exchange.body
+    response._content_consumed = True
+    response.url = request.url
+    response.reason = responses.get(exchange.status, "")
+    response.request = request
+
+    return response
+
+
+def normalize_url(url: str) -> str:
+    """Normalize the url so that equivalent urls share the same archive key:
+    scheme and host are lower cased, default ports and fragments are removed, query parameters are sorted and
+    the values of the sensitive ones are redacted (as they are in archives)
+    """
+    parts = urlsplit(url)
+    netloc = (parts.hostname or "").lower()
+    if parts.port is not None and (parts.scheme, parts.port) not in [("http", 80), ("https", 443)]:
+        netloc += ":%d" % parts.port
+
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or "/",
+                       urlencode(sorted(_redact_parameters(parse_qsl(parts.query, keep_blank_values=True)))), ""))
+
+
+def parse_latencies(value: str) -> Dict[str, str]:
+    """Parse a latency setting: either a single value used for every host ("50", "recorded")
+    or a list of host=value ("www.lemonde.fr=120,*=recorded")
+
+    Raises:
+        ValueError: if a latency is neither a number nor RECORDED_LATENCY
+    """
+    latencies: Dict[str, str] = {}
+    for item in value.split(","):
+        if item.strip() != "":
+            host, _, latency = item.rpartition("=")
+            latency = latency.strip().lower()
+            if latency != RECORDED_LATENCY:
+                float(latency)
+            latencies[host.strip().lower() or ANY_HOST] = latency
+
+    return latencies
+
+
+_archives: Dict[str, ReplayArchive] = {}
+_recorders: Dict[str, ArchiveRecorder] = {}
+_archives_lock = threading.Lock()
+
+
+def create_transport_adapter(mode: str, archive_path: str, latency: str = "") -> Optional[BaseAdapter]:
+    """Create the transport adapter of the given mode, None for the live mode.
+
+    Every session of the process shares the same archive: in replay mode it is loaded once, in record mode
+    exchanges are written as they are recorded (zip archives are packed when the process exits).
+
+    Environment variables override the given settings, so that a server can run on recorded traffic without
+    changing its configuration file.
+
+    Raises:
+        ValueError: for an unknown mode or when no archive is given
+        OSError: if the archive to replay can not be read
+    """
+    mode = os.environ.get(TRANSPORT_MODE_ENV, mode).strip().lower() or TRANSPORT_LIVE
+    archive_path = os.environ.get(TRANSPORT_ARCHIVE_ENV, archive_path).strip()
+    latency = os.environ.get(REPLAY_LATENCY_ENV, latency)
+    if mode not in TRANSPORT_MODES:
+        raise ValueError("Unknown HTTP transport mode '%s', expected one of %s" % (mode, ", ".join(TRANSPORT_MODES)))
+
+    adapter: Optional[BaseAdapter] = None
+    if mode != TRANSPORT_LIVE:
+        if archive_path == "":
+            raise ValueError("The HTTP transport mode '%s' needs an archive" % mode)
+        if mode == TRANSPORT_REPLAY:
+            adapter = ReplayAdapter(_get_archive(archive_path), parse_latencies(latency))
+        else:
+            adapter = RecordingAdapter(_get_recorder(archive_path))
+
+    return adapter
+
+
+def _get_archive(archive_path: str) -> ReplayArchive:
+    with _archives_lock:
+        if archive_path not in _archives:
+            _archives[archive_path] = ReplayArchive.load(archive_path)
+            logging.getLogger().info("Replaying the upstream HTTP traffic recorded in '%s' (%d exchanges)",
+                                     archive_path, len(_archives[archive_path].get_exchanges()))
+
+        return _archives[archive_path]
+
+
+def _get_recorder(archive_path: str) -> ArchiveRecorder:
+    with _archives_lock:
+        if archive_path not in _recorders:
+            _recorders[archive_path] = ArchiveRecorder(archive_path)
+            atexit.register(_pack_recording, _recorders[archive_path])
+            logging.getLogger().info("Recording the upstream HTTP traffic into '%s'", archive_path)
+
+        return _recorders[archive_path]
+
+
+def _pack_recording(recorder: ArchiveRecorder):
+    try:
+        recorder.pack()
+    except Exception as e:
+        logging.getLogger().error("Unable to pack the recorded upstream HTTP traffic into '%s': %s",
+                                  recorder.path, str(e))
+
+
+def _to_entry(exchange: RecordedExchange, body_name: str) -> dict:
+    entry = {
+        "method": exchange.method,
+        "url": exchange.url,
+        "status": exchange.status,
+        "headers": exchange.headers,
+        "body": body_name
+    }
+    if len(exchange.request_headers) > 0:
+        entry["request_headers"] = exchange.request_headers
+    if exchange.elapsed_ms > 0:
+        entry["elapsed_ms"] = round(exchange.elapsed_ms, 1)
+
+    return entry
+
+
+def _get_entry_key(entry: dict) -> Tuple[Tuple[str, str], str]:
+    return (entry["method"].upper(), normalize_url(entry["url"])), entry["body"]
+
+
+def _read_recording_index(directory: str, offset: int = 0) -> Tuple[List[dict], int]:
+    """Entries appended to the index.jsonl of the directory after offset, and the offset of its end.
+    A partial last line (process killed while writing it) is ignored."""
+    entries: List[dict] = []
+    try:
+        with open(os.path.join(directory, RECORDING_INDEX), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass
+    except FileNotFoundError:
+        pass
+
+    return entries, offset
+
+
+@contextmanager
+def _archive_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on an archive shared by several processes (uWSGI workers)"""
+    if fcntl is None:
+        yield
+    else:
+        with open(path.rstrip(os.sep) + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, content: bytes):
+    """Written aside then renamed, so that a reader never sees a partial file"""
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,232 @@
+"""Tracing of upstream HTTP calls made through HTTPSession.
+
+Every call is described by an UpstreamTrace (host, handler, method, status, timings, size and cache outcome).
+Connection timings (DNS, TCP connect, TLS handshake) are collected by the connection classes used by
+the TracingHTTPAdapter, which is mounted on every HTTPSession.
+Finished traces feed the per host histograms of the Metrics registry and a ring buffer of the slowest calls.
+"""
+
+import socket
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+
+from utils.dns_cache import DNSCache
+from utils.metrics import SIZE_BUCKETS_BYTES, Metrics
+from utils.request_context import get_handler_name
+
+SLOW_CALLS_EVENT = "upstream.slow_calls"
+
+# response headers used by CDNs and reverse proxies to tell if the response came from their cache
+CACHE_STATUS_HEADERS = ["cf-cache-status", "x-cache-status", "x-cache", "x-proxy-cache"]
+
+MAX_TRACED_URL_LENGTH = 300
+
+_current_trace: ContextVar[Optional["UpstreamTrace"]] = ContextVar("upstream_trace", default=None)
+
+
+class UpstreamTrace:
+    """Timings and outcome of one upstream HTTP call (redirects included)"""
+
+    def __init__(self, method: str, url: str, handler: str) -> None:
+        self.method: str = method.upper()
+        self.url: str = url[:MAX_TRACED_URL_LENGTH]
+        self.host: str = urlparse(url).hostname or ""
+        self.handler: str = handler
+        self.status: int = 0
+        self.new_connections: int = 0
+        self.dns_ms: float = 0.0
+        self.connect_ms: float = 0.0
+        self.tls_ms: float = 0.0
+        self.ttfb_ms: float = 0.0
+        self.total_ms: float = 0.0
+        self.response_bytes: int = 0
+        self.cache: str = ""
+        self.error: str = ""
+        self.started_at: float = time.time()
+        self._started: float = time.perf_counter()
+
+    def add_connection(self, dns_ms: float, connect_ms: float):
+        self.new_connections += 1
+        self.dns_ms += dns_ms
+        self.connect_ms += connect_ms
+
+    def add_tls(self, tls_ms: float):
+        self.tls_ms += tls_ms
+
+    def set_response(self, response: requests.Response):
+        self.status = response.status_code
+        self.ttfb_ms = response.elapsed.total_seconds() * 1000
+        if response.raw is None or getattr(response, "_content_consumed", False):
+            self.response_bytes = len(response.content or b"")
+        elif response.headers.get("Content-Length", "").isdigit():  # streamed response, do not read it
+            self.response_bytes = int(response.headers["Content-Length"])
+        if self.cache == "":
+            self.cache = _get_cache_outcome(response)
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "started_at": round(self.started_at, 3),
+            "host": self.host,
+            "handler": self.handler,
+            "method": self.method,
+            "url": self.url,
+            "status": self.status,
+            "error": self.error,
+            "new_connections": self.new_connections,
+            "dns_ms": round(self.dns_ms, 2),
+            "connect_ms": round(self.connect_ms, 2),
+            "tls_ms": round(self.tls_ms, 2),
+            "ttfb_ms": round(self.ttfb_ms, 2),
+            "total_ms": round(self.total_ms, 2),
+            "response_bytes": self.response_bytes,
+            "cache": self.cache
+        }
+
+
+def get_current_trace() -> Optional[UpstreamTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_upstream_call(method: str, url: str, slow_threshold_ms: float, max_slow_calls: int) -> Iterator[UpstreamTrace]:
+    """Trace the upstream call made inside the with block, then record it into the metrics.
+
+    Args:
+        method (str): HTTP method
+        url (str): requested url
+        slow_threshold_ms (float): calls longer than this are kept in the slow calls ring buffer
+        max_slow_calls (int): size of the slow calls ring buffer
+    """
+    trace = UpstreamTrace(method, url, get_handler_name())
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        record_trace(trace, slow_threshold_ms, max_slow_calls)
+
+
+def record_trace(trace: UpstreamTrace, slow_threshold_ms: float, max_slow_calls: int):
+    metrics = Metrics.instance()
+    outcome = str(trace.status) if trace.error == "" else trace.error
+    metrics.increment("upstream.requests", host=trace.host, handler=trace.handler, outcome=outcome)
+    metrics.observe("upstream.total_ms", trace.total_ms, host=trace.host)
+    if trace.error == "":
+        metrics.observe("upstream.ttfb_ms", trace.ttfb_ms, host=trace.host)
+        metrics.observe("upstream.response_bytes", trace.response_bytes,
+                        buckets=SIZE_BUCKETS_BYTES, host=trace.host)
+    if trace.new_connections > 0:
+        metrics.observe("upstream.dns_ms", trace.dns_ms, host=trace.host)
+        metrics.observe("upstream.connect_ms", trace.connect_ms, host=trace.host)
+        if trace.tls_ms > 0:
+            metrics.observe("upstream.tls_ms", trace.tls_ms, host=trace.host)
+    if trace.cache != "":
+        metrics.increment("upstream.cache", host=trace.host, outcome=trace.cache)
+    if trace.total_ms >= slow_threshold_ms:
+        metrics.record_event(SLOW_CALLS_EVENT, trace.to_dict(), max_events=max_slow_calls)
+
+
+def resolve(host: str, port: int) -> List[str]:
+    """Resolve the host into the list of its addresses, in the resolver order, through the DNS cache of the
+    worker (see utils.dns_cache)
+
+    Raises:
+        socket.gaierror: if the host can not be resolved
+    """
+    return DNSCache.instance().resolve(host, port)
+
+
+class TracedHTTPConnection(HTTPConnection):
+    """HTTP connection measuring name resolution and TCP connect durations for the current trace"""
+
+    def _new_conn(self) -> socket.socket:
+        dns_host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = resolve(dns_host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+
+        sock: Optional[socket.socket] = None
+        try:
+            for idx, address in enumerate(addresses):
+                # connect to the resolved address, TLS still uses the original host name (SNI, certificate checks)
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    if idx == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+
+        trace = get_current_trace()
+        if trace is not None:
+            trace.add_connection((resolved - started) * 1000,
+                                 (time.perf_counter() - resolved) * 1000)
+
+        return sock  # type: ignore
+
+
+class TracedHTTPSConnection(HTTPSConnection, TracedHTTPConnection):
+    """HTTPS connection also measuring the TLS handshake duration for the current trace"""
+
+    def connect(self) -> None:
+        trace = get_current_trace()
+        started = time.perf_counter()
+        before_ms = (trace.dns_ms + trace.connect_ms) if trace is not None else 0.0
+        super().connect()
+        if trace is not None:
+            tcp_ms = trace.dns_ms + trace.connect_ms - before_ms
+            trace.add_tls(max(0.0, (time.perf_counter() - started) * 1000 - tcp_ms))
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracingHTTPAdapter(HTTPAdapter):
+    """Transport adapter creating traced connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TracedHTTPConnectionPool,
+            "https": TracedHTTPSConnectionPool
+        }
+
+
+def _get_cache_outcome(response: requests.Response) -> str:
+    outcome: str = ""
+    for header in CACHE_STATUS_HEADERS:
+        value = response.headers.get(header, "").upper()
+        if "HIT" in value:
+            outcome = "HIT"
+            break
+        elif "MISS" in value or "EXPIRED" in value or "BYPASS" in value:
+            outcome = "MISS"
+            break
+
+    return outcome
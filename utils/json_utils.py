@@ -1,4 +1,12 @@
-from typing import List, Optional, Union
+import json as _json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+PATH_SEPARATOR = "."
+ANY_CHILD = "*"
+DESCENDANT = ".."
+
+_decoder = _json.JSONDecoder(strict=False)
 
 
 def get_nodes_by_name(json, node_name: str) -> List[dict]:
@@ -56,3 +64,126 @@ def get_node_value_if_exists(node, key) -> str:
         value = node[key]
 
     return value
+
+
+class JSONIndex:
+    """Index of a parsed JSON document, built in a single walk: the nodes of every key name, so that lookups by
+    name do not walk the whole document again. Lookups return the same nodes as get_nodes_by_name, in the same
+    order: nodes nested in a node of the same name are not returned."""
+
+    def __init__(self, json) -> None:
+        self.root = json
+        self._nodes_by_name: Dict[str, List[Any]] = {}
+        self._index(json, {})
+
+    def _index(self, node, ancestors: Dict[str, int]):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if ancestors.get(key, 0) == 0:
+                    self._nodes_by_name.setdefault(key, []).append(value)
+                if isinstance(value, (dict, list)):
+                    ancestors[key] = ancestors.get(key, 0) + 1
+                    self._index(value, ancestors)
+                    ancestors[key] -= 1
+        elif isinstance(node, list):
+            for child in node:
+                if isinstance(child, (dict, list)):
+                    self._index(child, ancestors)
+
+    def get_nodes_by_name(self, node_name: str) -> List[Any]:
+        return self._nodes_by_name.get(node_name, [])
+
+    def query(self, path: str) -> List[Any]:
+        """Nodes matching a compact path of keys and indexes separated by dots, * matching every child.
+        A path starting with .. looks its first key up in the index, at any depth.
+
+        eg: "3.children.3.state", "..articles.entityState.entities.*"
+        """
+        if not path.startswith(DESCENDANT):
+            return query_nodes(self.root, path)
+
+        segments = _split_path(path[len(DESCENDANT):])
+        return _follow_path(self.get_nodes_by_name(str(segments[0])), segments[1:])
+
+    def query_first(self, path: str):
+        """First node matching the path (see query), None if none"""
+        nodes = self.query(path)
+        return nodes[0] if len(nodes) > 0 else None
+
+
+def query_nodes(json, path: str) -> List[Any]:
+    """Nodes matching a compact path of keys and indexes separated by dots, * matching every child, without
+    any index (see JSONIndex.query for lookups at any depth)
+
+    eg: query_nodes(listing, "*.data.children.*")
+    """
+    return _follow_path([json], _split_path(path))
+
+
+def iter_nodes_by_name(text: str, node_name: str) -> Iterator[Any]:
+    """Streaming equivalent of get_nodes_by_name on a JSON text: only the values of the given key are parsed,
+    in document order, the document itself is never parsed. Stop iterating to stop the search.
+
+    Arguments:
+        text {str} -- JSON text
+        node_name {str} -- The node name to find
+    """
+    key_pattern = re.compile(r"%s\s*:\s*" % re.escape(_json.dumps(node_name)))
+    pos = 0
+    while True:
+        match = key_pattern.search(text, pos)
+        if match is None:
+            break
+        if _is_escaped(text, match.start()):  # inside a string value
+            pos = match.end()
+            continue
+        value, end = _decoder.raw_decode(text, match.end())
+        yield value
+        pos = end  # nodes nested in the value are not returned, like get_nodes_by_name
+
+
+def find_nodes_by_name(text: str, node_name: str, max_nodes: Optional[int] = None) -> List[Any]:
+    """The first max_nodes (all if None) values of the given key in the JSON text, see iter_nodes_by_name"""
+    nodes: List[Any] = []
+    for node in iter_nodes_by_name(text, node_name):
+        nodes.append(node)
+        if max_nodes is not None and len(nodes) >= max_nodes:
+            break
+
+    return nodes
+
+
+def _split_path(path: str) -> List[Union[str, int]]:
+    return [int(segment) if segment.isdigit() else segment for segment in path.split(PATH_SEPARATOR) if segment != ""]
+
+
+def _follow_path(nodes: List[Any], segments: List[Union[str, int]]) -> List[Any]:
+    for segment in segments:
+        nodes = [child for node in nodes for child in _get_children(node, segment)]
+
+    return nodes
+
+
+def _get_children(node, segment: Union[str, int]) -> List[Any]:
+    children: List[Any] = []
+    if segment == ANY_CHILD:
+        if isinstance(node, dict):
+            children = list(node.values())
+        elif isinstance(node, list):
+            children = list(node)
+    elif isinstance(node, dict):
+        if str(segment) in node:
+            children = [node[str(segment)]]
+    elif isinstance(node, list) and isinstance(segment, int) and segment < len(node):
+        children = [node[segment]]
+
+    return children
+
+
+def _is_escaped(text: str, quote_idx: int) -> bool:
+    """True if the quote at the given index is preceded by an odd number of backslashes"""
+    backslashes = 0
+    while quote_idx - backslashes - 1 >= 0 and text[quote_idx - backslashes - 1] == "\\":
+        backslashes += 1
+
+    return backslashes % 2 == 1
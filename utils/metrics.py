@@ -0,0 +1,155 @@
+"""In-process metrics registry: counters, gauges, histograms and recent events.
+
+Metrics are kept per process (every uWSGI worker has its own registry).
+"""
+
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from utils.singleton import Singleton
+
+# upper bounds (in milliseconds) of latency buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS: Sequence[float] = (
+    5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# upper bounds (in bytes) of size buckets, the last bucket is unbounded
+SIZE_BUCKETS_BYTES: Sequence[float] = (
+    1024, 10 * 1024, 50 * 1024, 100 * 1024, 250 * 1024, 500 * 1024, 1024 * 1024, 5 * 1024 * 1024)
+
+DEFAULT_MAX_EVENTS = 100
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed buckets histogram"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets: Sequence[float] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> float:
+        """Returns an estimation of the given percentile: the upper bound of the bucket containing it.
+
+        Args:
+            percent (float): percentile to estimate, between 0 and 100
+
+        Returns:
+            float: upper bound of the bucket, or the max observed value for the unbounded bucket
+        """
+        value: float = 0.0
+        if self.count > 0:
+            rank = self.count * percent / 100
+            cumulated = 0
+            for idx, count in enumerate(self.counts):
+                cumulated += count
+                if cumulated >= rank and count > 0:
+                    value = self.buckets[idx] if idx < len(self.buckets) else self.max
+                    break
+
+        return min(value, self.max)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 2) if self.count > 0 else 0,
+            "max": round(self.max, 2),
+            "p50": round(self.percentile(50), 2),
+            "p95": round(self.percentile(95), 2),
+            "p99": round(self.percentile(99), 2),
+            "buckets": {("+Inf" if idx == len(self.buckets) else str(self.buckets[idx])): count
+                        for idx, count in enumerate(self.counts)}
+        }
+
+
+@Singleton
+class Metrics:
+    """Singleton registry of every metric of the process"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._events: Dict[str, Deque[dict]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = _labels_key(labels)
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS_MS, **labels: str):
+        key = _labels_key(labels)
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = Histogram(buckets)
+            histograms[key].observe(value)
+
+    def record_event(self, name: str, event: dict, max_events: int = DEFAULT_MAX_EVENTS):
+        """Keep the event in a ring buffer of the last max_events events of the given name"""
+        with self._lock:
+            events = self._events.get(name)
+            if events is None or events.maxlen != max_events:
+                events = deque(events or [], maxlen=max_events)
+                self._events[name] = events
+            events.append(event)
+
+    def get_counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels_key(labels), 0)
+
+    def get_histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_labels_key(labels))
+
+    def get_events(self, name: str) -> List[dict]:
+        with self._lock:
+            return list(self._events.get(name, []))
+
+    def snapshot(self, prefix: str = "") -> dict:
+        """Returns a json serializable view of the metrics having a name starting with prefix"""
+        with self._lock:
+            return {
+                "counters": _snapshot_values(self._counters, prefix, lambda v: v),
+                "gauges": _snapshot_values(self._gauges, prefix, lambda v: v),
+                "histograms": _snapshot_values(self._histograms, prefix, lambda h: h.to_dict()),
+                "events": {name: list(events) for name, events in self._events.items() if name.startswith(prefix)}
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._events.clear()
+
+
+def _labels_key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _snapshot_values(values: dict, prefix: str, to_value) -> Dict[str, List[dict]]:
+    snapshot: Dict[str, List[dict]] = {}
+    for name, by_labels in values.items():
+        if name.startswith(prefix):
+            snapshot[name] = [{"labels": dict(labels), "value": to_value(value)}
+                              for labels, value in by_labels.items()]
+
+    return snapshot
@@ -0,0 +1,178 @@
+"""Profiling of handler requests.
+
+A request is profiled either because it was sampled (1 request out of N per handler) or because it was
+explicitly requested with a crypted profile=true parameter.
+Each profile provides:
+ - pstats output (cProfile statistics, readable with pstats or snakeviz)
+ - folded stacks sampled every few milliseconds (flamegraph.pl / speedscope compatible)
+The last profiles are kept in memory and can optionally be written into a directory.
+"""
+
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, TypeVar
+
+from config.config import (PROFILING_INTERVAL_KEY, PROFILING_MAX_PROFILES_KEY, PROFILING_OUTPUT_DIR_KEY,
+                           PROFILING_SAMPLE_RATE_KEY, Config)
+from utils.singleton import Singleton
+
+DEFAULT_MAX_PROFILES = 20
+DEFAULT_INTERVAL_MS = 5
+
+T = TypeVar("T")
+
+
+class Profile:
+    """Result of one profiled request"""
+
+    def __init__(self, profile_id: str, handler: str, url: str, reason: str) -> None:
+        self.profile_id: str = profile_id
+        self.handler: str = handler
+        self.url: str = url
+        self.reason: str = reason
+        self.started_at: float = time.time()
+        self.duration_ms: float = 0.0
+        self.pstats: bytes = b""
+        self.folded: str = ""
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.profile_id,
+            "handler": self.handler,
+            "url": self.url,
+            "reason": self.reason,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(self.duration_ms, 2),
+            "pstats_size": len(self.pstats),
+            "samples": self.folded.count("\n")
+        }
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of a thread at regular interval and aggregates them as folded stacks"""
+
+    def __init__(self, thread_id: int, interval_s: float) -> None:
+        super().__init__(name="pyrssw-stack-sampler", daemon=True)
+        self.thread_id: int = thread_id
+        self.interval_s: float = interval_s
+        self.stacks: Dict[str, int] = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                frames: List[str] = []
+                while frame is not None:
+                    frames.append("%s (%s:%d)" % (frame.f_code.co_name,
+                                                  os.path.basename(frame.f_code.co_filename),
+                                                  frame.f_code.co_firstlineno))
+                    frame = frame.f_back
+                stack = ";".join(reversed(frames))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self) -> str:
+        """Stop sampling and return folded stacks (one "frame1;frame2;... count" line per stack)"""
+        self._stopped.set()
+        self.join()
+        return "".join("%s %d\n" % (stack, count) for stack, count in self.stacks.items())
+
+
+@Singleton
+class Profiler:
+    """Keep track of sampling counters and of the last profiles"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._requests_count: Dict[str, int] = {}
+        self._profiles: Deque[Profile] = deque(
+            maxlen=Config.instance().get_int_property(PROFILING_MAX_PROFILES_KEY, DEFAULT_MAX_PROFILES))
+        self._next_id: int = 0
+
+    def is_sampled(self, handler: str) -> bool:
+        """Returns True if this request of the given handler must be profiled (1 out of N requests)
+
+        The sampling rate is read from profiling.sample_rate.<handler> or profiling.sample_rate, 0 disables sampling.
+        """
+        sample_rate = Config.instance().get_int_property(
+            "%s.%s" % (PROFILING_SAMPLE_RATE_KEY, handler),
+            Config.instance().get_int_property(PROFILING_SAMPLE_RATE_KEY, 0))
+        sampled: bool = False
+        if sample_rate > 0:
+            with self._lock:
+                count = self._requests_count.get(handler, 0) + 1
+                self._requests_count[handler] = count
+            sampled = count % sample_rate == 0
+
+        return sampled
+
+    def profile(self, handler: str, url: str, reason: str, func: Callable[[], T]) -> T:
+        """Run func and profile it.
+
+        Args:
+            handler (str): handler name
+            url (str): requested url
+            reason (str): why the request is profiled (sampled, requested)
+            func (Callable[[], T]): function to profile
+
+        Returns:
+            T: what func returns
+        """
+        with self._lock:
+            self._next_id += 1
+            profile = Profile("%d-%d" % (os.getpid(), self._next_id), handler, url, reason)
+
+        profiler: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            profiler.enable()  # type: ignore
+        except ValueError:  # another profiler is already running (python >= 3.12)
+            profiler = None
+        sampler = StackSampler(threading.get_ident(),
+                               Config.instance().get_int_property(PROFILING_INTERVAL_KEY, DEFAULT_INTERVAL_MS) / 1000)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+            profile.folded = sampler.stop()
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+                profile.pstats = marshal.dumps(profiler.stats)  # same format as pstats dump_stats
+            self._store(profile)
+
+    def get_profiles(self) -> List[Profile]:
+        with self._lock:
+            return list(self._profiles)
+
+    def get_profile(self, profile_id: str) -> Optional[Profile]:
+        found: Optional[Profile] = None
+        for profile in self.get_profiles():
+            if profile.profile_id == profile_id:
+                found = profile
+                break
+
+        return found
+
+    def _store(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+        output_dir = Config.instance().get_property(PROFILING_OUTPUT_DIR_KEY, "")
+        if output_dir != "":
+            try:
+                os.makedirs(output_dir, exist_ok=True)
+                prefix = os.path.join(output_dir, "%s-%s" % (profile.handler, profile.profile_id))
+                with open(prefix + ".pstats", "wb") as f:
+                    f.write(profile.pstats)
+                with open(prefix + ".folded", "w") as f:
+                    f.write(profile.folded)
+            except OSError as e:
+                logging.getLogger().error("Unable to write profile in '%s': %s", output_dir, str(e))
@@ -0,0 +1,162 @@
+"""Per client rate limiting, so that a single reader polling too often can not monopolize the workers.
+
+Clients are identified by their address (ratelimit.client=ip, the default) or by their session cookie when they
+send one (ratelimit.client=session, ie: readers behind the same proxy). Each client has a token bucket per route
+(rss, content, or other for the built-in pages): ratelimit.rate_per_min requests per minute and at most
+ratelimit.burst requests at once, both can be overridden per route, per handler and per handler and route like
+request.deadline_s (rate 0: unlimited, the default). Requests over the limit are answered without invoking the
+handlers (see WSGILauncherHandler).
+Session cookies are chosen by the clients, which can send a new one with each request: in session mode, the
+address of the client is limited too, with quotas multiplied by ratelimit.session_ip_factor (shared by the readers
+behind a proxy).
+Buckets are kept in memory by each worker (MAX_CLIENTS most recent ones), or in ratelimit.shared_dir to share the
+quotas between the workers (one file per bucket, locked while it is updated).
+
+Decisions are reported by the ratelimit.requests counter (per route, outcome: allowed or limited).
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config.config import (RATELIMIT_BURST_KEY, RATELIMIT_CLIENT_KEY, RATELIMIT_RATE_KEY,
+                           RATELIMIT_SESSION_IP_FACTOR_KEY, RATELIMIT_SHARED_DIR_KEY, Config)
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+try:
+    import fcntl
+except ImportError:  # not available on windows: buckets are kept in memory
+    fcntl = None  # type: ignore
+
+MAX_CLIENTS = 10000
+SHARED_BUCKET_MAX_AGE_S = 3600  # bucket files not updated since are removed
+CLEANUP_INTERVAL_S = 300
+DEFAULT_SESSION_IP_FACTOR = 10
+_BUCKET_FORMAT = "dd"  # tokens, update time
+IP_PREFIX = "ip:"
+SESSION_PREFIX = "session:"
+
+
+def get_client_key(source_ip: Optional[str], session_id: Optional[str]) -> str:
+    """Key identifying the client of a request, session_id is the one of the cookie sent by the client (if any).
+    The session id is not trusted: it only splits the requests of an address (see RateLimiter.allow)."""
+    if session_id and Config.instance().get_property(RATELIMIT_CLIENT_KEY, "ip") == "session":
+        return SESSION_PREFIX + session_id
+
+    return IP_PREFIX + (source_ip or "")
+
+
+def _take_token(tokens: float, updated_at: float, now: float, rate: float, burst: float,
+                count: int = 1) -> Tuple[bool, float, float]:
+    """Refill the bucket and take count tokens from it (a negative count gives tokens back), returns (allowed,
+    remaining tokens, seconds before next token)"""
+    tokens = min(burst, tokens + max(now - updated_at, 0) * rate / 60)
+    if tokens >= count:
+        return True, min(burst, tokens - count), 0
+
+    return False, tokens, (count - tokens) * 60 / rate
+
+
+@Singleton
+class RateLimiter:
+    """Token buckets of the clients"""
+
+    def __init__(self) -> None:
+        self.shared_dir: str = Config.instance().get_property(RATELIMIT_SHARED_DIR_KEY, "")
+        self.session_ip_factor: float = Config.instance().get_float_property(
+            RATELIMIT_SESSION_IP_FACTOR_KEY, DEFAULT_SESSION_IP_FACTOR)
+        if self.shared_dir != "" and fcntl is not None:
+            os.makedirs(self.shared_dir, exist_ok=True)
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        self._quotas: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._cleaned_at: float = time.time()
+
+    def get_quota(self, handler: str, route: str) -> Tuple[float, float]:
+        """Returns the requests per minute and the burst of the handler route"""
+        quota = self._quotas.get((handler, route))
+        if quota is None:
+            config = Config.instance()
+            rate = config.get_float_property(RATELIMIT_RATE_KEY, 0)
+            burst = config.get_float_property(RATELIMIT_BURST_KEY, 0)
+            for suffix in [route, handler, "%s.%s" % (handler, route)]:
+                rate = config.get_float_property("%s.%s" % (RATELIMIT_RATE_KEY, suffix), rate)
+                burst = config.get_float_property("%s.%s" % (RATELIMIT_BURST_KEY, suffix), burst)
+            quota = (rate, burst if burst >= 1 else max(rate, 1))
+            self._quotas[(handler, route)] = quota
+
+        return quota
+
+    def allow(self, client: str, handler: str, route: str, source_ip: Optional[str] = None) -> Tuple[bool, float]:
+        """Takes a token from the bucket of the client for the handler route, returns (allowed, seconds before the
+        next token). When the client is identified by its session, a token is also taken from the bucket of its
+        address (source_ip), whose quota is multiplied by session_ip_factor: the token of the session is given back
+        when the address is limited."""
+        rate, burst = self.get_quota(handler, route)
+        if rate <= 0:
+            return True, 0
+
+        key = "%s %s %s" % (client, handler, route)
+        allowed, retry_after = self._take(key, rate, burst)
+        if allowed and client.startswith(SESSION_PREFIX) and source_ip is not None:
+            allowed, retry_after = self._take("%s%s %s %s" % (IP_PREFIX, source_ip, handler, route),
+                                              rate * self.session_ip_factor, burst * self.session_ip_factor)
+            if not allowed:
+                self._take(key, rate, burst, count=-1)
+        Metrics.instance().increment("ratelimit.requests", route=route, outcome="allowed" if allowed else "limited")
+
+        return allowed, retry_after
+
+    def _take(self, key: str, rate: float, burst: float, count: int = 1) -> Tuple[bool, float]:
+        if self.shared_dir != "" and fcntl is not None:
+            return self._allow_shared(key, rate, burst, count)
+
+        return self._allow_local(key, rate, burst, count)
+
+    def _allow_local(self, key: str, rate: float, burst: float, count: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            allowed, tokens, retry_after = _take_token(tokens, updated_at, now, rate, burst, count)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+    def _allow_shared(self, key: str, rate: float, burst: float, count: int) -> Tuple[bool, float]:
+        path = os.path.join(self.shared_dir, "ratelimit-%s" % hashlib.sha1(key.encode("utf-8")).hexdigest())
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            data = os.read(fd, struct.calcsize(_BUCKET_FORMAT))
+            tokens, updated_at = struct.unpack(_BUCKET_FORMAT, data) if len(data) == struct.calcsize(
+                _BUCKET_FORMAT) else (burst, now)
+            allowed, tokens, retry_after = _take_token(tokens, updated_at, now, rate, burst, count)
+            os.pwrite(fd, struct.pack(_BUCKET_FORMAT, tokens, now), 0)
+        finally:
+            os.close(fd)  # releases the lock
+        self._clean_shared_dir()
+
+        return allowed, retry_after
+
+    def _clean_shared_dir(self):
+        """Remove the buckets of the clients gone for a while (full again by now)"""
+        now = time.time()
+        with self._lock:
+            if now - self._cleaned_at < CLEANUP_INTERVAL_S:
+                return
+            self._cleaned_at = now
+        with os.scandir(self.shared_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.startswith("ratelimit-") and now - entry.stat().st_mtime > SHARED_BUCKET_MAX_AGE_S:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
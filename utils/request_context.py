@@ -0,0 +1,89 @@
+"""Values scoped to the request being processed, shared between the launcher, handlers and the HTTP client.
+
+Context variables are used so that values stay isolated between server threads.
+"""
+
+import time
+from contextvars import ContextVar, Token
+from typing import Optional
+
+_handler_name: ContextVar[str] = ContextVar("handler_name", default="")
+
+
+def set_handler_name(handler_name: str) -> Token:
+    """Set the name of the handler processing the current request
+
+    Args:
+        handler_name (str): handler name as used in urls (eg: lequipe)
+
+    Returns:
+        Token: token to give to reset_handler_name at the end of the request
+    """
+    return _handler_name.set(handler_name)
+
+
+def reset_handler_name(token: Token):
+    _handler_name.reset(token)
+
+
+def get_handler_name() -> str:
+    return _handler_name.get()
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(duration_s: float) -> Token:
+    """Set the time budget of the current request: HTTPSession shortens the timeout of every call to fit in it
+    and handlers can skip optional work when there is not enough time left (see has_time_left)
+
+    Args:
+        duration_s (float): duration in seconds from now
+
+    Returns:
+        Token: token to give to reset_deadline at the end of the request
+    """
+    return _deadline.set(time.monotonic() + duration_s)
+
+
+def reset_deadline(token: Token):
+    _deadline.reset(token)
+
+
+def get_remaining_time() -> Optional[float]:
+    """Returns the remaining time of the current request in seconds (negative when exceeded), None without deadline"""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def has_time_left(duration_s: float) -> bool:
+    """Returns True if the current request has no deadline or if it will not be reached within duration_s,
+    handlers use it before optional work (additional pages, enrichment...)"""
+    remaining = get_remaining_time()
+    return remaining is None or remaining >= duration_s
+
+
+def is_deadline_exceeded() -> bool:
+    remaining = get_remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+_client: ContextVar[str] = ContextVar("client", default="")
+
+
+def set_client(client: str) -> Token:
+    """Set the key identifying the client of the current request (see utils.rate_limiter.get_client_key), used to
+    share the worker fairly between clients
+
+    Returns:
+        Token: token to give to reset_client at the end of the request
+    """
+    return _client.set(client)
+
+
+def reset_client(token: Token):
+    _client.reset(token)
+
+
+def get_client() -> str:
+    return _client.get()
@@ -0,0 +1,239 @@
+"""Priority scheduling of the requests of a worker, so that readers opening articles do not wait behind feed polls.
+
+Requests are classified by route and client, by decreasing priority:
+ - interactive: content pages
+ - feed: feeds (/rss)
+ - bulk: feeds requested by the clients listed by scheduling.bulk_clients (ie: aggregator services)
+At most scheduling.slots requests of the worker are processed at the same time (0: no limit, the default). A request
+of a class only gets a slot when more slots are free than the ones reserved for the higher classes
+(scheduling.reserved.<class>, lowered at startup when they would leave no slot to the lowest class), otherwise it
+waits in the bounded queue of its class (scheduling.queue.<class> requests, at most scheduling.max_wait_s.<class>
+seconds and the deadline of the request). Freed slots are given to the highest waiting class first. Within a class, the waiting clients (see utils.rate_limiter.get_client_key) are
+served in turn, each of them in arrival order, and a client can not have more than scheduling.queue_per_client
+waiting requests: a client sending many requests at once does not delay the other ones. Requests which can not wait
+are rejected with an OverloadedError.
+
+Queue times are reported by the scheduler.queue_ms histogram and outcomes by the scheduler.requests counter (per
+class, outcome: admitted, stale, queue_full or timeout).
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Union
+
+from config.config import (SCHEDULING_BULK_CLIENTS_KEY, SCHEDULING_MAX_WAIT_KEY, SCHEDULING_QUEUE_KEY,
+                           SCHEDULING_QUEUE_PER_CLIENT_KEY, SCHEDULING_RESERVED_KEY, SCHEDULING_SLOTS_KEY, Config)
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+INTERACTIVE = "interactive"
+FEED = "feed"
+BULK = "bulk"
+PRIORITY_CLASSES = [INTERACTIVE, FEED, BULK]  # highest priority first
+
+DEFAULT_RESERVED = {INTERACTIVE: 2, FEED: 0, BULK: 0}
+DEFAULT_QUEUE = {INTERACTIVE: 50, FEED: 20, BULK: 5}
+DEFAULT_MAX_WAIT_S = {INTERACTIVE: 30.0, FEED: 10.0, BULK: 2.0}
+DEFAULT_QUEUE_PER_CLIENT = 5
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class OverloadedError(Exception):
+    """No slot could be given to the request"""
+
+
+class _Waiter:
+    def __init__(self, client: str) -> None:
+        self.client: str = client
+        self.event = threading.Event()
+        self.granted: bool = False
+
+
+class _FairQueue:
+    """Waiting requests of a class, the clients are served in turn (round robin)"""
+
+    def __init__(self) -> None:
+        self._clients: OrderedDict[str, Deque[_Waiter]] = OrderedDict()
+        self._size: int = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def count(self, client: str) -> int:
+        return len(self._clients.get(client, ()))
+
+    def append(self, waiter: _Waiter):
+        self._clients.setdefault(waiter.client, deque()).append(waiter)
+        self._size += 1
+
+    def popleft(self) -> _Waiter:
+        """Oldest request of the next client, who then waits for the turn of the other clients"""
+        client, waiters = self._clients.popitem(last=False)
+        waiter = waiters.popleft()
+        if len(waiters) > 0:
+            self._clients[client] = waiters
+        self._size -= 1
+        return waiter
+
+    def remove(self, waiter: _Waiter):
+        waiters = self._clients[waiter.client]
+        waiters.remove(waiter)
+        if len(waiters) == 0:
+            del self._clients[waiter.client]
+        self._size -= 1
+
+
+def parse_clients(value: str) -> List[Network]:
+    """Parse comma separated addresses and networks (ie: 10.0.0.0/8,192.168.1.12), invalid ones are ignored"""
+    networks: List[Network] = []
+    for client in value.split(","):
+        try:
+            networks.append(ipaddress.ip_network(client.strip(), strict=False))
+        except ValueError:
+            pass
+
+    return networks
+
+
+@Singleton
+class PriorityScheduler:
+    """Slots and queues of the worker"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self.slots: int = config.get_int_property(SCHEDULING_SLOTS_KEY, 0)
+        self.bulk_clients: List[Network] = parse_clients(config.get_property(SCHEDULING_BULK_CLIENTS_KEY, ""))
+        self.reserved: Dict[str, int] = {}
+        self.queue_sizes: Dict[str, int] = {}
+        self.max_waits: Dict[str, float] = {}
+        for priority_class in PRIORITY_CLASSES:
+            self.reserved[priority_class] = config.get_int_property(
+                "%s.%s" % (SCHEDULING_RESERVED_KEY, priority_class), DEFAULT_RESERVED[priority_class])
+            self.queue_sizes[priority_class] = config.get_int_property(
+                "%s.%s" % (SCHEDULING_QUEUE_KEY, priority_class), DEFAULT_QUEUE[priority_class])
+            self.max_waits[priority_class] = config.get_float_property(
+                "%s.%s" % (SCHEDULING_MAX_WAIT_KEY, priority_class), DEFAULT_MAX_WAIT_S[priority_class])
+        self.queue_per_client: int = config.get_int_property(SCHEDULING_QUEUE_PER_CLIENT_KEY, DEFAULT_QUEUE_PER_CLIENT)
+        self._clamp_reserved()
+        self.active: int = 0
+        self._queues: Dict[str, _FairQueue] = {priority_class: _FairQueue() for priority_class in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.slots > 0
+
+    def classify(self, is_rss: bool, source_ip: Optional[str]) -> str:
+        """Priority class of a request"""
+        if not is_rss:
+            return INTERACTIVE
+        if source_ip is not None and len(self.bulk_clients) > 0:
+            try:
+                address = ipaddress.ip_address(source_ip)
+                if any(address in network for network in self.bulk_clients):
+                    return BULK
+            except ValueError:
+                pass
+
+        return FEED
+
+    def try_acquire(self, priority_class: str) -> bool:
+        """Take a slot if one is available right now"""
+        if not self.is_enabled():
+            return True
+        with self._lock:
+            if not self._can_start(priority_class):
+                return False
+            self.active += 1
+            self._update_gauges()
+        Metrics.instance().observe("scheduler.queue_ms", 0, priority=priority_class)
+        Metrics.instance().increment("scheduler.requests", priority=priority_class, outcome="admitted")
+        return True
+
+    def acquire(self, priority_class: str, remaining_time: Optional[float] = None, client: str = ""):
+        """Take a slot, waiting for it in the queue of the class at most scheduling.max_wait_s.<class> seconds (and
+        the remaining time of the request). Raises an OverloadedError when the queue is full or the wait too long."""
+        if self.try_acquire(priority_class):
+            return
+
+        started = time.monotonic()
+        waiter = _Waiter(client)
+        with self._lock:
+            queue = self._queues[priority_class]
+            if len(queue) >= self.queue_sizes[priority_class] or queue.count(client) >= self.queue_per_client:
+                Metrics.instance().increment("scheduler.requests", priority=priority_class, outcome="queue_full")
+                raise OverloadedError("%s queue is full (%d requests, %d of the client)" % (
+                    priority_class, len(queue), queue.count(client)))
+            queue.append(waiter)
+            self._update_gauges()
+
+        timeout = self.max_waits[priority_class]
+        if remaining_time is not None:
+            timeout = max(min(timeout, remaining_time), 0)
+        waiter.event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                self._queues[priority_class].remove(waiter)
+                self._update_gauges()
+        waited_ms = (time.monotonic() - started) * 1000
+        Metrics.instance().observe("scheduler.queue_ms", waited_ms, priority=priority_class)
+        if not waiter.granted:
+            Metrics.instance().increment("scheduler.requests", priority=priority_class, outcome="timeout")
+            raise OverloadedError("no %s slot after %d ms" % (priority_class, waited_ms))
+        Metrics.instance().increment("scheduler.requests", priority=priority_class, outcome="admitted")
+
+    def release(self):
+        """Give back the slot of a finished request, to the highest waiting class"""
+        if not self.is_enabled():
+            return
+        with self._lock:
+            self.active -= 1
+            for priority_class in PRIORITY_CLASSES:
+                queue = self._queues[priority_class]
+                while len(queue) > 0 and self._has_free_slot(priority_class):
+                    waiter = queue.popleft()
+                    waiter.granted = True
+                    self.active += 1
+                    waiter.event.set()
+                if len(queue) > 0:
+                    break  # lower classes need even more free slots
+            self._update_gauges()
+
+    def record_stale(self, priority_class: str):
+        """A request of the class was served a previous rendering instead of waiting for a slot"""
+        Metrics.instance().increment("scheduler.requests", priority=priority_class, outcome="stale")
+
+    def _clamp_reserved(self):
+        """Lower the slots reserved for the higher classes, which would otherwise leave no slot to the lower ones
+        (ie: scheduling.slots=2 with scheduling.reserved.interactive=2: feeds would never start)"""
+        if not self.is_enabled():
+            return
+        available = self.slots - 1  # at least one slot for the lowest class
+        for priority_class in PRIORITY_CLASSES[:-1]:
+            reserved = min(max(self.reserved[priority_class], 0), available)
+            if reserved != self.reserved[priority_class]:
+                logging.getLogger().error("%s.%s=%d leaves no slot to the lower classes (%s=%d), %d is used instead",
+                                          SCHEDULING_RESERVED_KEY, priority_class, self.reserved[priority_class],
+                                          SCHEDULING_SLOTS_KEY, self.slots, reserved)
+                self.reserved[priority_class] = reserved
+            available -= reserved
+
+    def _can_start(self, priority_class: str) -> bool:
+        """The request does not overtake a waiting request of the same or a higher class"""
+        index = PRIORITY_CLASSES.index(priority_class)
+        return all(len(self._queues[higher]) == 0 for higher in PRIORITY_CLASSES[:index + 1]) \
+            and self._has_free_slot(priority_class)
+
+    def _has_free_slot(self, priority_class: str) -> bool:
+        index = PRIORITY_CLASSES.index(priority_class)
+        reserved = sum(self.reserved[higher] for higher in PRIORITY_CLASSES[:index])
+        return self.slots - self.active > reserved
+
+    def _update_gauges(self):
+        metrics = Metrics.instance()
+        metrics.set_gauge("scheduler.active", self.active)
+        for priority_class in PRIORITY_CLASSES:
+            metrics.set_gauge("scheduler.queued", len(self._queues[priority_class]), priority=priority_class)
@@ -0,0 +1,247 @@
+"""Pool of long lived scraper sessions (cloudscraper), keyed by host.
+
+Solving an anti-bot challenge is slow (cloudscraper waits several seconds before submitting the answer): a
+session which has cleared the challenge of a host is kept and reused, instead of creating a new scraper for
+every page. When scraper.cookies_dir is set, the clearance cookies and the user agent they are bound to are
+persisted as JSON in this directory shared by the workers, so that new sessions (other workers, restarts) reuse
+them until they expire. The directory is created private (0700), files owned by another user are ignored.
+Challenges are counted and timed in the metrics (scraper.challenges counter, scraper.challenge_ms histogram).
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import Cookie
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import cloudscraper
+import requests
+from requests.adapters import BaseAdapter
+from cloudscraper.cloudflare import Cloudflare
+
+from config.config import (DEFAULT_HTTP_CONNECT_TIMEOUT, DEFAULT_HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT_KEY,
+                           HTTP_REPLAY_LATENCY_KEY, HTTP_TIMEOUT_KEY, HTTP_TRANSPORT_ARCHIVE_KEY,
+                           HTTP_TRANSPORT_MODE_KEY, SCRAPER_COOKIES_DIR_KEY, SCRAPER_POOL_SIZE_KEY, Config)
+from utils.http_client import fit_timeout_in_deadline, send_within_deadline
+from utils.http_replay import TRANSPORT_LIVE, create_transport_adapter
+from utils.metrics import Metrics
+from utils.singleton import Singleton
+
+DEFAULT_POOL_SIZE = 4
+# options of the scrapers when the handler does not give any
+DEFAULT_SCRAPER_OPTIONS = {"browser": {"browser": "firefox", "platform": "windows", "mobile": False}}
+
+
+class ScraperSession(cloudscraper.CloudScraper):
+    """Scraper of one host, with the default timeouts and the transport (live, record, replay) of HTTPSession"""
+
+    def __init__(self, host: str, transport_adapter: Optional[BaseAdapter] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.host: str = host
+        self._depth: int = 0
+        self._challenge_started: Optional[float] = None
+
+        config = Config.instance()
+        self.timeout = (config.get_float_property(HTTP_CONNECT_TIMEOUT_KEY, DEFAULT_HTTP_CONNECT_TIMEOUT),
+                        config.get_float_property(HTTP_TIMEOUT_KEY, DEFAULT_HTTP_TIMEOUT))
+        # in live mode the cipher suite adapter of cloudscraper is kept: it is part of the browser fingerprint
+        if transport_adapter is None:
+            transport_adapter = create_transport_adapter(
+                config.get_property(HTTP_TRANSPORT_MODE_KEY, TRANSPORT_LIVE),
+                config.get_property(HTTP_TRANSPORT_ARCHIVE_KEY, ""),
+                config.get_property(HTTP_REPLAY_LATENCY_KEY, ""))
+        if transport_adapter is not None:
+            self.mount("https://", transport_adapter)
+            self.mount("http://", transport_adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        """Challenges are solved by nested requests: the challenge duration is recorded by the outer one"""
+        if "timeout" not in kwargs:
+            kwargs["timeout"] = self.timeout
+        self._depth += 1
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            self._depth -= 1
+            if self._depth == 0 and self._challenge_started is not None:
+                duration_ms = (time.perf_counter() - self._challenge_started) * 1000
+                Metrics.instance().observe("scraper.challenge_ms", duration_ms, host=self.host)
+                Metrics.instance().increment("scraper.challenges", host=self.host)
+                self._challenge_started = None
+
+    def perform_request(self, method, url, *args, **kwargs):
+        response = super().perform_request(method, url, *args, **kwargs)
+        if self._challenge_started is None and Cloudflare(self).is_Challenge_Request(response):
+            self._challenge_started = time.perf_counter()
+
+        return response
+
+    def send(self, request, **kwargs):
+        """The timeout is shortened to fit in the deadline of the current request, if any"""
+        kwargs["timeout"], shortened = fit_timeout_in_deadline(request, kwargs.get("timeout"))
+        return send_within_deadline(lambda: super(ScraperSession, self).send(request, **kwargs), shortened)
+
+
+class _HostState:
+    """Clearance of a host: user agent and cookies, shared by its sessions"""
+
+    def __init__(self, user_agent: str = "", cookies: Optional[List[Cookie]] = None) -> None:
+        self.user_agent: str = user_agent
+        self.cookies: List[Cookie] = cookies or []
+
+    def get_valid_cookies(self) -> List[Cookie]:
+        return [cookie for cookie in self.cookies if not cookie.is_expired()]
+
+
+@Singleton
+class ScraperSessions:
+    """Idle scraper sessions of every host (at most scraper.pool_size per host), and their clearance"""
+
+    def __init__(self) -> None:
+        config = Config.instance()
+        self.pool_size: int = config.get_int_property(SCRAPER_POOL_SIZE_KEY, DEFAULT_POOL_SIZE)
+        self.cookies_dir: str = config.get_property(SCRAPER_COOKIES_DIR_KEY, "")  # not persisted when empty
+        self._idle: Dict[str, List[ScraperSession]] = {}
+        self._states: Dict[str, _HostState] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._transport_adapter: Optional[BaseAdapter] = None
+        self._lock = threading.Lock()
+
+    def set_transport_adapter(self, transport_adapter: Optional[BaseAdapter]):
+        """Transport adapter of the sessions created from now on, instead of the configured transport
+        (used by the benchmarks), idle sessions are discarded"""
+        with self._lock:
+            self._transport_adapter = transport_adapter
+            for sessions in self._idle.values():
+                for session in sessions:
+                    session.close()
+            self._idle.clear()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET the url with a scraper session of its host"""
+        with self.session(url) as session:
+            return session.get(url, **kwargs)
+
+    @contextmanager
+    def session(self, url: str, **scraper_options) -> Iterator[ScraperSession]:
+        """Borrow a scraper session for the host of the url, created with the given options (see
+        cloudscraper.create_scraper) when no idle session is available. It is given back to the pool at the end
+        of the with block, and its cookies are shared with the other sessions of the host."""
+        host = urlparse(url).hostname or ""
+        session = self._acquire(host, scraper_options or DEFAULT_SCRAPER_OPTIONS)
+        try:
+            yield session
+        finally:
+            self._release(session)
+
+    def _acquire(self, host: str, scraper_options: dict) -> ScraperSession:
+        with self._lock:
+            idle = self._idle.get(host, [])
+            session = idle.pop() if len(idle) > 0 else None
+            state = self._get_state(host)
+        Metrics.instance().increment("scraper.sessions", host=host, outcome="created" if session is None else "reused")
+        if session is None:
+            session = ScraperSession(host, self._transport_adapter, **scraper_options)
+            if state.user_agent != "":
+                session.headers["User-Agent"] = state.user_agent  # clearance cookies are bound to the user agent
+        for cookie in state.get_valid_cookies():
+            session.cookies.set_cookie(cookie)
+
+        return session
+
+    def _release(self, session: ScraperSession):
+        with self._lock:
+            previous = self._get_state(session.host)
+            # cookies set meanwhile by the other sessions of the host are kept
+            cookies: Dict[str, Cookie] = {_get_key(cookie): cookie for cookie in previous.get_valid_cookies()}
+            cookies.update({_get_key(cookie): cookie for cookie in session.cookies if not cookie.is_expired()})
+            state = _HostState(str(session.headers.get("User-Agent", "")), list(cookies.values()))
+            changed = previous.user_agent != state.user_agent or _get_values(previous.cookies) != _get_values(
+                state.cookies)
+            self._states[session.host] = state
+            idle = self._idle.setdefault(session.host, [])
+            if len(idle) < self.pool_size:
+                idle.append(session)
+            else:
+                session.close()
+        if changed:
+            self._save_state(session.host, state)
+
+    def _get_state(self, host: str) -> _HostState:
+        """Clearance of the host, loaded again from the cookies directory when another process has changed it"""
+        mtime = _get_mtime(self._get_state_path(host)) if self.cookies_dir != "" else 0
+        if host not in self._states or mtime > self._mtimes.get(host, 0):
+            loaded = self._load_state(host)
+            self._mtimes[host] = mtime
+            if host not in self._states or len(loaded.get_valid_cookies()) > 0:
+                self._states[host] = loaded
+
+        return self._states[host]
+
+    def _get_state_path(self, host: str) -> str:
+        return os.path.join(self.cookies_dir, "%s.json" % host)
+
+    def _load_state(self, host: str) -> _HostState:
+        state = _HostState()
+        if self.cookies_dir == "":
+            return state
+        try:
+            with open(self._get_state_path(host), "r", encoding="utf-8") as f:
+                if hasattr(os, "getuid") and os.fstat(f.fileno()).st_uid != os.getuid():
+                    raise ValueError("the file is not owned by the user of the server")
+                data = json.load(f)
+            state = _HostState(str(data["user_agent"]), [_cookie_from_dict(cookie) for cookie in data["cookies"]])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.getLogger().warning("Unable to load the scraper cookies of '%s': %s", host, str(e))
+
+        return state
+
+    def _save_state(self, host: str, state: _HostState):
+        if self.cookies_dir == "":
+            return
+        try:
+            os.makedirs(self.cookies_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cookies_dir, prefix=".tmp-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"user_agent": state.user_agent,
+                           "cookies": [_cookie_to_dict(cookie) for cookie in state.get_valid_cookies()]}, f)
+            os.replace(tmp_path, self._get_state_path(host))
+        except (OSError, TypeError, ValueError) as e:
+            logging.getLogger().warning("Unable to save the scraper cookies of '%s': %s", host, str(e))
+
+
+def _get_key(cookie: Cookie) -> str:
+    return "%s %s %s" % (cookie.domain, cookie.path, cookie.name)
+
+
+def _get_values(cookies: List[Cookie]) -> Dict[str, Optional[str]]:
+    return {_get_key(cookie): cookie.value for cookie in cookies}
+
+
+def _cookie_to_dict(cookie: Cookie) -> Dict[str, Any]:
+    return {"version": cookie.version, "name": cookie.name, "value": cookie.value, "port": cookie.port,
+            "domain": cookie.domain, "path": cookie.path, "secure": cookie.secure, "expires": cookie.expires,
+            "discard": cookie.discard, "rest": getattr(cookie, "_rest", {})}
+
+
+def _cookie_from_dict(data: Dict[str, Any]) -> Cookie:
+    domain, path, port = str(data["domain"]), str(data["path"]), data.get("port")
+    return Cookie(version=data.get("version"), name=str(data["name"]), value=data.get("value"), port=port,
+                  port_specified=port is not None, domain=domain, domain_specified=domain != "",
+                  domain_initial_dot=domain.startswith("."), path=path, path_specified=path != "",
+                  secure=bool(data.get("secure")), expires=data.get("expires"), discard=bool(data.get("discard")),
+                  comment=None, comment_url=None, rest=dict(data.get("rest") or {}))
+
+
+def _get_mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
@@ -0,0 +1,181 @@
+"""Coalescing of identical concurrent computations (single flight).
+
+While a computation is in flight for a key, the other callers with the same key wait for it and share its
+result (or its exception) instead of computing it again, ie: every reader polling a feed when its cache expires.
+SingleFlight coalesces the threads of a process. FileLockSingleFlight also coalesces the processes (uWSGI
+workers) sharing a directory: the first process computing a key holds a lock file, the other ones wait for
+the lock and read the result it has written. Results must be picklable.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from utils.metrics import Metrics
+
+try:
+    import fcntl
+except ImportError:  # not available on windows: processes are not coalesced
+    fcntl = None  # type: ignore
+
+DEFAULT_MAX_WAIT_S = 60.0
+LOCK_POLL_INTERVAL_S = 0.05
+
+T = TypeVar("T")
+
+
+class _Call:
+    """One in flight computation"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers: int = 0
+
+
+class SingleFlight:
+    """Coalesces identical concurrent computations of the threads of the process"""
+
+    def __init__(self, name: str, max_wait_s: float = DEFAULT_MAX_WAIT_S) -> None:
+        self.name: str = name
+        self.max_wait_s: float = max_wait_s
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, func: Callable[[], T]) -> T:
+        """Returns func() or the result of the identical computation in flight.
+        Followers waiting longer than max_wait_s compute the result by themselves.
+
+        Raises:
+            Exception: the exception raised by func, for the leader and its followers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if leader:
+            try:
+                call.result = self._compute(key, func)
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.max_wait_s):
+            Metrics.instance().increment("singleflight.calls", group=self.name, outcome="timeout")
+            return func()
+        Metrics.instance().increment("singleflight.calls", group=self.name, outcome="shared")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _compute(self, key: str, func: Callable[[], T]) -> T:
+        Metrics.instance().increment("singleflight.calls", group=self.name, outcome="computed")
+        return func()
+
+    def get_in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class FileLockSingleFlight(SingleFlight):
+    """Coalesces identical concurrent computations of the threads and of the processes sharing the directory.
+
+    The leader process writes its result next to the lock file, processes waiting for the lock read it if it has
+    been written after they started waiting. When the leader failed, they compute the result by themselves.
+    """
+
+    def __init__(self, name: str, directory: str, max_wait_s: float = DEFAULT_MAX_WAIT_S) -> None:
+        super().__init__(name, max_wait_s)
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _compute(self, key: str, func: Callable[[], T]) -> T:
+        if fcntl is None:
+            return super()._compute(key, func)
+
+        path = os.path.join(self.directory, "%s-%s" % (self.name, hashlib.sha1(key.encode("utf-8")).hexdigest()))
+        started = time.time()
+        with open(path + ".lock", "a") as lock_file:
+            if not self._lock_file(lock_file, blocking=False):
+                # another process computes it, wait for its result
+                locked = self._lock_file(lock_file, blocking=True)
+                found, result = self._read_result(path, started)
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                if found:
+                    Metrics.instance().increment("singleflight.calls", group=self.name, outcome="shared_process")
+                    return result
+                return super()._compute(key, func)
+
+            try:
+                result = super()._compute(key, func)
+                self._write_result(path, result)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return result
+
+    def _lock_file(self, lock_file, blocking: bool) -> bool:
+        deadline = time.time() + self.max_wait_s
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if not blocking or time.time() > deadline:
+                    return False
+                time.sleep(LOCK_POLL_INTERVAL_S)
+
+    def _read_result(self, path: str, since: float):
+        found, result = False, None
+        try:
+            if os.path.getmtime(path) >= since:
+                with open(path, "rb") as f:
+                    result = pickle.load(f)
+                found = True
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+
+        return found, result
+
+    def _write_result(self, path: str, result: Any):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PickleError, TypeError) as e:
+            logging.getLogger().warning("Unable to share the result of '%s' with other processes: %s",
+                                        self.name, str(e))
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str, cross_process_dir: str = "", max_wait_s: float = DEFAULT_MAX_WAIT_S) -> SingleFlight:
+    """Returns the single flight group of the given name, created at first call.
+    Processes are also coalesced when a directory is given."""
+    with _groups_lock:
+        if name not in _groups:
+            if cross_process_dir != "":
+                _groups[name] = FileLockSingleFlight(name, cross_process_dir, max_wait_s)
+            else:
+                _groups[name] = SingleFlight(name, max_wait_s)
+
+        return _groups[name]
@@ -0,0 +1,111 @@
+"""Repair of badly decoded texts (mojibake, ie: "Ã©tÃ©" instead of "été") with ftfy.
+
+ftfy.fix_text is one of the slowest steps of a request when it runs on whole pages, while most pages need no
+fixing at all. In selective mode (the default), a regular expression first looks for the characters a UTF-8 text
+decoded as latin-1 or cp1252 is made of: nothing is done when there are none. Otherwise only the texts and
+attribute values of the parsed document having such characters are fixed, markup is never given to ftfy, and only
+encoding fixes are applied (the other fixes of ftfy, like uncurling quotes, would change texts which are not
+broken).
+
+The mode is configured by text_repair.mode, overridden per handler by text_repair.mode.<handler>:
+ - selective: see above
+ - full: ftfy.fix_text with its default fixes on the whole text (or on every text of a document)
+ - off: no repair
+"""
+
+import re
+from typing import Optional, Tuple
+
+from ftfy import fix_text
+from lxml import etree
+
+from config.config import TEXT_REPAIR_MODE_KEY, Config
+from utils.dom_utils import xpath
+from utils.metrics import Metrics
+
+SELECTIVE = "selective"
+FULL = "full"
+OFF = "off"
+MODES = [SELECTIVE, FULL, OFF]
+
+# a UTF-8 continuation byte decoded as latin-1 or cp1252, with and without the no-break space (0xA0)
+_CP1252_CONTINUATION = "ŒœŠšŸŽžƒˆ˜–—‘-‚“-„†-•…‰‹›€™"
+_CONTINUATION = "\u0080-¿" + _CP1252_CONTINUATION
+_CONTINUATION_NO_NBSP = "\u0080-\u009f¡-¿" + _CP1252_CONTINUATION
+
+# a UTF-8 lead byte followed by as many continuation bytes as the sequence needs, all decoded as latin-1 or cp1252.
+# A no-break space (0xA0) often follows an accented letter in french texts ("café\xa0!", "à\xa0Paris"): it only
+# counts as the continuation of "Â" (no-break space) and "Ã" (à) for 2 bytes sequences, the leads of longer
+# sequences ("é", "à"...) must be followed by their other continuation bytes
+MOJIBAKE_PATTERN = re.compile(
+    "[ÂÃ][%(c)s]|[Ä-ß][%(n)s]|[à-ï][%(c)s]{2}|[ð-ô][%(c)s]{3}" % {"c": _CONTINUATION, "n": _CONTINUATION_NO_NBSP})
+
+# entities are already decoded by the parser: texts of a document are not unescaped again
+ENCODING_FIXES = {
+    "unescape_html": False,
+    "uncurl_quotes": False,
+    "fix_latin_ligatures": False,
+    "fix_character_width": False,
+    "fix_line_breaks": False,
+    "remove_terminal_escapes": False
+}
+
+
+def get_mode(handler_name: str) -> str:
+    """Repair mode of the handler (see module documentation)"""
+    config = Config.instance()
+    mode = config.get_property("%s.%s" % (TEXT_REPAIR_MODE_KEY, handler_name),
+                               config.get_property(TEXT_REPAIR_MODE_KEY, SELECTIVE))
+    return mode if mode in MODES else SELECTIVE
+
+
+def is_mojibake_likely(text: Optional[str]) -> bool:
+    return text is not None and not text.isascii() and MOJIBAKE_PATTERN.search(text) is not None
+
+
+def repair_text(text: str, mode: str = SELECTIVE) -> str:
+    """Repaired text, the text may be markup"""
+    if mode == FULL:
+        text = fix_text(text)
+    elif mode == SELECTIVE and is_mojibake_likely(text):
+        text = fix_text(text, **ENCODING_FIXES)
+
+    return text
+
+
+def repair_dom(dom: etree._Element, mode: str = SELECTIVE) -> int:
+    """Repair the texts and attribute values of the dom, returns the number of values changed"""
+    repaired = 0
+    if dom is not None and mode != OFF:
+        if mode == FULL or _is_dom_mojibake_likely(dom):
+            for element in dom.iter():
+                if isinstance(element.tag, str):  # not a comment, processing instruction or entity
+                    if element.text:
+                        element.text, changed = _repair_value(element.text, mode)
+                        repaired += changed
+                    for name, value in element.attrib.items():
+                        element.attrib[name], changed = _repair_value(value, mode)
+                        repaired += changed
+                if element.tail:
+                    element.tail, changed = _repair_value(element.tail, mode)
+                    repaired += changed
+        Metrics.instance().increment("text_repair.documents", mode=mode,
+                                     outcome="repaired" if repaired > 0 else "clean")
+
+    return repaired
+
+
+def _repair_value(value: str, mode: str) -> Tuple[str, int]:
+    fixed = value
+    if mode == FULL:
+        fixed = fix_text(value, unescape_html=False)
+    elif is_mojibake_likely(value):
+        fixed = fix_text(value, **ENCODING_FIXES)
+
+    return fixed, 1 if fixed != value else 0
+
+
+def _is_dom_mojibake_likely(dom: etree._Element) -> bool:
+    """Texts and attribute values are gathered by libxml2, then searched at once"""
+    return is_mojibake_likely(etree.tostring(dom, method="text", encoding="unicode")) or \
+        is_mojibake_likely("".join(xpath(dom, "//@*")))